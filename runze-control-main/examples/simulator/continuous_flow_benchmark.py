@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Measure flow continuity of ping-pong continuous flow on the simulator.
+
+Two SY01B pumps with built-in valves, and two SY08 pumps sharing one rotary
+valve, each deliver a constant flow for a while. The flow leaving the outlet
+is reconstructed from the simulated plunger and valve motions and scored
+against the target flow.
+"""
+
+import logging
+from time import perf_counter
+
+import numpy as np
+
+from runze_control.continuous_flow import ContinuousFlowController, \
+    flow_continuity
+from runze_control.multichannel_syringe_pump import SY01B
+from runze_control.protocol_codes import sy01_codes, sy08_codes
+from runze_control.rotary_valve import RotaryValve
+from runze_control.simulator import SimulatedBus, \
+    SimulatedMultiChannelSyringePump, SimulatedRotaryValve, SimulatedSyringePump
+from runze_control.syringe_pump import SY08
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 115200
+DURATION_S = 12
+SAMPLE_INTERVAL_S = 0.005
+OUTLET_PORT = 1
+RESERVOIR_PORT = 2
+
+
+def outlet_flow(sim_pumps, gates, ul_per_step, start_s, end_s):
+    """Flow leaving the outlet, from each pump's plunger motion while its
+    route to the outlet is open."""
+    times_s = np.arange(start_s, end_s, SAMPLE_INTERVAL_S)
+    mid_s = times_s[:-1] + SAMPLE_INTERVAL_S / 2
+    flow = np.zeros(len(mid_s))
+    for sim_pump, gate in zip(sim_pumps, gates):
+        dispensed = -np.diff(sim_pump.plunger_positions(times_s)) * ul_per_step
+        flow += dispensed / SAMPLE_INTERVAL_S * gate(mid_s)
+    return mid_s, flow
+
+
+def benchmark(name, controller, sim_pumps, gates, flow_ul_per_s, overlap_s):
+    controller.overlap_s = overlap_s
+    start_s = perf_counter()
+    report = controller.run(flow_ul_per_s, DURATION_S)
+    end_s = perf_counter()
+    # Score only the steady part (after the first stroke started).
+    times_s, flow = outlet_flow(sim_pumps, gates,
+                                controller.stroke_ul / controller.stroke_steps,
+                                start_s + 0.1, end_s - 0.1)
+    metric = flow_continuity(times_s, flow, report.flow_ul_per_s)
+    print(f"{name} (overlap {overlap_s*1e3:.0f}[ms], {report.strokes} strokes):"
+          f" {100*metric.in_tolerance_fraction:.1f}% in tolerance, flow "
+          f"{metric.min_ratio:.2f}-{metric.max_ratio:.2f}x target, longest "
+          f"dropout {metric.longest_dropout_s*1e3:.0f}[ms].")
+    # Leave both pumps full for the next run.
+    for index in range(len(controller.pumps)):
+        controller._refill(index)
+
+
+# Two SY01B pumps with built-in valves.
+sim_bus = SimulatedBus("continuous_flow_sy01b", baudrate=BAUDRATE)
+sim_pumps = [sim_bus.add_device(SimulatedMultiChannelSyringePump(
+    address=address, codes=sy01_codes, steps_per_rev=200))
+    for address in range(2)]
+pumps = [SY01B(sim_bus.url, baudrate=BAUDRATE, address=address,
+               syringe_volume_ul=5000, position_count=6)
+         for address in range(2)]
+controller = ContinuousFlowController.with_sy01b(*pumps, OUTLET_PORT,
+                                                 RESERVOIR_PORT)
+controller.prime()
+gates = [lambda t, p=p: p.valve_ports(t) == OUTLET_PORT for p in sim_pumps]
+for overlap_s in (0, 0.005):
+    benchmark("2x SY01B", controller, sim_pumps, gates, 1000, overlap_s)
+
+# Two SY08 pumps sharing one rotary valve.
+sim_bus = SimulatedBus("continuous_flow_sy08", baudrate=BAUDRATE)
+sim_pumps = [sim_bus.add_device(SimulatedSyringePump(address=address,
+                                                     codes=sy08_codes))
+             for address in range(2)]
+sim_valve = sim_bus.add_device(SimulatedRotaryValve(address=2,
+                                                    port_switch_s=0.02))
+pumps = [SY08(sim_bus.url, baudrate=BAUDRATE, address=address,
+              syringe_volume_ul=5000) for address in range(2)]
+valve = RotaryValve(sim_bus.url, baudrate=BAUDRATE, address=2)
+controller = ContinuousFlowController.with_valve(*pumps, valve, (1, 2))
+controller.prime()
+gates = [lambda t, port=port: sim_valve.ports(t) == port for port in (1, 2)]
+benchmark("2x SY08 + valve", controller, sim_pumps, gates, 1000, 0)
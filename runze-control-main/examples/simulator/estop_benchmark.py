@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Emergency-stop 12 moving pumps spread over 3 simulated buses and report how
+long it takes until the last stop frame is on the wire."""
+
+import logging
+from time import sleep
+
+from runze_control.estop import emergency_stop
+from runze_control.protocol_codes import sy08_codes
+from runze_control.simulator import SimulatedBus, SimulatedSyringePump
+from runze_control.syringe_pump import SY08
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 9600
+BUS_COUNT = 3
+PUMPS_PER_BUS = 4
+MULTICAST_ADDRESS = 0x40
+
+pumps = []
+for bus_index in range(BUS_COUNT):
+    sim_bus = SimulatedBus(f"estop_benchmark_{bus_index}", baudrate=BAUDRATE)
+    for address in range(PUMPS_PER_BUS):
+        sim_pump = SimulatedSyringePump(address=address, codes=sy08_codes)
+        sim_pump.multicast_addresses.add(MULTICAST_ADDRESS)
+        sim_bus.add_device(sim_pump)
+        pumps.append(SY08(sim_bus.url, baudrate=BAUDRATE, address=address,
+                          syringe_volume_ul=5000))
+
+for multicast in [False, True]:
+    for pump in pumps:
+        pump.move_absolute_in_percent(90 if multicast else 50, wait=False)
+    sleep(0.5)
+    multicast_addresses = {pump.bus.com_port: MULTICAST_ADDRESS
+                           for pump in pumps} if multicast else None
+    report = emergency_stop(multicast_addresses=multicast_addresses)
+    positions = report.positions.result()  # Wait for confirmation.
+    logger.info(f"{'Multicast' if multicast else 'Per-device'} e-stop: "
+                f"{report.stop_frames_sent} frames, last frame on the wire "
+                f"after {report.last_frame_s*1e3:.1f}[ms].")
+    logger.info(f"Confirmed positions [steps]: {list(positions.values())}")
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Compare homing a fleet of pumps and valves one after another versus all at
+once."""
+
+import logging
+from time import perf_counter
+
+from runze_control.fleet import initialize
+from runze_control.protocol_codes import sy08_codes
+from runze_control.rotary_valve import RotaryValve
+from runze_control.simulator import SimulatedBus, SimulatedRotaryValve, \
+    SimulatedSyringePump
+from runze_control.syringe_pump import SY08
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 9600
+BUS_COUNT = 3
+PUMPS_PER_BUS = 4
+
+
+def build_fleet(name: str):
+    devices = []
+    for bus_index in range(BUS_COUNT):
+        sim_bus = SimulatedBus(f"{name}_{bus_index}", baudrate=BAUDRATE)
+        for address in range(PUMPS_PER_BUS):
+            sim_pump = SimulatedSyringePump(address=address, codes=sy08_codes,
+                                            speed_rpm=600)
+            # Leave the plungers partway down so homing takes a while.
+            sim_pump.plunger.end = 2000 + 1000 * address
+            sim_bus.add_device(sim_pump)
+            devices.append(SY08(sim_bus.url, baudrate=BAUDRATE,
+                                address=address, syringe_volume_ul=5000))
+        sim_bus.add_device(SimulatedRotaryValve(address=PUMPS_PER_BUS))
+        devices.append(RotaryValve(sim_bus.url, baudrate=BAUDRATE,
+                                   address=PUMPS_PER_BUS))
+    return devices
+
+
+devices = build_fleet("fleet_sequential")
+start_s = perf_counter()
+for device in devices:
+    if isinstance(device, SY08):
+        device.reset_syringe_position()
+    else:
+        device.reset_valve_position()
+print(f"Sequential: {perf_counter() - start_s:.2f}[s] for {len(devices)} "
+      "devices.")
+
+devices = build_fleet("fleet_parallel")
+report = initialize(devices)
+slowest = max(report.records, key=lambda r: r.reset_done_s - r.reset_started_s)
+print(f"Fleet init: {report.duration_s:.2f}[s] for {len(devices)} devices "
+      f"(slowest reset: "
+      f"{slowest.reset_done_s - slowest.reset_started_s:.2f}[s]). "
+      f"Failures: {len(report.failures)}.")
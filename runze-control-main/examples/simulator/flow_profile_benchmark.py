@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Compare inter-segment dead time of a multi-segment dispense profile sent
+segment-by-segment versus streamed with look-ahead.
+
+A gap is the time from one move's reply until the next move frame has fully
+arrived at the pump (i.e: when the plunger starts moving again).
+"""
+
+import logging
+from time import perf_counter
+
+from runze_control.flow_profile import stream_profile
+from runze_control.protocol_codes import sy08_codes
+from runze_control.simulator import SimulatedBus, SimulatedSyringePump
+from runze_control.syringe_pump import SY08
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATES = [9600, 115200]
+SYRINGE_VOLUME_UL = 5000
+SEGMENTS = [(speed, 25) for speed in (40, 60, 80, 100, 80, 60, 40, 60, 80, 100)]
+
+total_ul = sum(volume for _, volume in SEGMENTS)
+for baudrate in BAUDRATES:
+    sim_bus = SimulatedBus(f"profile_benchmark_{baudrate}", baudrate=baudrate)
+    sim_bus.add_device(SimulatedSyringePump(address=0, codes=sy08_codes))
+    pump = SY08(sim_bus.url, baudrate=baudrate, address=0,
+                syringe_volume_ul=SYRINGE_VOLUME_UL)
+    pump.reset_syringe_position()
+    print(f"{baudrate}[bps]:")
+
+    # Segment-by-segment: each command waits for its reply before the next
+    # one is encoded.
+    pump.aspirate(total_ul)
+    gaps_s = []
+    last_done_s = None
+    for speed_percent, volume_ul in SEGMENTS:
+        pump.set_speed_percent(speed_percent)
+        pump.dispense(volume_ul, wait=False)
+        if last_done_s is not None:
+            gaps_s.append(perf_counter() - last_done_s)
+        pump.wait_for_reply()
+        last_done_s = perf_counter()
+    print(f"  Segment-by-segment: mean gap {1e3*sum(gaps_s)/len(gaps_s):.2f}"
+          f"[ms], max gap {1e3*max(gaps_s):.2f}[ms].")
+
+    # Streamed.
+    pump.aspirate(total_ul)
+    report = stream_profile(pump, SEGMENTS)
+    print(f"  Streamed:           mean gap {1e3*report.gaps_s.mean():.2f}[ms], "
+          f"max gap {1e3*report.gaps_s.max():.2f}[ms].")
+    errors_s = report.prediction_errors_s
+    print(f"  Completion prediction error: mean {1e3*errors_s.mean():.2f}[ms], "
+          f"max {1e3*abs(errors_s).max():.2f}[ms].")
+    print(f"  Final position: {pump.get_position_steps()}[steps] "
+          f"(tracked: {pump.driver_steps}[steps]).")
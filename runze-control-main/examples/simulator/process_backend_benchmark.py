@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Poll pumps on many simulated buses from threads in one process versus from
+one worker process per bus, and compare reading a position over IPC against
+reading it from the shared status table."""
+
+import logging
+import os
+import threading
+from time import perf_counter
+
+import numpy as np
+
+from runze_control.process_backend import ProcessBackend
+from runze_control.protocol_codes import sy08_codes
+from runze_control.rig import Rig
+from runze_control.simulator import SimulatedBus, SimulatedSyringePump
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 115200
+BUS_COUNT = 16
+PUMPS_PER_BUS = 2
+DURATION_S = 3.0
+
+
+def build_buses():
+    for index in range(BUS_COUNT):
+        sim_bus = SimulatedBus(f"process_rig_{index}", baudrate=BAUDRATE)
+        for address in range(PUMPS_PER_BUS):
+            sim_bus.add_device(SimulatedSyringePump(address=address,
+                                                    codes=sy08_codes))
+
+
+CONFIG = {"devices": {
+    f"pump_{index}_{address}": {"model": "SY08", "baudrate": BAUDRATE,
+                                "port": f"sim://process_rig_{index}",
+                                "address": address, "syringe_volume_ul": 5000}
+    for index in range(BUS_COUNT) for address in range(PUMPS_PER_BUS)}}
+
+
+def poll_throughput(devices: list):
+    """Query positions from one thread per device. Return queries/s."""
+    counts = [0] * len(devices)
+    end_s = perf_counter() + DURATION_S
+
+    def poll(index: int, device):
+        while perf_counter() < end_s:
+            device.get_position_steps()
+            counts[index] += 1
+
+    threads = [threading.Thread(target=poll, args=(i, d))
+               for i, d in enumerate(devices)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / DURATION_S
+
+
+if __name__ == "__main__":
+    print(f"{os.cpu_count()} CPU(s), {BUS_COUNT} buses, "
+          f"{BUS_COUNT * PUMPS_PER_BUS} pumps.")
+    build_buses()
+    rig = Rig(CONFIG)
+    threaded_qps = poll_throughput(list(rig.devices.values()))
+    rig.close()
+    print(f"One process: {threaded_qps:.0f} queries/s.")
+
+    with ProcessBackend(CONFIG, initializer=build_buses,
+                        telemetry_rate_hz=1.0) as backend:
+        process_qps = poll_throughput(list(backend.devices.values()))
+        print(f"Process per bus: {process_qps:.0f} queries/s.")
+        pump = backend["pump_0_0"]
+        ipc_s = []
+        for _ in range(200):
+            start_s = perf_counter()
+            pump.get_position_steps()
+            ipc_s.append(perf_counter() - start_s)
+        table_s = []
+        for _ in range(200):
+            start_s = perf_counter()
+            pump.status()
+            table_s.append(perf_counter() - start_s)
+        print(f"Position via worker query: median "
+              f"{np.median(ipc_s)*1e6:.0f}[us]; via status table: median "
+              f"{np.median(table_s)*1e6:.1f}[us].")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Compare dosing with many syringe pumps one after another (a loop over the
+pumps) versus all at once with a PumpArray."""
+
+import logging
+from time import perf_counter
+
+import numpy as np
+
+from runze_control.protocol_codes import sy08_codes
+from runze_control.pump_array import PumpArray
+from runze_control.simulator import SimulatedBus, SimulatedSyringePump
+from runze_control.syringe_pump import SY08
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 115200
+BUS_COUNT = 4
+PUMPS_PER_BUS = 4
+DOSE_UL = 100  # 240[steps] each, 60[ms] at full speed.
+DOSES = 5
+
+
+def build(name: str):
+    pumps = []
+    for index in range(BUS_COUNT):
+        sim_bus = SimulatedBus(f"{name}_{index}", baudrate=BAUDRATE)
+        for address in range(PUMPS_PER_BUS):
+            sim_bus.add_device(SimulatedSyringePump(address=address,
+                                                    codes=sy08_codes))
+            pumps.append(SY08(sim_bus.url, address=address,
+                              syringe_volume_ul=5000))
+    return pumps
+
+
+pumps = build("loop")
+for pump in pumps:
+    pump.set_speed_percent(100)
+start_s = perf_counter()
+for _ in range(DOSES):
+    for pump in pumps:
+        pump.aspirate(DOSE_UL)
+print(f"Loop: {DOSES} doses on {len(pumps)} pumps in "
+      f"{perf_counter() - start_s:.2f}[s].")
+
+array = PumpArray(build("array"))
+array.set_speed_percent(100).raise_errors()
+start_s = perf_counter()
+for _ in range(DOSES):
+    array.aspirate(DOSE_UL).raise_errors()
+print(f"PumpArray: {DOSES} doses on {len(array)} pumps in "
+      f"{perf_counter() - start_s:.2f}[s].")
+
+# Different volumes per channel, started together, then a barrier.
+array.dispense(np.linspace(50, 400, len(array)), wait=False)
+array.wait().raise_errors()
+print(f"Per-channel dispense: positions {array.positions_steps} [steps].")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Run a pipetting loop on a bus that loses or corrupts some replies, without
+retries (the run aborts at the first bad reply) and with them (the run
+completes with the plunger where it should be)."""
+
+import logging
+from time import perf_counter
+
+from serial import SerialException
+
+from runze_control.protocol_codes import sy08_codes
+from runze_control.rotary_valve import RotaryValve
+from runze_control.simulator import SimulatedBus, SimulatedRotaryValve, \
+    SimulatedSyringePump
+from runze_control.syringe_pump import SY08
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.ERROR)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 115200
+REPLY_LOSS = 0.02
+REPLY_CORRUPTION = 0.02
+CYCLES = 100
+SEED = 7  # Same losses and corruptions on every run.
+# Moves reply once they finish, so a lost move reply is only noticed after
+# the long timeout. Simulated moves here take well under a second.
+SY08.LONG_TIMEOUT_S = 2.0
+RotaryValve.LONG_TIMEOUT_S = 2.0
+
+
+def run(name: str, max_retries: int):
+    sim_bus = SimulatedBus(name, baudrate=BAUDRATE, seed=SEED)
+    sim_bus.add_device(SimulatedSyringePump(address=0, codes=sy08_codes))
+    sim_bus.add_device(SimulatedRotaryValve(address=1))
+    pump = SY08(sim_bus.url, address=0, syringe_volume_ul=5000)
+    valve = RotaryValve(sim_bus.url, address=1)
+    pump.set_speed_percent(100)
+    pump.max_retries = valve.max_retries = max_retries
+    sim_bus.reply_loss = REPLY_LOSS
+    sim_bus.reply_corruption = REPLY_CORRUPTION
+    expected_steps = 0
+    cycle = 0
+    start_s = perf_counter()
+    try:
+        for cycle in range(CYCLES):
+            valve.move_to_port(1 + cycle % 2)
+            pump.aspirate_steps(40)  # Relative move.
+            expected_steps += 40
+            pump.get_position_steps()
+            valve.move_to_port(3)
+            pump.dispense_steps(30)
+            expected_steps -= 30
+            pump.get_motor_status()
+        cycle = CYCLES
+    except (SerialException, RuntimeError) as e:
+        print(f"  Aborted in cycle {cycle}: {e}")
+        pump.cmd_send_time_s = valve.cmd_send_time_s = None  # Forget it.
+    elapsed_s = perf_counter() - start_s
+    sim_bus.reply_loss = sim_bus.reply_corruption = 0
+    device_steps = pump.get_position_steps()
+    print(f"  {cycle}/{CYCLES} cycles in {elapsed_s:.2f}[s]. Plunger at "
+          f"{device_steps}[steps] (driver: {pump.driver_steps}, expected: "
+          f"{expected_steps}).")
+    stats = pump.bus.retry_stats()
+    print(f"  Resends: {stats['resends']}, reconciled relative moves: "
+          f"{stats['reconciled']}, failures: {stats['failures']}.")
+    if stats['recovered']:
+        print(f"  Added latency per recovered command: mean "
+              f"{stats['mean_added_s']*1e3:.1f}[ms], max "
+              f"{stats['max_added_s']*1e3:.1f}[ms].")
+
+
+print("Without retries:")
+run("lossy_no_retries", max_retries=0)
+print("With retries:")
+run("lossy_retries", max_retries=SY08.MAX_RETRIES)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Compare connecting to every device of an instrument one at a time (probing
+baud rates) versus loading a rig file, with and without a discovery cache."""
+
+import json
+import logging
+import os
+import tempfile
+from time import perf_counter
+
+from runze_control.multichannel_syringe_pump import SY01B
+from runze_control.protocol_codes import sy08_codes
+from runze_control.rig import Rig
+from runze_control.rotary_valve import RotaryValve
+from runze_control.simulator import SimulatedBus, SimulatedRotaryValve, \
+    SimulatedMultiChannelSyringePump, SimulatedSyringePump
+from runze_control.syringe_pump import SY08
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 115200  # Found last when probing.
+BUS_COUNT = 3
+
+
+def build_instrument(name: str):
+    """Simulate 3 buses, each with two SY08s, one SY01B, and one valve.
+    Return the rig file contents."""
+    devices = {}
+    for index in range(BUS_COUNT):
+        sim_bus = SimulatedBus(f"{name}_{index}", baudrate=BAUDRATE)
+        for address in range(2):
+            sim_bus.add_device(SimulatedSyringePump(address=address,
+                                                    codes=sy08_codes))
+            devices[f"pump_{index}_{address}"] = \
+                {"model": "SY08", "port": sim_bus.url, "address": address,
+                 "syringe_volume_ul": 5000}
+        sim_bus.add_device(SimulatedMultiChannelSyringePump(address=2))
+        devices[f"sy01b_{index}"] = \
+            {"model": "SY01B", "port": sim_bus.url, "address": 2,
+             "syringe_volume_ul": 5000, "position_count": 6}
+        sim_bus.add_device(SimulatedRotaryValve(address=3))
+        devices[f"valve_{index}"] = \
+            {"model": "RotaryValve", "port": sim_bus.url, "address": 3,
+             "position_map": {"waste": 1, "reagent": 3}}
+    return {"devices": devices}
+
+
+# By hand, one device at a time.
+config = build_instrument("rig_by_hand")
+classes = {"SY08": SY08, "SY01B": SY01B, "RotaryValve": RotaryValve}
+start_s = perf_counter()
+for settings in config["devices"].values():
+    kwargs = {k: v for k, v in settings.items() if k not in ("model", "port")}
+    classes[settings["model"]](settings["port"], **kwargs)
+print(f"One at a time: {perf_counter() - start_s:.2f}[s] for "
+      f"{len(config['devices'])} devices.")
+
+with tempfile.TemporaryDirectory() as folder:
+    rig_path = os.path.join(folder, "rig.json")
+    cache_path = os.path.join(folder, "discovery_cache.json")
+    with open(rig_path, 'w') as f:
+        json.dump(build_instrument("rig_cold"), f)
+    rig = Rig.from_file(rig_path, cache_path=cache_path)
+    print(f"Rig file (cold): {rig.connect_s:.2f}[s].")
+    rig.close()
+    rig = Rig.from_file(rig_path, cache_path=cache_path)
+    print(f"Rig file (cached): {rig.connect_s:.2f}[s].")
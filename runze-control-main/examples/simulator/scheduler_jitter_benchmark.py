@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Compare the timing of periodic dispenses on several pumps issued from a
+sleep-based loop versus the time-triggered command scheduler. Send times are
+read from the simulated wire."""
+
+import logging
+from time import perf_counter, sleep
+
+import numpy as np
+
+from runze_control.protocol_codes import sy08_codes
+from runze_control.runze_protocol import COMMON_CMD_NUM_BYTES
+from runze_control.scheduler import CommandScheduler
+from runze_control.simulator import SimulatedBus, SimulatedSyringePump
+from runze_control.syringe_pump import SY08
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 9600
+PUMP_COUNT = 4  # One pump per bus.
+PERIOD_S = 0.25
+DISPENSES = 40
+VOLUME_UL = 10
+TOLERANCE_S = 0.002
+
+
+def build_pumps(name: str):
+    buses, pumps = [], []
+    for index in range(PUMP_COUNT):
+        sim_bus = SimulatedBus(f"{name}_{index}", baudrate=BAUDRATE)
+        sim_pump = sim_bus.add_device(
+            SimulatedSyringePump(address=0, codes=sy08_codes, speed_rpm=600))
+        sim_pump.plunger.end = sim_pump.max_position_steps
+        pump = SY08(sim_bus.url, baudrate=BAUDRATE, address=0,
+                    syringe_volume_ul=5000)
+        pump.driver_steps = sim_pump.max_position_steps
+        buses.append(sim_bus)
+        pumps.append(pump)
+    return buses, pumps
+
+
+def wire_errors_s(buses: list, deadlines_s: list):
+    """Start time of each dispense frame on the wire minus its deadline."""
+    frame_s = COMMON_CMD_NUM_BYTES * 10 / BAUDRATE
+    errors = []
+    for sim_bus in buses:
+        starts_s = [end_s - frame_s for end_s, frame in sim_bus.wire_log
+                    if frame[2] == sy08_codes.CommonCmd.RunInCW]
+        errors += [s - d for s, d in zip(starts_s, deadlines_s)]
+    return np.array(errors)
+
+
+def report(name: str, errors_s: np.ndarray):
+    print(f"{name}: mean {errors_s.mean()*1e3:+.3f}[ms], std "
+          f"{errors_s.std()*1e3:.3f}[ms], max |error| "
+          f"{np.abs(errors_s).max()*1e3:.3f}[ms], outside +/-"
+          f"{TOLERANCE_S*1e3:.0f}[ms]: "
+          f"{(np.abs(errors_s) > TOLERANCE_S).sum()}/{len(errors_s)}.")
+
+
+# Sleep-based loop.
+buses, pumps = build_pumps("jitter_sleep")
+start_s = perf_counter() + 0.5
+deadlines_s = [start_s + i * PERIOD_S for i in range(DISPENSES)]
+for deadline_s in deadlines_s:
+    for pump in pumps:
+        if pump.cmd_send_time_s is not None:
+            pump.wait_for_reply()
+    sleep(max(deadline_s - perf_counter(), 0))
+    for pump in pumps:
+        pump.dispense(VOLUME_UL, wait=False)
+for pump in pumps:
+    pump.wait_for_reply()
+report("Sleep loop", wire_errors_s(buses, deadlines_s))
+
+# Time-triggered scheduler.
+buses, pumps = build_pumps("jitter_scheduler")
+start_s = perf_counter() + 0.5
+deadlines_s = [start_s + i * PERIOD_S for i in range(DISPENSES)]
+with CommandScheduler() as scheduler:
+    for deadline_s in deadlines_s:
+        for pump in pumps:
+            scheduler.schedule_dispense(pump, VOLUME_UL, deadline_s)
+    scheduler.join()
+report("Scheduler", wire_errors_s(buses, deadlines_s))
+stats = scheduler.jitter_stats(tolerance_s=TOLERANCE_S)
+print(f"Scheduler (host side): std {stats['std_s']*1e3:.3f}[ms], max "
+      f"{stats['max_s']*1e3:.3f}[ms], failed: {stats['failed']}.")
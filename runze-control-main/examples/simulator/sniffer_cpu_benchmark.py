@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Feed a saturated 115200[bps] stream of command/reply traffic to a
+byte-at-a-time logging reader and to the bus sniffer, and compare the CPU
+time each spends keeping up."""
+
+import logging
+import os
+import struct
+import threading
+from time import perf_counter, sleep, thread_time
+
+from serial import serial_for_url
+
+from runze_control.protocol_codes import sy08_codes
+from runze_control.sniffer import BusSniffer
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 115200
+DURATION_S = 3.0
+PUMP_COUNT = 4
+
+
+def encode(address: int, code: int, parameter: int):
+    frame = struct.pack("<BBBHB", 0xCC, address, code, parameter, 0xDD)
+    return frame + (sum(frame) & 0xFFFF).to_bytes(2, 'little')
+
+
+# Poll every pump's position and get a reply, over and over.
+traffic = b"".join(
+    encode(address, sy08_codes.CommonCmd.GetSyringePosition, 0)
+    + encode(address, 0x00, 1000 + address) for address in range(PUMP_COUNT))
+
+
+def feed(ser, stop: threading.Event):
+    """Write traffic at line rate."""
+    bytes_per_s = BAUDRATE / 10
+    start_s = perf_counter()
+    sent = 0
+    while not stop.is_set():
+        due = int((perf_counter() - start_s) * bytes_per_s) - sent
+        for _ in range(due // len(traffic)):
+            ser.write(traffic)
+            sent += len(traffic)
+        sleep(0.001)
+
+
+def measure(reader, ser):
+    """Return the reader thread's CPU time as a fraction of wall time."""
+    stop = threading.Event()
+    result = {}
+
+    def run():
+        start_s = thread_time()
+        reader(stop)
+        result['cpu_s'] = thread_time() - start_s
+
+    threads = [threading.Thread(target=run),
+               threading.Thread(target=feed, args=(ser, stop))]
+    for thread in threads:
+        thread.start()
+    sleep(DURATION_S)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return result['cpu_s'] / DURATION_S
+
+
+# Byte-at-a-time reader that logs every byte (the old example).
+byte_logger = logging.getLogger("bytes")
+byte_logger.propagate = False
+byte_logger.setLevel(logging.DEBUG)
+byte_logger.addHandler(logging.StreamHandler(open(os.devnull, 'w')))
+ser = serial_for_url("loop://", BAUDRATE, timeout=0.05)
+
+
+def read_bytes(stop):
+    while not stop.is_set():
+        reply = ser.read(1)
+        if len(reply):
+            byte_logger.debug(f"Reply (hex): {reply.hex(' ')}")
+
+
+bytewise_cpu = measure(read_bytes, ser)
+ser.close()
+
+sniffer = BusSniffer("loop://", BAUDRATE, models={a: "SY08"
+                                                  for a in range(PUMP_COUNT)})
+
+
+def sniff(stop):
+    watcher = threading.Thread(target=lambda: (stop.wait(), sniffer.stop()))
+    watcher.start()
+    sniffer.run()
+    watcher.join()
+
+
+sniffer_cpu = measure(sniff, sniffer.ser)
+print(f"CPU at {BAUDRATE}[bps] line rate: byte-at-a-time logging reader "
+      f"{bytewise_cpu*100:.1f}%, sniffer {sniffer_cpu*100:.1f}%.")
+print(sniffer.summary())
+sniffer.close()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Run a pipetting loop while the pump and valve occasionally stall, without
+a recovery engine (the run stops at the first stall) and with one (the run
+completes, re-homing and resuming after each stall)."""
+
+import logging
+import os
+import tempfile
+from time import perf_counter
+
+import numpy as np
+
+from runze_control.protocol_codes import sy08_codes
+from runze_control.recovery import RecoveryEngine
+from runze_control.rotary_valve import RotaryValve
+from runze_control.runze_protocol import ReplyStatus
+from runze_control.simulator import SimulatedBus, SimulatedRotaryValve, \
+    SimulatedSyringePump
+from runze_control.syringe_pump import SY08
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.ERROR)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 115200
+CYCLES = 40
+FAULT_CYCLES = (5, 17, 30)  # Cycles in which a move faults.
+FAULTS = (ReplyStatus.MotorStalled, ReplyStatus.UnknownLocations,
+          ReplyStatus.OptocouplerError)
+
+
+def run(name: str, recover: bool):
+    sim_bus = SimulatedBus(name, baudrate=BAUDRATE)
+    sim_pump = SimulatedSyringePump(address=0, codes=sy08_codes,
+                                    speed_rpm=600)
+    sim_valve = SimulatedRotaryValve(address=1)
+    sim_bus.add_device(sim_pump)
+    sim_bus.add_device(sim_valve)
+    pump = SY08(sim_bus.url, address=0, syringe_volume_ul=5000)
+    valve = RotaryValve(sim_bus.url, address=1)
+    pump.set_speed_percent(100)
+    folder = tempfile.mkdtemp()
+    engine = None
+    if recover:
+        engine = RecoveryEngine(audit_path=os.path.join(folder, "audit.jsonl"))
+        engine.attach(pump)
+        engine.attach(valve)
+    rng = np.random.default_rng(0)
+    expected_steps = 0
+    cycle = 0
+    start_s = perf_counter()
+    try:
+        for cycle in range(CYCLES):
+            if cycle in FAULT_CYCLES:
+                fault = FAULTS[FAULT_CYCLES.index(cycle)]
+                (sim_pump if rng.random() < 0.5 else sim_valve).inject_fault(
+                    fault)
+            valve.move_to_port(1 + cycle % 3)
+            pump.aspirate_steps(300)
+            expected_steps += 300
+            valve.move_to_port(5)
+            pump.dispense_steps(250)
+            expected_steps -= 250
+        cycle = CYCLES
+    except RuntimeError as e:
+        print(f"  Stopped in cycle {cycle}: {e}")
+    elapsed_s = perf_counter() - start_s
+    print(f"  {cycle}/{CYCLES} cycles in {elapsed_s:.2f}[s]. Plunger at "
+          f"{pump.get_position_steps()}[steps] (expected: {expected_steps}). "
+          f"Pump speed: {sim_pump.speed_rpm}[rpm].")
+    if engine is not None:
+        engine.close()
+        recovered = [r for r in engine.records if r['outcome'] == 'recovered']
+        print(f"  Recovered from {len(recovered)} fault(s) in "
+              f"{sum(r['duration_s'] for r in recovered):.2f}[s] total:")
+        for record in recovered:
+            print(f"    {record['device']} {record['command']}: "
+                  f"{record['fault']} ({record['duration_s']:.2f}[s]).")
+
+
+print("Without recovery:")
+run("stalls_by_hand", recover=False)
+print("With a recovery engine:")
+run("stalls_recovered", recover=True)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Compare reading the status of every device with one blocking call per
+value versus pipelined snapshots."""
+
+import logging
+from time import perf_counter
+
+from runze_control.protocol_codes import mini_sy04_codes, sy08_codes
+from runze_control.rotary_valve import RotaryValve
+from runze_control.simulator import SimulatedBus, SimulatedRotaryValve, \
+    SimulatedSyringePump
+from runze_control.status import snapshot
+from runze_control.syringe_pump import SY08, MiniSY04
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 9600
+BUS_COUNT = 2
+ROUNDS = 5
+
+devices = []
+for index in range(BUS_COUNT):
+    sim_bus = SimulatedBus(f"status_{index}", baudrate=BAUDRATE)
+    sim_bus.add_device(SimulatedSyringePump(address=0, codes=sy08_codes))
+    sim_bus.add_device(SimulatedSyringePump(address=1, codes=mini_sy04_codes))
+    sim_bus.add_device(SimulatedRotaryValve(address=2))
+    devices += [SY08(sim_bus.url, address=0, syringe_volume_ul=5000),
+                MiniSY04(sim_bus.url, address=1, syringe_volume_ul=5000),
+                RotaryValve(sim_bus.url, address=2)]
+
+
+def read_by_hand(device):
+    status = [device.get_address(), device.get_rs232_baudrate(),
+              device.get_rs485_baudrate(), device.get_firmware_version(),
+              device.get_motor_status()]
+    if isinstance(device, RotaryValve):
+        status.append(device.get_Port_position())
+    else:
+        status.append(device.get_position_steps())
+    return status
+
+
+start_s = perf_counter()
+for _ in range(ROUNDS):
+    for device in devices:
+        read_by_hand(device)
+by_hand_s = (perf_counter() - start_s) / ROUNDS
+print(f"One call per value: {by_hand_s*1e3:.1f}[ms] for {len(devices)} "
+      f"devices.")
+
+start_s = perf_counter()
+for _ in range(ROUNDS):
+    for device in devices:
+        device.snapshot()
+snapshot_s = (perf_counter() - start_s) / ROUNDS
+print(f"device.snapshot(): {snapshot_s*1e3:.1f}[ms] "
+      f"({by_hand_s / snapshot_s:.1f}x faster).")
+
+start_s = perf_counter()
+for _ in range(ROUNDS):
+    statuses = snapshot(devices)
+all_s = (perf_counter() - start_s) / ROUNDS
+print(f"snapshot(devices) (one write per bus): {all_s*1e3:.1f}[ms] "
+      f"({by_hand_s / all_s:.1f}x faster).")
+for status in statuses.values():
+    print(f"  {status.model} @ {status.address}: firmware "
+          f"{status.firmware_version}, {status.motor_status.name}, "
+          f"position {status.position_steps}, port {status.port_position}, "
+          f"{status.latency_s*1e3:.1f}[ms].")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Measure stop request-to-wire latency on a simulated bus under heavy load.
+
+Several pumps share one 9600[bps] bus. A telemetry poller saturates it with
+status polls while another thread hammers it with control queries, and one
+pump keeps moving. We repeatedly force-stop the moving pump and compare the
+measured latency against the bus's one-frame guarantee.
+"""
+
+import logging
+import random
+import threading
+from time import sleep
+
+from runze_control.protocol_codes import sy08_codes
+from runze_control.simulator import SimulatedBus, SimulatedSyringePump
+from runze_control.syringe_pump import SY08
+from runze_control.telemetry import TelemetryPoller
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 9600
+PUMP_COUNT = 4
+STOP_COUNT = 30
+OS_SLACK_S = 0.002  # Allowance for thread wake-up on top of the wire bound.
+
+sim_bus = SimulatedBus("stop_benchmark", baudrate=BAUDRATE)
+for address in range(PUMP_COUNT):
+    sim_bus.add_device(SimulatedSyringePump(address=address, codes=sy08_codes))
+pumps = [SY08(sim_bus.url, baudrate=BAUDRATE, address=address,
+              syringe_volume_ul=5000) for address in range(PUMP_COUNT)]
+mover, others = pumps[0], pumps[1:]
+
+keep_going = True
+
+
+def query_load():
+    while keep_going:
+        for pump in others:
+            pump.get_position_steps()
+
+
+def move_load():
+    while keep_going:
+        try:
+            mover.move_absolute_in_percent(random.choice([10, 30]))
+        except Exception:
+            pass  # Move was interrupted by a stop. Start another one.
+
+
+with TelemetryPoller(rate_hz=100, max_bus_utilization=1.0) as telemetry:
+    for pump in pumps:
+        telemetry.add_device(pump)
+    threads = [threading.Thread(target=query_load, daemon=True),
+               threading.Thread(target=move_load, daemon=True)]
+    for thread in threads:
+        thread.start()
+    for _ in range(STOP_COUNT):
+        sleep(random.uniform(0.05, 0.2))
+        mover.force_stop()
+    keep_going = False
+    for thread in threads:
+        thread.join()
+
+stats = mover.bus.stop_latency_stats()
+logger.info(f"Stop request-to-wire latency over {stats['count']} stops: "
+            f"mean {stats['mean_s']*1e3:.2f}[ms], "
+            f"p99 {stats['p99_s']*1e3:.2f}[ms], "
+            f"max {stats['max_s']*1e3:.2f}[ms] "
+            f"(bound: {stats['bound_s']*1e3:.2f}[ms] + "
+            f"{OS_SLACK_S*1e3:.1f}[ms] slack).")
+if stats['p99_s'] > stats['bound_s'] + OS_SLACK_S:
+    raise SystemExit("Stop latency guarantee not met.")
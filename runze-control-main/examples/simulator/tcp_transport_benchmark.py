@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Talk to simulated pumps behind a (local) serial-to-Ethernet stand-in and
+compare a plain pyserial ``socket://`` port against the shared transport."""
+
+import logging
+from time import perf_counter
+
+import numpy as np
+from serial import serial_for_url
+
+from runze_control.protocol_codes import sy08_codes
+from runze_control.runze_protocol import REPLY_NUM_BYTES
+from runze_control.simulator import SimulatedBus, SimulatedSerialServer, \
+    SimulatedSyringePump
+from runze_control.syringe_pump import SY08
+from runze_control.transport import SharedConnection, open_transport
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 115200
+PUMP_COUNT = 4
+ROUNDS = 200
+
+sim_bus = SimulatedBus("tcp_rack", baudrate=BAUDRATE)
+for address in range(PUMP_COUNT):
+    sim_bus.add_device(SimulatedSyringePump(address=address, codes=sy08_codes))
+server = SimulatedSerialServer(sim_bus)
+
+pumps = [SY08(server.url, baudrate=BAUDRATE, address=address,
+              syringe_volume_ul=5000) for address in range(PUMP_COUNT)]
+print(f"{PUMP_COUNT} pumps share {len(SharedConnection.all())} connection(s) "
+      f"({server.clients} accepted by the server).")
+
+times_s = []
+for _ in range(ROUNDS):
+    for pump in pumps:
+        start_s = perf_counter()
+        pump.get_position_steps()
+        times_s.append(perf_counter() - start_s)
+times_s = np.array(times_s)
+wire_s = pumps[0].bus.query_time_s()
+print(f"Query round trip: mean {times_s.mean()*1e3:.2f}[ms], p99 "
+      f"{np.percentile(times_s, 99)*1e3:.2f}[ms] (wire time: "
+      f"{wire_s*1e3:.2f}[ms]).")
+
+
+def poll_all(ser):
+    """Write one status query per pump back-to-back, then read all replies."""
+    times_s = []
+    frames = [pump._encode_common_cmd_runze(
+        sy08_codes.CommonCmd.GetSyringePosition) for pump in pumps]
+    expected = len(frames) * REPLY_NUM_BYTES
+    for _ in range(ROUNDS):
+        start_s = perf_counter()
+        for frame in frames:
+            ser.write(frame)
+        ser.flush()
+        reply = bytes()
+        while len(reply) < expected:
+            reply += ser.read(expected - len(reply))
+        times_s.append(perf_counter() - start_s)
+    return np.array(times_s)
+
+
+plain = serial_for_url(server.url, BAUDRATE, timeout=0)
+plain_s = poll_all(plain)
+plain.close()
+shared = open_transport(server.url, BAUDRATE)
+shared.reset_input_buffer()  # Every client heard the plain port's replies.
+shared_s = poll_all(shared)
+shared.close()
+print(f"Back-to-back poll of {PUMP_COUNT} pumps: plain socket:// mean "
+      f"{plain_s.mean()*1e3:.2f}[ms] (p99 "
+      f"{np.percentile(plain_s, 99)*1e3:.2f}[ms]), shared transport mean "
+      f"{shared_s.mean()*1e3:.2f}[ms] (p99 "
+      f"{np.percentile(shared_s, 99)*1e3:.2f}[ms]).")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Drop a simulated USB-serial adapter mid-run and compare recovering by
+rebuilding the driver objects and re-homing against automatic reconnect."""
+
+import logging
+from time import perf_counter, sleep
+
+from runze_control.protocol_codes import sy08_codes
+from runze_control.rotary_valve import RotaryValve
+from runze_control.simulator import SimulatedBus, SimulatedRotaryValve, \
+    SimulatedSyringePump
+from runze_control.syringe_pump import SY08
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 115200
+OUTAGE_S = 0.5  # How long the adapter is gone before it re-enumerates.
+
+
+def build(name: str):
+    sim_bus = SimulatedBus(name, baudrate=BAUDRATE)
+    sim_bus.add_device(SimulatedSyringePump(address=0, codes=sy08_codes))
+    sim_bus.add_device(SimulatedRotaryValve(address=1))
+    pump = SY08(sim_bus.url, address=0, syringe_volume_ul=5000)
+    valve = RotaryValve(sim_bus.url, address=1)
+    pump.reset_syringe_position()
+    valve.reset_valve_position()
+    pump.move_absolute_in_percent(80)
+    valve.move_to_port(4)
+    return sim_bus, pump, valve
+
+
+# Rebuild: the old objects are dead, so make new ones (probing baud rates)
+# and re-home, which also loses the plunger's contents.
+sim_bus, pump, valve = build("usb_rebuild")
+sim_bus.unplug(OUTAGE_S)
+start_s = perf_counter()
+while True:
+    try:
+        pump = SY08(sim_bus.url, address=0, syringe_volume_ul=5000)
+        break
+    except Exception:
+        sleep(0.1)
+valve = RotaryValve(sim_bus.url, address=1)
+pump.reset_syringe_position()
+valve.reset_valve_position()
+rebuild_s = perf_counter() - start_s
+
+# Reconnect: keep using the same objects.
+sim_bus, pump, valve = build("usb_reconnect")
+pump.driver_steps = 0  # Stale driver state gets resynchronized.
+valve.current_port = None
+sim_bus.unplug(OUTAGE_S)
+start_s = perf_counter()
+pump.get_motor_status()
+valve.get_motor_status()
+reconnect_s = perf_counter() - start_s
+print(f"After a {OUTAGE_S:.1f}[s] adapter outage: rebuild and re-home "
+      f"{rebuild_s:.2f}[s], reconnect {reconnect_s:.2f}[s] "
+      f"(plunger resynchronized at {pump.driver_steps}[steps], valve at "
+      f"port {valve.current_port}).")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""Compare rotary valve switch times when always rotating clockwise versus
+taking the shortest direction."""
+
+import logging
+import random
+from time import perf_counter
+
+from runze_control.rotary_valve import RotaryValve
+from runze_control.simulator import SimulatedBus, SimulatedRotaryValve
+
+# Uncomment for some prolific log statements.
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+logger.handlers[-1].setFormatter(
+    logging.Formatter(fmt='%(asctime)s:%(name)s:%(levelname)s: %(message)s'))
+
+# Constants
+BAUDRATE = 115200
+POSITION_COUNT = 10
+SWITCH_COUNT = 40
+
+sim_bus = SimulatedBus("valve_switch_benchmark", baudrate=BAUDRATE)
+sim_bus.add_device(SimulatedRotaryValve(address=0, port_switch_s=0.02,
+                                        position_count=POSITION_COUNT))
+valve = RotaryValve(sim_bus.url, baudrate=BAUDRATE, address=0,
+                    position_count=POSITION_COUNT)
+random.seed(0)
+targets = [random.randint(1, POSITION_COUNT) for _ in range(SWITCH_COUNT)]
+
+for name, move in [("Clockwise only", valve.move_clockwise_to_position),
+                   ("Shortest direction", valve.move_to_port)]:
+    valve.move_clockwise_to_position(1)
+    start_s = perf_counter()
+    for port in targets:
+        move(port)
+    elapsed_s = perf_counter() - start_s
+    print(f"{name}: {elapsed_s / SWITCH_COUNT * 1e3:.1f}[ms] per switch.")
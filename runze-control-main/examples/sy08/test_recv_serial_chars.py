@@ -1,11 +1,9 @@
 #!/usr/bin/env python3
-from serial import Serial, SerialException
+"""Passively decode traffic on the bus (i.e: from a second RS485 adapter
+tapped onto it) and print per-address statistics once a second."""
+from runze_control.sniffer import BusSniffer
 import logging
 
-DEFAULT_TIMEOUT_S = 0.5  # Default communication timeout in seconds.
-VALID_RS232_AND_RS485_BAUDRATES_BPS = [9600, 19200, 38400, 57600, 115200]
-VALID_PORT_COUNT = [6, 9, 12]
-
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 logger.addHandler(logging.StreamHandler())
@@ -15,13 +13,17 @@ logger.handlers[-1].setFormatter(
 com_port = "/dev/ttyUSB0"
 br = 9600
 
-ser = Serial(com_port, br, timeout=1.0)
+
+def log_frames(frames):
+    for frame in frames:
+        logging.debug(f"{frame.kind} 0x{frame.address:02X}: {frame.name} "
+                      f"{frame.parameter}")
+
+
+sniffer = BusSniffer(com_port, br, models={0: "SY08"})
 try:
     while True:
-        reply = ser.read(1)
-        if len(reply):
-            logging.debug(f"Reply (hex): {reply.hex(' ')}")
+        sniffer.run(1.0, on_frames=log_frames)
+        logging.info(sniffer.summary())
 except KeyboardInterrupt:
-    ser.close()
-
-
+    sniffer.close()
@@ -0,0 +1,173 @@
+"""Managed baud rate changes for every device on a bus."""
+from dataclasses import dataclass, field, asdict
+from runze_control.protocol import Protocol
+from runze_control.runze_device import RunzeDevice
+from serial import SerialException
+from time import perf_counter, sleep, time
+from typing import Callable
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DeviceBaudrateRecord:
+    """Baud rate change outcome for one device."""
+    address: int
+    rs232_baudrate_before: int = None
+    rs485_baudrate_before: int = None
+    baudrate_after: int = None  # Verified rate on the upgraded interface.
+    changed: bool = False  # True if a factory command was sent.
+    verified: bool = False
+    error: str = None
+
+
+@dataclass
+class BaudrateUpgradeResult:
+    """Outcome of :func:`upgrade_baudrate`."""
+    com_port: str
+    interface: str
+    old_baudrate: int
+    new_baudrate: int
+    started_at: float = 0  # Unix time.
+    duration_s: float = 0
+    devices: list = field(default_factory=list)  # DeviceBaudrateRecord list.
+
+    @property
+    def success(self):
+        return all(d.verified for d in self.devices)
+
+    @property
+    def partial(self):
+        """True if some, but not all, devices were verified at the new rate."""
+        return not self.success and any(d.verified for d in self.devices)
+
+    @property
+    def poll_capacity_gain(self):
+        """Factor by which the number of status polls the bus can carry per
+        second went up (wire time scales inversely with baud rate)."""
+        return self.new_baudrate / self.old_baudrate
+
+    def to_dict(self):
+        result = asdict(self)
+        result['success'] = self.success
+        result['partial'] = self.partial
+        result['poll_capacity_gain'] = self.poll_capacity_gain
+        return result
+
+
+def upgrade_baudrate(devices: list, interface: str, baudrate: int = 115200,
+                     power_cycle: Callable = None,
+                     reconnect_timeout_s: float = 60.0,
+                     record_path: str = None):
+    """Move every device on one bus to a new baud rate and reconnect to it.
+
+    Current rates are read with :meth:`RunzeDevice.get_rs232_baudrate` and
+    :meth:`RunzeDevice.get_rs485_baudrate`, the new rate is written to each
+    device that needs it with a factory command, and the devices are power
+    cycled (new baud rates only take effect at power-up). Afterwards every
+    device is reached at the new rate and its address and baud rate are
+    verified. A device that fails doesn't stop the others: its error is kept
+    in its record, the remaining devices are still power cycled and verified,
+    and the result reports the upgrade as partial.
+
+    :param devices: connected devices that all share the same bus.
+    :param interface: "rs232" or "rs485": the interface the host uses to talk
+        to the devices.
+    :param baudrate: desired baud rate.
+    :param power_cycle: callable that power cycles the devices (i.e: toggles a
+        relay). If omitted, an operator is asked (via the log) to power cycle
+        them by hand and the devices are polled until they come back.
+    :param reconnect_timeout_s: how long to wait for all devices to answer at
+        the new baud rate.
+    :param record_path: if specified, append the result as a line of JSON to
+        this file.
+    """
+    if not devices:
+        raise ValueError("No devices specified.")
+    bus = devices[0].bus
+    if any(device.bus is not bus for device in devices):
+        raise ValueError("All devices must share the same bus.")
+    if baudrate not in RunzeDevice.VALID_BAUDRATES[Protocol.RUNZE]:
+        raise ValueError(f"Baud rate ({baudrate}[bps]) is invalid and must be "
+                         "one of the following values: "
+                         f"{RunzeDevice.VALID_BAUDRATES[Protocol.RUNZE]}.")
+    if interface not in ("rs232", "rs485"):
+        raise ValueError(f"Interface ({interface}) must be 'rs232' or 'rs485'.")
+    result = BaudrateUpgradeResult(com_port=bus.com_port, interface=interface,
+                                   old_baudrate=bus.baudrate,
+                                   new_baudrate=baudrate, started_at=time())
+    start_s = perf_counter()
+    # Read current settings and apply the new one where needed.
+    for device in devices:
+        record = DeviceBaudrateRecord(address=device.address)
+        result.devices.append(record)
+        try:
+            record.rs232_baudrate_before = device.get_rs232_baudrate()
+            record.rs485_baudrate_before = device.get_rs485_baudrate()
+            current = getattr(record, f"{interface}_baudrate_before")
+            if current == baudrate:
+                continue
+            getattr(device, f"set_{interface}_baudrate")(baudrate)
+            record.changed = True
+        except Exception as e:
+            record.error = str(e)
+            logger.error(f"Device at address {device.address} could not be "
+                         f"set to {baudrate}[bps]: {e}")
+    if any(record.changed for record in result.devices):
+        if power_cycle is not None:
+            logger.info(f"Power cycling devices on {bus.com_port}.")
+            power_cycle()
+        else:
+            logger.warning(f"New baud rate ({baudrate}[bps]) stored. Power "
+                           f"cycle all devices on {bus.com_port} now.")
+    # Reconnect at the new baud rate and verify every device.
+    for device in devices:
+        device.ser.baudrate = baudrate
+    bus.baudrate = baudrate
+    deadline_s = perf_counter() + reconnect_timeout_s
+    for device, record in zip(devices, result.devices):
+        try:
+            _reconnect(device, deadline_s)
+            record.baudrate_after = \
+                getattr(device, f"get_{interface}_baudrate")()
+            record.verified = (record.baudrate_after == baudrate)
+        except Exception as e:
+            record.error = str(e) if record.error is None \
+                else f"{record.error}; {e}"
+            logger.error(f"Device at address {device.address} could not be "
+                         f"verified at {baudrate}[bps]: {e}")
+    result.duration_s = perf_counter() - start_s
+    verified = sum(record.verified for record in result.devices)
+    outcome = "succeeded" if result.success else \
+        f"PARTIALLY succeeded ({verified}/{len(devices)} devices)" \
+        if result.partial else "FAILED"
+    logger.info(f"Baud rate upgrade on {bus.com_port} {outcome}: "
+                f"{result.old_baudrate} -> {baudrate}[bps]. Status poll "
+                f"capacity is now {result.poll_capacity_gain:.1f}x.")
+    if record_path is not None:
+        with open(record_path, "a") as record_file:
+            record_file.write(json.dumps(result.to_dict()) + "\n")
+    return result
+
+
+def _reconnect(device: RunzeDevice, deadline_s: float):
+    """Poll the device address (with a short timeout) until it answers."""
+    device._timeout_s = device.DEFAULT_TIMEOUT_S
+    try:
+        while True:
+            device.cmd_send_time_s = None  # Forget about unanswered polls.
+            try:
+                device.ser.reset_input_buffer()
+                address = device.get_address()
+                break
+            except SerialException:
+                if perf_counter() >= deadline_s:
+                    raise
+                sleep(device.DEFAULT_TIMEOUT_S)
+        if address != device.address:
+            raise ValueError(f"Device answered with address {address}, "
+                             f"expected {device.address}.")
+    finally:
+        device._timeout_s = device.LONG_TIMEOUT_S
@@ -0,0 +1,214 @@
+"""Shared state for all devices that communicate over the same serial port."""
+from collections import deque
+from contextlib import contextmanager
+from enum import IntEnum
+from runze_control import runze_protocol
+from time import perf_counter
+import heapq
+import itertools
+import threading
+import weakref
+
+
+class Priority(IntEnum):
+    """Bus access priorities. Lower values are served first."""
+    STOP = 0  # ForceStop/Halt frames. Never wait behind queued transactions.
+    CONTROL = 1  # Regular commands and queries issued by the application.
+    POLL = 2  # Background polling. Only served when nothing else is waiting.
+
+
+class Bus:
+    """Arbitrates access to one serial port shared by one or more devices.
+
+    Every device connected through the same com port shares a single Bus
+    instance (see :meth:`Bus.get`). A command-reply cycle holds the bus as a
+    *transaction*. Threads waiting for a transaction are served in
+    :class:`Priority` order (then first-come-first-served), so control commands
+    always win over polls.
+
+    Stop frames don't wait for a transaction at all. They only wait for the
+    frame currently being written to leave the wire (:meth:`write` drains the
+    output before releasing the line), and while a stop frame is pending no
+    new transaction is granted. A stop frame therefore goes out within one
+    frame time of being requested.
+    """
+
+    BITS_PER_BYTE = 10  # 8 data bits plus a start and a stop bit.
+    STOP_LATENCY_HISTORY = 1000  # Stop latency samples kept per bus.
+    RETRY_HISTORY = 1000  # Retry latency samples kept per bus.
+
+    _buses = {}
+    _buses_lock = threading.Lock()
+
+    def __init__(self, com_port: str):
+        self.com_port = com_port
+        self.baudrate = None  # Assigned once a device connects.
+        self.devices = weakref.WeakSet()
+        self.write_lock = threading.Lock()  # Held while a frame is written.
+        self.stop_latencies_s = deque(maxlen=self.STOP_LATENCY_HISTORY)
+        # Commands whose reply was lost or corrupted (see
+        # RunzeDevice.max_retries): resends per command kind, relative moves
+        # confirmed by reading back the position, commands that still failed,
+        # and the latency each recovered command gained.
+        self.resends = {'query': 0, 'absolute': 0, 'relative': 0}
+        self.reconciled = 0
+        self.retry_failures = 0
+        self.retry_latencies_s = deque(maxlen=self.RETRY_HISTORY)
+        self._cond = threading.Condition()
+        self._owner = None  # Thread ident holding the current transaction.
+        self._depth = 0  # Reentrancy count of the current transaction.
+        self._waiting = []  # heap of (priority, order, thread ident).
+        self._order = itertools.count()
+        self._stops_pending = 0
+
+    @classmethod
+    def get(cls, com_port: str):
+        """Return the Bus for the specified com port, creating it if needed."""
+        with cls._buses_lock:
+            if com_port not in cls._buses:
+                cls._buses[com_port] = cls(com_port)
+            return cls._buses[com_port]
+
+    @classmethod
+    def all(cls):
+        """Return a list of all buses created so far."""
+        with cls._buses_lock:
+            return list(cls._buses.values())
+
+    def transfer_time_s(self, num_bytes: int):
+        """Time (in seconds) to put `num_bytes` on the wire at the current
+        baud rate."""
+        return num_bytes * self.BITS_PER_BYTE / self.baudrate
+
+    def query_time_s(self):
+        """Wire time (in seconds) of one common command frame plus its reply."""
+        return self.transfer_time_s(runze_protocol.COMMON_CMD_NUM_BYTES
+                                    + runze_protocol.REPLY_NUM_BYTES)
+
+    def stop_latency_bound_s(self):
+        """Worst-case wire-level delay from a stop request until its frame has
+        been sent: one frame (or reply) already on the wire plus the stop
+        frame itself. OS and USB-serial adapter latency come on top."""
+        return self.transfer_time_s(runze_protocol.REPLY_NUM_BYTES
+                                    + runze_protocol.COMMON_CMD_NUM_BYTES)
+
+    def is_idle(self):
+        """True if no device on this bus is waiting on a reply."""
+        return all(device.cmd_send_time_s is None for device in self.devices)
+
+    @property
+    def control_pending(self):
+        """True if a stop or control command is waiting for the bus."""
+        with self._cond:
+            return self._stops_pending > 0 or \
+                any(p < Priority.POLL for p, _, _ in self._waiting)
+
+    def acquire(self, priority: Priority = Priority.CONTROL,
+                blocking: bool = True):
+        """Take the bus for a transaction. Reentrant for the owning thread.
+        Return False if not `blocking` and the bus could not be taken."""
+        me = threading.get_ident()
+        with self._cond:
+            if self._owner == me:
+                self._depth += 1
+                return True
+            if not blocking:
+                if self._owner is not None or self._waiting \
+                        or self._stops_pending:
+                    return False
+                self._owner, self._depth = me, 1
+                return True
+            entry = (priority, next(self._order), me)
+            heapq.heappush(self._waiting, entry)
+            while not (self._owner is None and self._waiting[0] is entry
+                       and self._stops_pending == 0):
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            self._owner, self._depth = me, 1
+            return True
+
+    def release(self):
+        """Release a transaction taken with :meth:`acquire`."""
+        with self._cond:
+            if self._owner != threading.get_ident():
+                raise RuntimeError("Cannot release a bus transaction owned by "
+                                   "another thread.")
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._cond.notify_all()
+
+    @contextmanager
+    def transaction(self, priority: Priority = Priority.CONTROL):
+        """Hold the bus for one command-reply cycle."""
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def try_acquire_poll(self):
+        """Take the bus for a poll without blocking. Return False if any
+        control command is pending or the bus is otherwise in use."""
+        if not self.acquire(Priority.POLL, blocking=False):
+            return False
+        if not self.is_idle():
+            self.release()
+            return False
+        return True
+
+    def release_poll(self):
+        """Release the bus after a successful :meth:`try_acquire_poll`."""
+        self.release()
+
+    def write(self, ser, packet: bytes, priority: Priority = Priority.CONTROL,
+              drain: bool = True):
+        """Write a frame and wait until it has left the wire.
+
+        Stop-priority frames hold off new transactions until they are sent and
+        their request-to-wire latency is recorded in `stop_latencies_s`.
+
+        :param drain: if False, return as soon as the frame is queued for
+            sending (the caller must flush `ser`). Ignored for stop frames.
+        """
+        if priority != Priority.STOP:
+            with self.write_lock:
+                ser.write(packet)
+                if drain:
+                    ser.flush()
+            return
+        request_s = perf_counter()
+        with self._cond:
+            self._stops_pending += 1
+        try:
+            with self.write_lock:
+                ser.write(packet)
+                ser.flush()
+            self.stop_latencies_s.append(perf_counter() - request_s)
+        finally:
+            with self._cond:
+                self._stops_pending -= 1
+                self._cond.notify_all()
+
+    def retry_stats(self):
+        """Return a dict of retry counts and added latency (seconds)."""
+        samples = sorted(self.retry_latencies_s)
+        stats = {'resends': dict(self.resends), 'reconciled': self.reconciled,
+                 'failures': self.retry_failures, 'recovered': len(samples)}
+        if samples:
+            stats['mean_added_s'] = sum(samples) / len(samples)
+            stats['max_added_s'] = samples[-1]
+        return stats
+
+    def stop_latency_stats(self):
+        """Return a dict of stop request-to-wire latency statistics (seconds)
+        or None if no stop frames have been sent."""
+        samples = sorted(self.stop_latencies_s)
+        if not samples:
+            return None
+        return {'count': len(samples),
+                'mean_s': sum(samples) / len(samples),
+                'p99_s': samples[min(len(samples) - 1,
+                                     int(0.99 * len(samples)))],
+                'max_s': samples[-1],
+                'bound_s': self.stop_latency_bound_s()}
@@ -0,0 +1,161 @@
+"""Snapshot, compare, and apply the persistent settings of Runze devices."""
+from dataclasses import dataclass, fields
+from runze_control import runze_protocol
+from runze_control.protocol_codes.common_codes import FactoryCmd
+from runze_control.runze_device import RunzeDevice
+from time import perf_counter
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DeviceConfig:
+    """Persistent (factory) settings of a device. None means unknown (in a
+    snapshot) or "don't care" (in a desired configuration)."""
+    address: int = None
+    rs232_baudrate: int = None
+    rs485_baudrate: int = None
+    can_baudrate: int = None  # Raw device code.
+    can_destination_address: int = None
+    power_on_reset: bool = None
+    multicast_ch1_address: int = None
+    multicast_ch2_address: int = None
+    multicast_ch3_address: int = None
+    multicast_ch4_address: int = None
+    parameter_lock: bool = None  # Write-only. Never known in a snapshot.
+
+
+# Setting -> (query name in the device's CommonCmd, reply decoder).
+_QUERIES = \
+{
+    'address': ('GetAddress', int),
+    'rs232_baudrate': ('GetRS232Baudrate',
+                       runze_protocol.RS232BaudrateReply.__getitem__),
+    'rs485_baudrate': ('GetRS485Baudrate',
+                       runze_protocol.RS485BaudrateReply.__getitem__),
+    'can_baudrate': ('GetCanBaudRate', int),
+    'can_destination_address': ('GetCanDestinationAddress', int),
+    'power_on_reset': ('GetPowerOnReset', bool),
+    'multicast_ch1_address': ('GetMulticastChannel1Address', int),
+    'multicast_ch2_address': ('GetMulticastChannel2Address', int),
+    'multicast_ch3_address': ('GetMulticastChannel3Address', int),
+    'multicast_ch4_address': ('GetMulticastChannel4Address', int),
+}
+
+# Setting -> (factory command, parameter encoder).
+_WRITES = \
+{
+    'rs232_baudrate': (FactoryCmd.SetRS232Baudrate, RunzeDevice._baudrate_code),
+    'rs485_baudrate': (FactoryCmd.SetRS485Baudrate, RunzeDevice._baudrate_code),
+    'can_baudrate': (FactoryCmd.SetCANBaudrate, int),
+    'can_destination_address': (FactoryCmd.CANDestinationAddress, int),
+    'power_on_reset': (FactoryCmd.PowerOnReset, int),
+    'multicast_ch1_address': (FactoryCmd.MulticastCh1Address, int),
+    'multicast_ch2_address': (FactoryCmd.MulticastCh2Address, int),
+    'multicast_ch3_address': (FactoryCmd.MulticastCh3Address, int),
+    'multicast_ch4_address': (FactoryCmd.MulticastCh4Address, int),
+    'parameter_lock': (FactoryCmd.ParameterLock, int),
+    # Address goes last so every other setting still reaches this device.
+    'address': (FactoryCmd.SetAddress, int),
+}
+
+
+def read_config(device: RunzeDevice):
+    """Read every setting the device model can report in one pipelined burst
+    of queries and return it as a :class:`DeviceConfig`."""
+    names = [name for name, (query, _) in _QUERIES.items()
+             if hasattr(device.codes.CommonCmd, query)]
+    funcs = [getattr(device.codes.CommonCmd, _QUERIES[name][0]) for name in names]
+    replies = device._send_queries_runze(funcs)
+    values = {name: _QUERIES[name][1](reply['parameter'])
+              for name, reply in zip(names, replies)}
+    return DeviceConfig(**values)
+
+
+def diff_config(current: DeviceConfig, desired: DeviceConfig,
+                write_unknown: bool = False):
+    """Return a dict of {setting: (current value, desired value)} for every
+    setting that must be written to turn `current` into `desired`.
+
+    :param write_unknown: if True, also include settings specified in
+        `desired` whose current value is unknown (i.e: `parameter_lock`, which
+        cannot be read back). Otherwise they are skipped to spare the EEPROM.
+    """
+    diff = {}
+    for f in fields(DeviceConfig):
+        want = getattr(desired, f.name)
+        have = getattr(current, f.name)
+        if want is None or want == have:
+            continue
+        if have is None and not write_unknown:
+            continue
+        diff[f.name] = (have, want)
+    return diff
+
+
+def apply_config(device: RunzeDevice, desired: DeviceConfig,
+                 current: DeviceConfig = None, write_unknown: bool = False,
+                 dry_run: bool = False):
+    """Write only the settings in which the device differs from `desired`.
+
+    Settings take effect after the device is power cycled.
+
+    :param current: a snapshot of the device configuration. Read from the
+        device if omitted.
+    :param dry_run: if True, compute the changes without writing them.
+    :return: the applied diff (see :func:`diff_config`).
+    """
+    if current is None:
+        current = read_config(device)
+    diff = diff_config(current, desired, write_unknown=write_unknown)
+    if dry_run or not diff:
+        return diff
+    for name, (func, encode) in _WRITES.items():
+        if name not in diff:
+            continue
+        have, want = diff[name]
+        device.log.debug(f"Changing {name}: {have} -> {want}.")
+        device._send_factory_cmd_runze(func, encode(want))
+    device.log.info(f"Wrote {len(diff)} setting(s): {list(diff)}. Changes "
+                    "take effect after a power cycle.")
+    return diff
+
+
+def provision(desired_configs: dict, write_unknown: bool = False,
+              dry_run: bool = False):
+    """Apply configurations to many devices, one thread per bus.
+
+    :param desired_configs: dict mapping devices to their desired
+        :class:`DeviceConfig`.
+    :return: dict mapping each device to its applied diff or to the exception
+        raised while provisioning it.
+    """
+    start_s = perf_counter()
+    by_bus = {}
+    for device, desired in desired_configs.items():
+        by_bus.setdefault(device.bus, []).append((device, desired))
+    results = {}
+
+    def provision_bus(items: list):
+        for device, desired in items:
+            try:
+                results[device] = apply_config(device, desired,
+                                               write_unknown=write_unknown,
+                                               dry_run=dry_run)
+            except Exception as e:
+                results[device] = e
+                device.log.error(f"Provisioning failed: {e}")
+
+    threads = [threading.Thread(target=provision_bus, args=(items,),
+                                daemon=True) for items in by_bus.values()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writes = sum(len(r) for r in results.values() if isinstance(r, dict))
+    logger.info(f"Provisioned {len(results)} device(s) on {len(by_bus)} "
+                f"bus(es) with {writes} setting write(s) in "
+                f"{perf_counter() - start_s:.2f}[s].")
+    return results
@@ -0,0 +1,305 @@
+"""Continuous flow from two syringe pumps that take turns (ping-pong): one
+dispenses while the other refills."""
+from dataclasses import dataclass, field
+from functools import partial
+from runze_control import runze_protocol
+from runze_control.flow_profile import _CompletionPredictor
+from runze_control.multichannel_syringe_pump import MultiChannelSyringePump
+from runze_control.rotary_valve import RotaryValve
+from runze_control.syringe_pump import SyringePump
+from time import perf_counter
+import logging
+import numpy as np
+import threading
+
+SPIN_WINDOW_S = 0.002  # Busy-wait this long before a scheduled handover.
+
+
+@dataclass
+class Handover:
+    """Timing of one switch from the outgoing to the incoming pump
+    (:func:`time.perf_counter` timebase)."""
+    predicted_end_s: float  # Predicted end of the outgoing pump's stroke.
+    incoming_start_s: float = None  # Incoming stroke frame sent.
+    outgoing_end_s: float = None  # Outgoing stroke's reply received.
+    refill_late_s: float = 0  # How late the incoming pump finished refilling.
+
+
+@dataclass
+class ContinuousFlowReport:
+    """Outcome of :meth:`ContinuousFlowController.run`."""
+    flow_ul_per_s: float  # Achievable rate closest to the requested one.
+    strokes: int = 0
+    handovers: list = field(default_factory=list)  # Handover list.
+
+    @property
+    def overlaps_s(self):
+        """Measured overlap of consecutive strokes (negative: gap) as seen by
+        the host."""
+        return np.array([h.outgoing_end_s - h.incoming_start_s
+                         for h in self.handovers
+                         if h.outgoing_end_s is not None])
+
+
+@dataclass
+class FlowContinuity:
+    """Flow-continuity metric of a sampled output flow. See
+    :func:`flow_continuity`."""
+    target_ul_per_s: float
+    tolerance: float
+    in_tolerance_fraction: float  # Fraction of time within tolerance.
+    min_ratio: float  # Lowest flow relative to the target.
+    max_ratio: float  # Highest flow relative to the target.
+    longest_dropout_s: float  # Longest stretch below tolerance.
+    delivered_ul: float
+
+
+def flow_continuity(times_s, flow_ul_per_s, target_ul_per_s: float,
+                    tolerance: float = 0.05):
+    """Score a sampled output flow (i.e: measured on the simulator) against
+    the target flow rate.
+
+    :param times_s: evenly spaced sample times.
+    :param flow_ul_per_s: mean output flow over each sample interval.
+    :param tolerance: relative deviation from the target that still counts as
+        continuous.
+    """
+    times_s = np.asarray(times_s, dtype=float)
+    ratio = np.asarray(flow_ul_per_s, dtype=float) / target_ul_per_s
+    dt_s = np.diff(times_s).mean() if len(times_s) > 1 else 0
+    low = ratio < 1 - tolerance
+    # Longest run of consecutive low samples.
+    edges = np.diff(np.concatenate(([0], low.astype(np.int8), [0])))
+    runs = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    return FlowContinuity(
+        target_ul_per_s=target_ul_per_s, tolerance=tolerance,
+        in_tolerance_fraction=float(np.mean(np.abs(ratio - 1) <= tolerance)),
+        min_ratio=float(ratio.min()), max_ratio=float(ratio.max()),
+        longest_dropout_s=float(runs.max(initial=0) * dt_s),
+        delivered_ul=float(np.sum(flow_ul_per_s) * dt_s))
+
+
+class ContinuousFlowController:
+    """Deliver a continuous flow with two syringe pumps.
+
+    One pump dispenses a full stroke at the requested rate while the other
+    refills (at `refill_speed_percent`) and is routed back to the outlet. The
+    incoming pump's stroke is issued `overlap_s` before the outgoing pump's
+    stroke is predicted to end (compensating for the frame's wire time), so
+    the output flow continues across the handover. Both strokes run at the
+    full rate while they overlap, so the overlap is capped at
+    :meth:`max_overlap_s`.
+
+    Use :meth:`with_valve` or :meth:`with_sy01b` to build one.
+    """
+
+    def __init__(self, pumps: tuple, route_to_outlet: tuple,
+                 route_to_reservoir: tuple, overlap_s: float = 0.0,
+                 refill_speed_percent: float = 100.0,
+                 switch_at_handover: bool = False):
+        """Init.
+
+        :param pumps: two syringe pumps of the same model and syringe volume.
+        :param route_to_outlet: per pump, a callable (or None) that connects
+            the pump to the outlet.
+        :param route_to_reservoir: per pump, a callable (or None) that connects
+            the pump to the reservoir for refilling.
+        :param overlap_s: longest both strokes may run at once at each
+            handover.
+        :param switch_at_handover: if True, the outlet route is switched at the
+            handover (i.e: one shared valve). Otherwise the refilled pump is
+            routed to the outlet right after it refills.
+        """
+        if len(pumps) != 2:
+            raise ValueError("Continuous flow needs exactly two pumps.")
+        if any(p.syringe_volume_ul is None for p in pumps):
+            raise ValueError("Both pumps must specify their syringe volume.")
+        if pumps[0].max_position_steps != pumps[1].max_position_steps:
+            raise ValueError("Both pumps must have the same stroke.")
+        self.pumps = pumps
+        self.route_to_outlet = route_to_outlet
+        self.route_to_reservoir = route_to_reservoir
+        self.overlap_s = overlap_s
+        self.refill_speed_percent = refill_speed_percent
+        self.switch_at_handover = switch_at_handover
+        self.predictor = _CompletionPredictor()
+        self.refill_s = None  # Measured by prime().
+        self._stop = threading.Event()
+        self.log = logging.getLogger(self.__class__.__name__)
+
+    @classmethod
+    def with_valve(cls, pump_a: SyringePump, pump_b: SyringePump,
+                   valve: RotaryValve, outlet_ports: tuple, **kwargs):
+        """Two single-channel pumps (SY08, MiniSY04) whose lines reach the
+        outlet through ports of one shared rotary valve. Each pump refills
+        through its own check valve from the reservoir.
+
+        .. Note::
+           The outlet is blocked while the shared valve rotates, so every
+           handover interrupts the flow for one port switch. Use adjacent
+           outlet ports.
+
+        """
+        routes = tuple(partial(valve.move_to_port, port)
+                       for port in outlet_ports)
+        return cls((pump_a, pump_b), routes, (None, None),
+                   switch_at_handover=True, **kwargs)
+
+    @classmethod
+    def with_sy01b(cls, pump_a: MultiChannelSyringePump,
+                   pump_b: MultiChannelSyringePump, outlet_port: int,
+                   reservoir_port: int, **kwargs):
+        """Two SY01B pumps whose built-in valves connect each of them to the
+        outlet (through `outlet_port`) or to the reservoir."""
+        pumps = (pump_a, pump_b)
+        return cls(pumps,
+                   tuple(partial(p.move_valve_to_position, outlet_port)
+                         for p in pumps),
+                   tuple(partial(p.move_valve_to_position, reservoir_port)
+                         for p in pumps),
+                   **kwargs)
+
+    @property
+    def stroke_steps(self):
+        return self.pumps[0].max_position_steps
+
+    @property
+    def stroke_ul(self):
+        calibration = self.pumps[0].volume_converter.calibration
+        return float(calibration.steps_to_ul(self.stroke_steps)
+                     - calibration.steps_to_ul(0))
+
+    def max_flow_ul_per_s(self):
+        """Highest flow that still leaves time to refill between strokes."""
+        if self.refill_s is None:
+            self.prime()
+        return self.stroke_ul / (self.refill_s + self.overlap_s)
+
+    def max_overlap_s(self):
+        """Longest useful overlap: how precisely the host can time a handover
+        (a frame and its reply on the wire, plus one reply poll). A longer
+        overlap only overshoots the target flow."""
+        pump = self.pumps[0]
+        return pump.bus.query_time_s() + pump.REPLY_POLL_INTERVAL_S
+
+    def _refill(self, index: int):
+        """Refill a pump and route it to the outlet (unless the outlet is
+        switched at the handover). Return how long the plunger moved."""
+        pump = self.pumps[index]
+        if self.route_to_reservoir[index] is not None:
+            self.route_to_reservoir[index]()
+        pump.set_speed_percent(self.refill_speed_percent)
+        start_s = perf_counter()
+        pump.move_absolute_in_steps(self.stroke_steps, wait=False)
+        pump.wait_for_reply()
+        move_s = perf_counter() - start_s - pump.bus.query_time_s()
+        if not self.switch_at_handover \
+                and self.route_to_outlet[index] is not None:
+            self.route_to_outlet[index]()
+        return move_s
+
+    def prime(self):
+        """Empty both pumps into the reservoir and fill them, learning the
+        pumps' speed and the refill time on the way."""
+        refill_rpm = round(self.refill_speed_percent
+                           * self.pumps[0].max_speed_rpm / 100.0)
+        self.refill_s = 0
+        for index, pump in enumerate(self.pumps):
+            if self.route_to_reservoir[index] is not None:
+                self.route_to_reservoir[index]()
+            pump.reset_syringe_position()
+            pump.get_position_steps()
+            start_s = perf_counter()
+            move_s = self._refill(index)
+            # Refill time also covers setting the flow speed again.
+            self.refill_s = max(self.refill_s, perf_counter() - start_s
+                                + pump.bus.query_time_s())
+            self.predictor.observe(self.stroke_steps, refill_rpm, move_s)
+        self.log.info(f"Primed. Refill takes {self.refill_s:.2f}[s]. Max "
+                      f"continuous flow: {self.max_flow_ul_per_s():.1f}[uL/s].")
+
+    def stop(self):
+        """Stop a :meth:`run` in progress (i.e: from another thread)."""
+        self._stop.set()
+
+    def _wait_until(self, time_s: float):
+        """Sleep until shortly before `time_s`, then spin. Return False if
+        stopped in the meantime."""
+        remaining_s = time_s - perf_counter() - SPIN_WINDOW_S
+        if remaining_s > 0 and self._stop.wait(remaining_s):
+            return False
+        while perf_counter() < time_s:
+            pass
+        return not self._stop.is_set()
+
+    def run(self, flow_ul_per_s: float, duration_s: float):
+        """Deliver `flow_ul_per_s` continuously for `duration_s` (or until
+        :meth:`stop` is called). Both pumps must be primed.
+
+        :return: a :class:`ContinuousFlowReport`.
+        """
+        if self.refill_s is None:
+            self.prime()
+        self._stop.clear()
+        pump = self.pumps[0]
+        ul_per_step = self.stroke_ul / self.stroke_steps
+        rpm = round(flow_ul_per_s / ul_per_step
+                    / self.predictor.steps_per_s_per_rpm)
+        if not (0 < rpm <= pump.max_speed_rpm):
+            raise ValueError(f"Flow rate ({flow_ul_per_s}[uL/s]) is out of "
+                             "range for these pumps.")
+        if flow_ul_per_s > self.max_flow_ul_per_s():
+            raise ValueError(f"Flow rate ({flow_ul_per_s}[uL/s]) leaves no "
+                             "time to refill. Max continuous flow is "
+                             f"{self.max_flow_ul_per_s():.1f}[uL/s].")
+        speed_percent = rpm * 100.0 / pump.max_speed_rpm
+        report = ContinuousFlowReport(
+            flow_ul_per_s=rpm * self.predictor.steps_per_s_per_rpm * ul_per_step)
+        self.log.info(f"Starting continuous flow at "
+                      f"{report.flow_ul_per_s:.2f}[uL/s].")
+        stroke_s = self.predictor.predict_s(self.stroke_steps, rpm)
+        # Issue each stroke early by the wire time of its frame.
+        lead_s = pump.bus.transfer_time_s(runze_protocol.COMMON_CMD_NUM_BYTES)
+        overlap_s = min(self.overlap_s, self.max_overlap_s())
+        if overlap_s < self.overlap_s:
+            self.log.info(f"Overlap capped at {overlap_s*1e3:.1f}[ms].")
+        for p in self.pumps:
+            p.set_speed_percent(speed_percent)
+        if self.route_to_outlet[0] is not None:
+            self.route_to_outlet[0]()
+        active = 0
+        self.pumps[active].move_absolute_in_steps(0, wait=False)
+        start_s = stroke_start_s = perf_counter()
+        report.strokes += 1
+        deadline_s = start_s + duration_s
+        while True:
+            idle = 1 - active
+            end_s = stroke_start_s + stroke_s
+            issue_s = end_s - overlap_s - lead_s
+            if issue_s >= deadline_s:  # This is the last stroke.
+                self._wait_until(deadline_s)
+                self.pumps[active].force_stop()
+                break
+            self._refill(idle)
+            self.pumps[idle].set_speed_percent(speed_percent)
+            handover = Handover(predicted_end_s=end_s)
+            handover.refill_late_s = max(perf_counter() - issue_s, 0)
+            if handover.refill_late_s:
+                self.log.warning(f"Refill finished {handover.refill_late_s:.3f}"
+                                 "[s] too late.")
+            if not self._wait_until(issue_s):
+                self.pumps[active].force_stop()
+                break
+            self.pumps[idle].move_absolute_in_steps(0, wait=False)
+            handover.incoming_start_s = stroke_start_s = perf_counter()
+            if self.switch_at_handover \
+                    and self.route_to_outlet[idle] is not None:
+                self.route_to_outlet[idle]()
+            self.pumps[active].wait_for_reply()
+            handover.outgoing_end_s = perf_counter()
+            report.handovers.append(handover)
+            report.strokes += 1
+            active = idle
+        self.log.info(f"Delivered {report.strokes} strokes in "
+                      f"{perf_counter() - start_s:.2f}[s].")
+        return report
@@ -0,0 +1,140 @@
+"""Process-wide emergency stop for every connected Runze device."""
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from runze_control.bus import Bus, Priority
+from runze_control.runze_device import RunzeDevice
+from time import perf_counter
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DRAIN_TIMEOUT_S = 0.05  # How long to wait for further stop replies.
+
+
+@dataclass
+class EmergencyStopReport:
+    """Outcome of :func:`emergency_stop`.
+
+    `positions` resolves (in the background) to a dict mapping each stopped
+    device to its confirmed position (syringe steps or valve port) or to the
+    exception raised while confirming it.
+    """
+    stop_frames_sent: int = 0
+    last_frame_s: float = 0  # Time from the call until the last stop frame
+                             # left the wire.
+    bus_times_s: dict = field(default_factory=dict)  # com port -> time until
+                                                      # its last stop frame.
+    errors: dict = field(default_factory=dict)  # com port -> exception.
+    positions: Future = field(default_factory=Future)
+
+
+def _stop_frame(device: RunzeDevice, address: int = None):
+    """Return a ForceStop frame for `device` (optionally sent to another
+    address) or None if the device has no stop command."""
+    force_stop = getattr(device.codes.CommonCmd, 'ForceStop', None)
+    if force_stop is None:
+        return None
+    return device._encode_common_cmd_runze(force_stop, address=address)
+
+
+def _confirm(device: RunzeDevice):
+    """Clear any stop (and aborted command) replies, then read the position."""
+    if device._reply_waiters == 0:  # Don't steal replies from other threads.
+        # Read them raw: an aborted command may reply with an error status.
+        while len(device._get_reply(device.protocol, force=True,
+                                    timeout_s=DRAIN_TIMEOUT_S)):
+            pass
+        device.ser.reset_input_buffer()  # Drop anything that came in late.
+        device.cmd_send_time_s = None
+    if hasattr(device, 'get_position_steps'):
+        return device.get_position_steps()
+    if hasattr(device, 'get_Port_position'):
+        return device.get_Port_position()
+    return None
+
+
+def emergency_stop(devices: list = None, multicast_addresses: dict = None,
+                   confirm: bool = True):
+    """Send ForceStop frames to every device on every bus concurrently.
+
+    Stop frames are sent with stop priority (see
+    :class:`~runze_control.bus.Bus`) by one thread per bus, without waiting
+    for any replies. Replies are cleared and positions are read afterwards in
+    the background.
+
+    :param devices: devices to stop. Defaults to every connected device.
+    :param multicast_addresses: dict mapping com port to a multicast address
+        that every device on that bus listens to. Buses listed here get a
+        single stop frame instead of one per device.
+    :param confirm: if True, confirm the stops and read back positions in the
+        background (see :class:`EmergencyStopReport`).
+    """
+    start_s = perf_counter()
+    multicast_addresses = multicast_addresses or {}
+    if devices is None:
+        devices = [d for bus in Bus.all() for d in list(bus.devices)]
+    by_bus = {}
+    for device in devices:
+        by_bus.setdefault(device.bus, []).append(device)
+    report = EmergencyStopReport()
+    lock = threading.Lock()
+
+    def stop_bus(bus: Bus, bus_devices: list):
+        sent = 0
+        try:
+            if bus.com_port in multicast_addresses:
+                frames = [(bus_devices[0],
+                           _stop_frame(bus_devices[0],
+                                       multicast_addresses[bus.com_port]))]
+            else:
+                frames = [(d, _stop_frame(d)) for d in bus_devices]
+            for device, frame in frames:
+                if frame is None:
+                    continue
+                bus.write(device.ser, frame, Priority.STOP)
+                sent += 1
+        except Exception as e:
+            with lock:
+                report.errors[bus.com_port] = e
+        with lock:
+            report.stop_frames_sent += sent
+            report.bus_times_s[bus.com_port] = perf_counter() - start_s
+
+    threads = [threading.Thread(target=stop_bus, args=(bus, bus_devices),
+                                daemon=True)
+               for bus, bus_devices in by_bus.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report.last_frame_s = max(report.bus_times_s.values(), default=0)
+    logger.warning(f"Emergency stop: sent {report.stop_frames_sent} stop "
+                   f"frame(s) on {len(by_bus)} bus(es) in "
+                   f"{report.last_frame_s*1e3:.1f}[ms].")
+    for com_port, error in report.errors.items():
+        logger.error(f"Emergency stop on {com_port} failed: {error}")
+    if not confirm:
+        report.positions.set_result({})
+        return report
+
+    def confirm_all():
+        positions = {}
+
+        def confirm_bus(bus_devices: list):
+            for device in bus_devices:
+                try:
+                    positions[device] = _confirm(device)
+                except Exception as e:
+                    positions[device] = e
+
+        confirmers = [threading.Thread(target=confirm_bus, args=(d,),
+                                       daemon=True) for d in by_bus.values()]
+        for thread in confirmers:
+            thread.start()
+        for thread in confirmers:
+            thread.join()
+        report.positions.set_result(positions)
+
+    threading.Thread(target=confirm_all, daemon=True).start()
+    return report
@@ -0,0 +1,130 @@
+"""Initialize (home) many devices at once."""
+from dataclasses import dataclass, field
+from runze_control.rotary_valve import RotaryValve
+from runze_control.runze_device import RunzeDevice
+from runze_control.syringe_pump import SyringePump
+from serial import SerialException
+from time import perf_counter, sleep
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_S = 0.005  # How often to check for reset replies.
+
+
+@dataclass
+class DeviceInitRecord:
+    """Initialization timing of one device (seconds since the fleet init
+    started)."""
+    device: RunzeDevice
+    reset_started_s: float = None
+    reset_done_s: float = None
+    synchronized_s: float = None
+    error: Exception = None
+
+    @property
+    def duration_s(self):
+        return self.synchronized_s
+
+
+@dataclass
+class FleetInitReport:
+    """Outcome of :func:`initialize`."""
+    duration_s: float = 0
+    records: list = field(default_factory=list)  # DeviceInitRecord list.
+
+    @property
+    def success(self):
+        return all(r.error is None for r in self.records)
+
+    @property
+    def failures(self):
+        return [r for r in self.records if r.error is not None]
+
+
+def _start_reset(device: RunzeDevice):
+    if isinstance(device, SyringePump):
+        device.reset_syringe_position(wait=False)
+    elif isinstance(device, RotaryValve):
+        device.reset_valve_position(wait=False)
+    else:
+        raise ValueError(f"Cannot reset a {device.__class__.__name__}.")
+
+
+def _finish_reset(device: RunzeDevice):
+    if isinstance(device, SyringePump):
+        device.synchronize_reset_position()
+    else:
+        device.get_Port_position()  # Refresh the cached port.
+
+
+def initialize(devices: list):
+    """Home every syringe pump and reset every rotary valve concurrently.
+
+    Resets are started on all devices (one thread per bus), each device's
+    completion is tracked independently, and each device is synchronized as
+    soon as its own reset completes. Startup therefore takes about as long as
+    the slowest single reset. Reset replies are matched to their device by
+    address (see :class:`~runze_control.transport.SharedConnection`), so
+    devices on one bus must have distinct addresses.
+
+    :return: a :class:`FleetInitReport` with per-device timing and errors.
+    """
+    start_s = perf_counter()
+    report = FleetInitReport(records=[DeviceInitRecord(d) for d in devices])
+    by_bus = {}
+    for record in report.records:
+        device = record.device
+        records = by_bus.setdefault(device.bus, [])
+        if any(r.device.address == device.address for r in records):
+            raise ValueError(f"More than one device at address "
+                             f"{device.address} on {device.bus.com_port}.")
+        records.append(record)
+
+    def initialize_bus(records: list):
+        pending = []
+        for record in records:
+            try:
+                _start_reset(record.device)
+                record.reset_started_s = perf_counter() - start_s
+                pending.append(record)
+            except Exception as e:
+                record.error = e
+        while pending:
+            for record in list(pending):
+                device = record.device
+                try:
+                    # Only this device's replies (routed by address).
+                    reply = device._get_reply(device.protocol, wait=False)
+                    if not len(reply):
+                        if perf_counter() - start_s - record.reset_started_s \
+                                >= device.LONG_TIMEOUT_S:
+                            device.cmd_send_time_s = None
+                            raise SerialException("Reset did not complete.")
+                        continue
+                    device._parse_runze_reply(reply)
+                    record.reset_done_s = perf_counter() - start_s
+                    _finish_reset(device)
+                    record.synchronized_s = perf_counter() - start_s
+                except Exception as e:
+                    record.error = e
+                pending.remove(record)
+            if pending:
+                sleep(POLL_INTERVAL_S)
+
+    threads = [threading.Thread(target=initialize_bus, args=(records,),
+                                daemon=True) for records in by_bus.values()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report.duration_s = perf_counter() - start_s
+    logger.info(f"Initialized {len(devices) - len(report.failures)}/"
+                f"{len(devices)} device(s) on {len(by_bus)} bus(es) in "
+                f"{report.duration_s:.2f}[s].")
+    for record in report.failures:
+        logger.error(f"Device at address {record.device.address} on "
+                     f"{record.device.bus.com_port} failed to initialize: "
+                     f"{record.error}")
+    return report
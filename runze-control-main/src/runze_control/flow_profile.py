@@ -0,0 +1,184 @@
+"""Stream multi-segment dispense profiles with minimal dead time between
+segments."""
+from dataclasses import dataclass, field
+from runze_control import runze_protocol
+from runze_control.protocol import Protocol
+from runze_control.runze_device import DeviceError
+from runze_control.syringe_pump import SyringePump
+from serial import SerialException
+from time import perf_counter, sleep
+from typing import Iterable, Tuple
+import numpy as np
+
+
+@dataclass
+class SegmentTiming:
+    """Timing of one streamed segment (:func:`time.perf_counter` timebase)."""
+    speed_percent: float
+    steps: int
+    sent_s: float  # When the segment's move frame left the host.
+    predicted_s: float = None  # Predicted completion (None: no prediction yet).
+    completed_s: float = None  # When the move's reply was received.
+
+
+@dataclass
+class ProfileReport:
+    """Outcome of :func:`stream_profile`."""
+    segments: list = field(default_factory=list)  # SegmentTiming list.
+
+    @property
+    def gaps_s(self):
+        """Dead time between each segment's completion and the next segment's
+        move frame."""
+        return np.array([b.sent_s - a.completed_s for a, b in
+                         zip(self.segments[:-1], self.segments[1:])])
+
+    @property
+    def prediction_errors_s(self):
+        """Actual minus predicted completion time of predicted segments."""
+        return np.array([s.completed_s - s.predicted_s for s in self.segments
+                         if s.predicted_s is not None])
+
+
+class _CompletionPredictor:
+    """Learns the pump's steps/s per rpm from completed segments."""
+
+    SMOOTHING = 0.5  # Weight of the newest observation.
+
+    def __init__(self):
+        self.steps_per_s_per_rpm = None
+
+    def predict_s(self, steps: int, speed_rpm: int):
+        if self.steps_per_s_per_rpm is None or speed_rpm == 0:
+            return None
+        return steps / (self.steps_per_s_per_rpm * speed_rpm)
+
+    def observe(self, steps: int, speed_rpm: int, duration_s: float):
+        if duration_s <= 0 or speed_rpm == 0:
+            return
+        k = steps / (duration_s * speed_rpm)
+        if self.steps_per_s_per_rpm is None:
+            self.steps_per_s_per_rpm = k
+        else:
+            self.steps_per_s_per_rpm += self.SMOOTHING * (k - self.steps_per_s_per_rpm)
+
+
+def stream_profile(pump: SyringePump, segments: Iterable[Tuple[float, float]],
+                   spin_window_s: float = 0.005, poll_interval_s: float = 0.001):
+    """Dispense a sequence of (speed [%], volume [uL]) segments back-to-back.
+
+    Each segment's speed and move frames are encoded while the previous
+    segment is still moving and are written together in one burst the moment
+    the previous move replies (i.e: as soon as the pump can accept them). The
+    completion of each move is predicted from the pump's speed (learned from
+    earlier segments) so the host sleeps until shortly before it and then
+    polls tightly for the reply.
+
+    :param segments: sequence or generator of (speed_percent, volume_ul).
+    :param spin_window_s: start polling this long before predicted completion.
+    :param poll_interval_s: polling interval while no prediction is available.
+    :return: a :class:`ProfileReport` with per-segment timing.
+    """
+    report = ProfileReport()
+    predictor = _CompletionPredictor()
+    speed_cmd = pump.codes.CommonCmd.SetDynamicSpeed
+    move_cmd = pump.codes.CommonCmd.RunInCW
+    current_speed_percent = pump.syringe_speed_percent
+    position_steps = pump.driver_steps
+
+    def encode(speed_percent: float, volume_ul: float):
+        nonlocal current_speed_percent, position_steps
+        if not (0 <= speed_percent <= 100):
+            raise ValueError(f"Requested plunger speed ({speed_percent}%) is "
+                             f"out of range [0 - 100].")
+        if volume_ul <= 0:
+            raise ValueError(f"Segment volume ({volume_ul}[uL]) must be positive.")
+        steps = -pump.volume_converter.relative_steps(-volume_ul, position_steps)
+        if not steps:  # Less than a step. It carries into the next segment.
+            pump.log.debug(f"Skipping {volume_ul} [uL] segment: under 1 step.")
+            return None
+        speed_rpm = round(speed_percent * pump.max_speed_rpm / 100.0)
+        frames = bytes()
+        if speed_percent != current_speed_percent:
+            frames += pump._encode_common_cmd_runze(speed_cmd, speed_rpm)
+        frames += pump._encode_common_cmd_runze(move_cmd, steps)
+        current_speed_percent = speed_percent
+        position_steps -= steps
+        return speed_percent, speed_rpm, steps, frames
+
+    # Segments under one step are skipped (the device rejects 0-step moves).
+    encoded = (e for e in (encode(*segment) for segment in segments)
+               if e is not None)
+    upcoming = next(encoded, None)
+    while upcoming is not None:
+        speed_percent, speed_rpm, steps, frames = upcoming
+        timing = _send_segment(pump, frames, speed_percent, steps)
+        # Persist the previous (confirmed) segment while this one moves.
+        pump._save_state()
+        report.segments.append(timing)
+        duration_s = predictor.predict_s(steps, speed_rpm)
+        if duration_s is not None:
+            timing.predicted_s = timing.sent_s + duration_s
+        # Look ahead: encode the next segment while this one is moving.
+        upcoming = next(encoded, None)
+        _wait_for_completion(pump, timing, spin_window_s, poll_interval_s)
+        predictor.observe(steps, speed_rpm, timing.completed_s - timing.sent_s)
+    pump._save_state()
+    pump.log.debug(f"Streamed {len(report.segments)} segments. Max gap: "
+                   f"{report.gaps_s.max(initial=0)*1e3:.2f}[ms].")
+    return report
+
+
+def _send_segment(pump: SyringePump, frames: bytes, speed_percent: float,
+                  steps: int):
+    """Write a segment's frames in one burst and collect the speed reply (if
+    any). The move's reply stays pending."""
+    speed_changed = len(frames) > runze_protocol.COMMON_CMD_NUM_BYTES
+    error = None
+    with pump.bus.transaction():
+        if pump.cmd_send_time_s is not None:
+            raise RuntimeError("Cannot issue a command while the previous "
+                               "command has not yet replied.")
+        pump.bus.write(pump.ser, frames)
+        sent_s = perf_counter()
+        pump.cmd_send_time_s = sent_s
+        if speed_changed:
+            reply = pump._read_reply(Protocol.RUNZE, wait=True,
+                                     timeout_s=pump.DEFAULT_TIMEOUT_S)
+            try:
+                if not len(reply):
+                    raise SerialException("No reply received from device.")
+                pump._parse_runze_reply(reply)
+            except (SerialException, DeviceError) as e:
+                error = e
+            else:
+                pump.syringe_speed_percent = speed_percent
+            pump.cmd_send_time_s = sent_s  # The move's reply is still pending.
+    if error is not None:
+        # The move frame went out too. Collect its reply (without holding the
+        # bus) so the pump takes commands again.
+        pump._get_reply(Protocol.RUNZE)
+        pump.cmd_send_time_s = None
+        raise error
+    return SegmentTiming(speed_percent=speed_percent, steps=steps,
+                         sent_s=sent_s)
+
+
+def _wait_for_completion(pump: SyringePump, timing: SegmentTiming,
+                         spin_window_s: float, poll_interval_s: float):
+    while True:
+        now = perf_counter()
+        if timing.predicted_s is not None \
+                and now < timing.predicted_s - spin_window_s:
+            sleep(timing.predicted_s - spin_window_s - now)
+            continue
+        reply = pump._get_reply(Protocol.RUNZE, wait=False)
+        if len(reply):
+            timing.completed_s = perf_counter()
+            pump._parse_runze_reply(reply)
+            pump.driver_steps -= timing.steps
+            return
+        if now - timing.sent_s >= pump.LONG_TIMEOUT_S:
+            raise SerialException("No reply received from device.")
+        if timing.predicted_s is None or now > timing.predicted_s + spin_window_s:
+            sleep(poll_interval_s)
@@ -0,0 +1,272 @@
+"""Write-ahead journal of device command sequences so an interrupted run can
+resume from the first unacknowledged step."""
+from copy import copy
+from dataclasses import dataclass, field, asdict
+from runze_control.rotary_valve import RotaryValve
+from runze_control.syringe_pump import SyringePump
+from time import perf_counter, sleep, time
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Commands that leave the device in the same state no matter how many times
+# (or how far) they ran, so an interrupted one can simply be issued again.
+IDEMPOTENT_METHODS = \
+{
+    'move_absolute_in_steps', 'move_absolute_in_percent', 'set_speed_percent',
+    'reset_syringe_position', 'move_valve_to_position', 'move_to_port',
+    'move_clockwise_to_position', 'move_counterclockwise_to_position',
+    'reset_valve_position',
+}
+
+
+@dataclass
+class Step:
+    """One device command of a sequence, i.e:
+    ``Step("pump", "aspirate", (250,))``."""
+    device: str  # Name of the device (key of the sequence's devices dict).
+    method: str  # Device method to call.
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+
+    def to_dict(self):
+        return {**asdict(self), 'args': list(self.args)}
+
+
+class Journal:
+    """Append-only journal file of JSON records (one per line).
+
+    Every record is written through to the operating system right away (so
+    it survives a crash of this process) and flushed to disk (fsync) in
+    batches, at most `sync_interval_s` after it was written, so that
+    journaling does not add a disk flush to every command.
+    """
+
+    def __init__(self, path: str, sync_interval_s: float = 0.05):
+        self.path = path
+        self.sync_interval_s = sync_interval_s
+        self._file = open(path, 'a+')
+        self._file.seek(0, os.SEEK_END)
+        if self._file.tell():  # Terminate a line torn by a crash.
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._closed = threading.Event()
+        self._syncer = threading.Thread(target=self._sync_periodically,
+                                        daemon=True)
+        self._syncer.start()
+
+    def append(self, record: dict, sync: bool = False):
+        """Append a record. If `sync`, flush it to disk before returning."""
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._dirty = True
+            if sync:
+                self._sync()
+
+    def sync(self):
+        """Flush all records to disk."""
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        if self._dirty:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def _sync_periodically(self):
+        while not self._closed.wait(self.sync_interval_s):
+            self.sync()
+
+    def records(self, run_id: str = None):
+        """Read back the records (of one run, if specified)."""
+        with self._lock:
+            self._file.flush()
+        records = []
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:  # Line torn by a crash.
+                    continue
+                if run_id is None or record.get('run') == run_id:
+                    records.append(record)
+        return records
+
+    def close(self):
+        self._closed.set()
+        self._syncer.join()
+        with self._lock:
+            self._sync()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _device_state(device):
+    """Query the live state that a command changes. This also refreshes the
+    driver's copy of it."""
+    if isinstance(device, SyringePump):
+        return {'position_steps': device.get_position_steps()}
+    if isinstance(device, RotaryValve):
+        return {'port': device.get_Port_position()}
+    return {}
+
+
+def _driver_state(device):
+    """Device state as the driver tracks it (no query needed)."""
+    if isinstance(device, SyringePump):
+        return {'position_steps': device.driver_steps}
+    if isinstance(device, RotaryValve):
+        return {'port': device.current_port}
+    return {}
+
+
+def _target_steps(device, step: Step):
+    """Plunger position [steps] a relative plunger move will end at (None if
+    the step is not a relative plunger move)."""
+    if not isinstance(device, SyringePump):
+        return None
+    if step.method in ('aspirate_steps', 'withdraw_steps'):
+        return device.driver_steps + step.args[0]
+    if step.method == 'dispense_steps':
+        return device.driver_steps - step.args[0]
+    if step.method in ('aspirate', 'withdraw', 'dispense'):
+        microliters = step.args[0] if step.method != 'dispense' \
+            else -step.args[0]
+        converter = copy(device.volume_converter)  # Leave the original as is.
+        return device.driver_steps + converter.relative_steps(
+            microliters, device.driver_steps)
+    return None
+
+
+class JournaledSequence:
+    """A sequence of device commands whose progress is journaled so that it
+    can resume after a crash.
+
+    Each step is recorded as "issued" (with the device state before it) before
+    it is sent and as "acked" once the device confirms it.
+    """
+
+    POLL_INTERVAL_S = 0.05  # How often to check if an interrupted move ended.
+
+    def __init__(self, journal: Journal, run_id: str, devices: dict,
+                 steps: list):
+        """Init.
+
+        :param run_id: unique name of this run in the journal.
+        :param devices: dict mapping device names (used in steps) to devices.
+        :param steps: list of :class:`Step`.
+        """
+        for step in steps:
+            if step.device not in devices:
+                raise ValueError(f"Step {step} uses an unknown device.")
+        self.journal = journal
+        self.run_id = run_id
+        self.devices = devices
+        self.steps = steps
+        self.next_step = 0  # Index of the first unacknowledged step.
+
+    def run(self):
+        """Run the sequence from the beginning. Return the elapsed time."""
+        if self.journal.records(self.run_id):
+            raise ValueError(f"Run {self.run_id} is already journaled. "
+                             "Resume it instead.")
+        self.journal.append({'run': self.run_id, 'event': 'begin',
+                             'steps': [s.to_dict() for s in self.steps],
+                             'time': time()}, sync=True)
+        self.next_step = 0
+        for device in self.devices.values():
+            _device_state(device)  # Start from the actual device state.
+        return self._continue()
+
+    def resume(self):
+        """Continue an interrupted run from its first unacknowledged step.
+
+        The device state is read back from the devices. A step that was
+        issued but never acknowledged is reissued if the device never started
+        it or if reissuing it is harmless (absolute moves, valve moves,
+        settings); an interrupted relative plunger move is completed by moving
+        the remaining distance.
+        Return the elapsed time.
+        """
+        records = self.journal.records(self.run_id)
+        if not records:
+            raise ValueError(f"Run {self.run_id} was never started.")
+        if records[0]['steps'] != [s.to_dict() for s in self.steps]:
+            raise ValueError(f"Steps of run {self.run_id} differ from the "
+                             "journaled ones.")
+        acked = {r['step'] for r in records if r['event'] == 'acked'}
+        issued = {r['step']: r for r in records if r['event'] == 'issued'}
+        self.next_step = 0
+        while self.next_step in acked:
+            self.next_step += 1
+        if self.next_step == len(self.steps):
+            logger.info(f"Run {self.run_id} already completed.")
+            return 0.0
+        # Let an interrupted move finish, then refresh the driver state from
+        # the devices (i.e: plunger position).
+        for device in self.devices.values():
+            while isinstance(device, SyringePump) and device.is_busy():
+                sleep(self.POLL_INTERVAL_S)
+        live = {name: _device_state(d) for name, d in self.devices.items()}
+        in_flight = issued.get(self.next_step)
+        if in_flight is not None:
+            step = self.steps[self.next_step]
+            if live[step.device] != in_flight['before'] \
+                    and step.method not in IDEMPOTENT_METHODS:
+                if in_flight.get('target_steps') is None:
+                    raise RuntimeError(f"Cannot tell whether step "
+                                       f"{self.next_step} ({step}) completed.")
+                self._complete_plunger_move(in_flight,
+                                            live[step.device]['position_steps'])
+        logger.info(f"Resuming run {self.run_id} at step {self.next_step}/"
+                    f"{len(self.steps)}.")
+        return self._continue()
+
+    def _complete_plunger_move(self, record: dict, position_steps: int):
+        step = self.steps[record['step']]
+        device = self.devices[step.device]
+        remaining_steps = record['target_steps'] - position_steps
+        logger.info(f"Completing interrupted step {record['step']} ({step}): "
+                    f"{remaining_steps} [steps] remaining.")
+        if remaining_steps > 0:
+            device.aspirate_steps(remaining_steps)
+        elif remaining_steps < 0:
+            device.dispense_steps(-remaining_steps)
+        self._ack(record['step'])
+        self.next_step += 1
+
+    def _ack(self, index: int):
+        self.journal.append({'run': self.run_id, 'event': 'acked',
+                             'step': index, 'time': time()})
+
+    def _continue(self):
+        start_s = perf_counter()
+        while self.next_step < len(self.steps):
+            index = self.next_step
+            step = self.steps[index]
+            device = self.devices[step.device]
+            # Written through before the command goes out, so it survives a
+            # crash of this process while the device is moving.
+            self.journal.append({'run': self.run_id, 'event': 'issued',
+                                 'step': index, 'before': _driver_state(device),
+                                 'target_steps': _target_steps(device, step),
+                                 'time': time()})
+            getattr(device, step.method)(*step.args, **step.kwargs)
+            self._ack(index)
+            self.next_step += 1
+        self.journal.append({'run': self.run_id, 'event': 'end',
+                             'time': time()}, sync=True)
+        return perf_counter() - start_s
@@ -9,6 +9,15 @@ from typing import Union
 class MultiChannelSyringePump(SyringePump):
     """syringe pump with integrated rotary valve."""
 
+    # RunInCCW (0x43) rotates the valve on this device.
+    RELATIVE_PLUNGER_MOVES = {'RunInCW': -1}
+
+    STATUS_QUERIES = \
+    {
+        **SyringePump.STATUS_QUERIES,
+        'port_position': (('GetValveStatus',), int),
+    }
+
     def __init__(self, com_port: str, baudrate: int = None,
                  address: int = None,
                  protocol: Union[str, Protocol] = Protocol.RUNZE,
@@ -26,6 +35,9 @@ class MultiChannelSyringePump(SyringePump):
         self.position_count = position_count
         self.position_map = position_map
         self.codes = sy01_codes  # Overwrite parent class codes.
+        self.valve_port = None  # Last commanded valve port.
+        self._pending_steps = None  # Target of an absolute move not yet
+                                    # confirmed (see wait_for_reply).
         # Override logger and logger name.
         logger_name = self.__class__.__name__ + f".{com_port}"
         self.log = logging.getLogger(logger_name)
@@ -36,36 +48,83 @@ class MultiChannelSyringePump(SyringePump):
     #   on the multichannel syringe pump configuration
 
     def move_valve_to_position(self, position: int, wait: bool = True):
+        self.valve_port = None  # Unknown until the move succeeds.
         self._send_common_cmd_runze(self.codes.CommonCmd.MoveValveToPort,
                                     position, wait=wait)
+        self.valve_port = position
+        if wait:
+            self._save_state()
+
+    def reset_valve_position(self, wait: bool = True):
+        """Move the valve to its reset position."""
+        self.valve_port = None
+        self._send_common_cmd_runze(self.codes.CommonCmd.ResetValvePosition,
+                                    wait=wait)
+
+    def get_valve_port(self):
+        """Return the port the valve is at (as reported by the device)."""
+        reply = self._send_common_cmd_runze(self.codes.CommonCmd.GetValveStatus)
+        self.valve_port = reply['parameter']
+        return self.valve_port
+
+    def _get_state(self):
+        return {**super()._get_state(), 'valve_port': self.valve_port}
+
+    def _reconcile_state(self, state: dict):
+        if not super()._reconcile_state(state):
+            return False
+        self.valve_port = state.get('valve_port')
+        return True
+
+    def _resync(self):
+        super()._resync()
+        self.get_valve_port()
+
+    def _rehome(self):
+        self.reset_valve_position()
+        super()._rehome()
+
+    def _restore_position(self, state: dict):
+        # Valve first, so the plunger draws from the port it did before.
+        if state.get('valve_port'):
+            self.move_valve_to_position(state['valve_port'])
+        super()._restore_position(state)
 
     def move_absolute_in_steps(self, steps: int, wait: bool = True):
         """Absolute move (in steps).
 
         .. Note::
-           This feature is implemented in the software driver rather than
-           leveraging a feature on the device itself like the SY08.
+           RunInCCW (0x43) rotates the valve on this device, so this uses the
+           device's own absolute plunger move. If not `wait`, the tracked
+           position is updated once :meth:`wait_for_reply` confirms the move.
 
         """
         if (steps > self.max_position_steps) or (steps < 0):
             raise ValueError(f"Requested plunger movement ({steps}) is out of "
                              f"range [0 - self.max_position_steps].")
-        # No "move-absolute" command exists for this device, so we need to
-        # compute a relative move from accumulated steps tracked in the driver.
-        desired_steps = steps
-        delta_steps = desired_steps - self.driver_steps
-        # Sending a 0-step command results in a ParameterError on the device.
-        if delta_steps == 0:
-            self.log.debug("Not sending a 0-step movement command to device.")
-            return
         range_percent = steps/self.max_position_steps * 100.0
         self.log.debug(f"Absolute move to {steps}/"
                        f"{self.max_position_steps} [steps] "
                        f"i.e: {range_percent:.2f}% full-scale range.")
-        if delta_steps > 0:
-            self.withdraw_steps(delta_steps, wait=wait)
-        else:
-            self.dispense_steps(abs(delta_steps), wait=wait)
+        self._send_common_cmd_runze(self.codes.CommonCmd.MovePlungerAbsolute,
+                                    steps, wait)
+        if not wait:
+            self._pending_steps = steps
+            return
+        self.driver_steps = steps
+        self._save_state()
+
+    def wait_for_reply(self, force: bool = False, timeout_s: float = None):
+        try:
+            reply = super().wait_for_reply(force=force, timeout_s=timeout_s)
+        except Exception:
+            self._pending_steps = None  # The move failed.
+            raise
+        if reply is not None and self._pending_steps is not None:
+            self.driver_steps = self._pending_steps
+            self._pending_steps = None
+            self._save_state()
+        return reply
 
     def move_absolute_in_percent(self, percent: float, wait: bool = True):
         """Absolute move (in percent)."""
@@ -0,0 +1,323 @@
+"""Run each bus of a large rig in its own worker process."""
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from runze_control.rig import MODELS, Rig
+from runze_control.telemetry import CHANNELS, TelemetryPoller
+from serial import SerialException
+from time import perf_counter
+import functools
+import logging
+import multiprocessing
+import numpy as np
+import threading
+
+logger = logging.getLogger(__name__)
+
+# One row per device. `seq` is odd while its worker is writing the row.
+STATUS_DTYPE = np.dtype([('seq', 'u8'), ('time_s', 'f8')]
+                        + [(name, 'i8') for name in CHANNELS])
+
+
+def _device_channels(model: str):
+    """Telemetry channels supported by a rig file model."""
+    return [name for name, method in CHANNELS.items()
+            if hasattr(MODELS[model], method)]
+
+
+def _open_table(name: str, rows: int):
+    try:  # The parent owns (and unlinks) the table.
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13. Workers share the parent's tracker.
+        shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(rows, dtype=STATUS_DTYPE, buffer=shm.buf)
+
+
+class _SharedTablePoller(TelemetryPoller):
+    """Telemetry poller that also publishes each sample to a status table."""
+
+    def __init__(self, table: np.ndarray, rows: dict, **kwds):
+        super().__init__(**kwds)
+        self.table = table
+        self.rows = rows  # device -> table row index.
+
+    def _sample(self, entry):
+        super()._sample(entry)
+        sample = entry.buffer.latest()
+        if sample is None:
+            return
+        index = self.rows[entry.device]
+        row = self.table[index:index + 1]  # A view, not a copy.
+        row['seq'] += 1
+        for name in sample.dtype.names:
+            row[name] = sample[name]
+        row['seq'] += 1
+
+
+def _worker_main(conn, config: dict, table_name: str, rows: dict,
+                 table_rows: int, telemetry_rate_hz: float, cache_path: str,
+                 initializer):
+    """Worker process: connect to the devices of one bus, publish their status,
+    and run commands sent by the parent."""
+    if initializer is not None:
+        initializer()
+    try:
+        rig = Rig(config, cache_path)
+    except Exception as e:
+        conn.send(('error', e))
+        return
+    conn.send(('ready', None))
+    shm, table = _open_table(table_name, table_rows)
+    poller = _SharedTablePoller(table, {rig[name]: row
+                                        for name, row in rows.items()},
+                                rate_hz=telemetry_rate_hz)
+    for name in rows:
+        poller.add_device(rig[name])
+    poller.start()
+    # One thread per device: commands to a device run in order, while a
+    # blocking command to one device doesn't hold up the others.
+    executors = {name: ThreadPoolExecutor(max_workers=1)
+                 for name in rig.devices}
+    send_lock = threading.Lock()
+
+    def run(request_id: int, name: str, method: str, args, kwargs):
+        try:
+            reply = (request_id, True,
+                     getattr(rig[name], method)(*args, **kwargs))
+        except Exception as e:
+            reply = (request_id, False, e)
+        with send_lock:
+            try:
+                conn.send(reply)
+            except Exception as e:  # i.e: an unpicklable result.
+                conn.send((request_id, False, RuntimeError(
+                    f"Could not return the result of {name}.{method}: {e}")))
+
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:  # The parent exited.
+                break
+            if message is None:
+                break
+            executors[message[1]].submit(run, *message)
+    finally:
+        poller.stop()
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+        rig.close()
+        del table
+        shm.close()
+
+
+class _Worker:
+    """Parent-side handle on a worker process."""
+
+    def __init__(self, port: str, process, conn):
+        self.port = port
+        self.process = process
+        self.conn = conn
+        self.futures = {}  # request id -> Future.
+        self.lock = threading.Lock()
+        self.receiver = None
+
+    def submit(self, name: str, method: str, args, kwargs):
+        future = Future()
+        with self.lock:
+            if self.receiver is None or not self.receiver.is_alive():
+                raise SerialException(f"Worker process for {self.port} is not "
+                                      "running.")
+            request_id = id(future)
+            self.futures[request_id] = future
+            self.conn.send((request_id, name, method, args, kwargs))
+        return future
+
+    def receive(self):
+        while True:
+            try:
+                request_id, ok, result = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self.lock:
+                future = self.futures.pop(request_id)
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+        with self.lock:
+            futures, self.futures = self.futures, {}
+        for future in futures.values():
+            future.set_exception(SerialException(
+                f"Worker process for {self.port} exited."))
+
+
+class DeviceProxy:
+    """Stand-in for a device that lives in a worker process.
+
+    Device methods called on the proxy run in the worker and block until they
+    return (i.e: ``pump.move_absolute_in_percent(50)``). :meth:`submit` runs
+    one without blocking, and :meth:`status` reads the latest telemetry
+    sample straight from shared memory.
+    """
+
+    def __init__(self, backend, worker: _Worker, name: str, row: int,
+                 channels: list):
+        self._backend = backend
+        self._worker = worker
+        self.name = name
+        self.row = row
+        self.channels = channels
+
+    def __getattr__(self, method: str):
+        if method.startswith("_"):
+            raise AttributeError(method)
+        return functools.partial(self.call, method)
+
+    def submit(self, method: str, *args, **kwargs):
+        """Run a device method in the worker. Return a
+        :class:`~concurrent.futures.Future` of its result."""
+        return self._worker.submit(self.name, method, args, kwargs)
+
+    def call(self, method: str, *args, **kwargs):
+        return self.submit(method, *args, **kwargs).result()
+
+    def status(self):
+        """Return the latest telemetry sample as a dict or None if none has
+        been taken yet."""
+        return self._backend._read_row(self.row, self.channels)
+
+
+class ProcessBackend:
+    """A rig whose buses each run in their own worker process.
+
+    A single process becomes CPU-bound (on framing, parsing, and logging) with
+    many busy buses. Here, each port gets a worker process that connects to
+    its devices (as :class:`~runze_control.rig.Rig` does) and runs the
+    commands issued through :class:`DeviceProxy` objects. Each worker also
+    polls its devices' telemetry channels and publishes every sample to a
+    status table in shared memory, so reading live positions and motor
+    statuses takes no round trip to the worker.
+
+    Under the ``spawn`` start method, `initializer` must be importable (i.e:
+    a module-level function).
+    """
+
+    def __init__(self, config: dict, cache_path: str = None,
+                 telemetry_rate_hz: float = TelemetryPoller.DEFAULT_RATE_HZ,
+                 initializer=None, start_method: str = None):
+        """Init and start one worker process per port.
+
+        :param config: parsed rig file (see :func:`~runze_control.rig.load_config`).
+        :param cache_path: optional discovery cache file.
+        :param telemetry_rate_hz: status table update rate per device.
+        :param initializer: optional callable run first in each worker.
+        :param start_method: multiprocessing start method. Defaults to the
+            platform default.
+        """
+        devices = config['devices']
+        for name, settings in devices.items():
+            if settings.get('model') not in MODELS:
+                raise ValueError(f"Device {name} has an unknown model: "
+                                 f"{settings.get('model')}. Must be one of: "
+                                 f"{list(MODELS)}.")
+        start_s = perf_counter()
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=max(len(devices), 1) * STATUS_DTYPE.itemsize)
+        self._table = np.ndarray(len(devices), dtype=STATUS_DTYPE,
+                                 buffer=self._shm.buf)
+        self._table[:] = 0
+        self._table['time_s'] = np.nan
+        rows = {name: row for row, name in enumerate(devices)}
+        by_port = {}
+        for name, settings in devices.items():
+            by_port.setdefault(settings['port'], []).append(name)
+        context = multiprocessing.get_context(start_method)
+        self.workers = {}  # port -> _Worker.
+        for port, names in by_port.items():
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_worker_main, daemon=True, name=f"bus {port}",
+                args=(child_conn, {'devices': {n: devices[n] for n in names}},
+                      self._shm.name, {n: rows[n] for n in names},
+                      len(devices), telemetry_rate_hz, cache_path,
+                      initializer))
+            process.start()
+            child_conn.close()
+            self.workers[port] = _Worker(port, process, parent_conn)
+        self.errors = {}  # port -> exception.
+        for port, worker in self.workers.items():
+            try:
+                state, error = worker.conn.recv()
+            except EOFError:
+                state, error = 'error', SerialException("Worker process died.")
+            if state == 'error':
+                self.errors[port] = error
+                continue
+            worker.receiver = threading.Thread(target=worker.receive,
+                                               daemon=True)
+            worker.receiver.start()
+        self.devices = {}
+        for port, names in by_port.items():
+            for name in names:
+                self.devices[name] = DeviceProxy(
+                    self, self.workers[port], name, rows[name],
+                    _device_channels(devices[name]['model']))
+        self.connect_s = perf_counter() - start_s
+        logger.info(f"Started {len(self.workers)} worker process(es) for "
+                    f"{len(devices)} device(s) in {self.connect_s:.2f}[s].")
+        if self.errors:
+            self.close()
+            raise SerialException("Could not connect to: " + ", ".join(
+                f"{port} ({error})" for port, error in self.errors.items()))
+
+    @classmethod
+    def from_file(cls, path: str, **kwds):
+        from runze_control.rig import load_config
+        return cls(load_config(path), **kwds)
+
+    def __getitem__(self, name: str):
+        return self.devices[name]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def statuses(self):
+        """Return the latest telemetry sample of every device (see
+        :meth:`DeviceProxy.status`)."""
+        return {name: proxy.status() for name, proxy in self.devices.items()}
+
+    def _read_row(self, row: int, channels: list):
+        table = self._table
+        while True:
+            seq = table['seq'][row]
+            if seq % 2:  # Mid-write.
+                continue
+            sample = table[row].copy()
+            if table['seq'][row] == seq:
+                break
+        if np.isnan(sample['time_s']):
+            return None
+        return {'time_s': sample['time_s'].item(),
+                **{name: sample[name].item() for name in channels}}
+
+    def close(self):
+        """Stop every worker process (after its pending commands finish)."""
+        for worker in self.workers.values():
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self.workers.values():
+            worker.process.join()
+            if worker.receiver is not None:
+                worker.receiver.join()
+            worker.conn.close()
+        self.workers = {}
+        if self._shm is not None:
+            del self._table
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
@@ -1,5 +1,6 @@
 """Protocol codes common to all devices"""
 from enum import Enum, IntEnum
+from runze_control.protocol_codes import registry
 
 
 class CommonCmd(IntEnum):
@@ -8,9 +9,22 @@ class CommonCmd(IntEnum):
     GetRS485Baudrate = 0x22
     GetCanBaudRate = 0x23
 
+    GetPowerOnReset = 0x2E
     GetCanDestinationAddress = 0x30
     GetFirmwareVersion = 0x3F
 
+    GetMulticastChannel1Address = 0x70
+    GetMulticastChannel2Address = 0x71
+    GetMulticastChannel3Address = 0x72
+    GetMulticastChannel4Address = 0x73
+
+
+MODEL = 'common'
+
+# Base layer of every model's command table (see registry.py).
+COMMANDS = dict(CommonCmd.__members__)
+KINDS = dict.fromkeys(COMMANDS, registry.QUERY)
+
 
 class FactoryCmd(IntEnum):
     """Codes for specifying the states of various calibration settings."""
@@ -0,0 +1,101 @@
+"""Registry of the Common Command tables of every supported device model.
+
+A model's table is declared as a stack of layers, from general to specific
+(i.e: codes common to all devices, then to all syringe pumps, then to the
+model itself). Each layer is a codes module with a `COMMANDS` dict (name ->
+code). Tables are built and validated on first use only and then cached, so
+importing a codes module costs nothing until its `CommonCmd` is needed.
+
+A layer may not silently change a code declared by an earlier layer (list it
+in the layer's `OVERRIDES` to do so), and two names may not share a code
+within one table (list the second name in its layer's `ALIASES` if they
+really are the same command).
+
+Each layer also declares the kind of each of its commands in a `KINDS` dict
+(name -> :data:`QUERY`, :data:`ABSOLUTE`, or :data:`RELATIVE`), which tells
+whether a command is safe to resend when its reply is lost.
+"""
+from enum import IntEnum
+from functools import lru_cache
+from importlib import import_module
+
+# Command kinds.
+QUERY = 'query'  # Reads state. Safe to resend.
+ABSOLUTE = 'absolute'  # Sets an absolute target (position, port, speed) or
+                       # stops. Resending it ends in the same state.
+RELATIVE = 'relative'  # Moves relative to the current position. Resending it
+                       # moves twice.
+
+# Model -> codes modules (layers), from general to specific.
+MODELS = \
+{
+    'common': ('common_codes',),
+    'syringe_pump': ('common_codes', 'syringe_pump_codes'),
+    'SY08': ('common_codes', 'syringe_pump_codes', 'sy08_codes'),
+    'MiniSY04': ('common_codes', 'syringe_pump_codes', 'mini_sy04_codes'),
+    'SY01B': ('common_codes', 'syringe_pump_codes', 'sy01_codes'),
+    'SV-04': ('common_codes', 'rotary_valve_codes'),
+}
+
+
+@lru_cache(maxsize=None)
+def command_table(model: str):
+    """Return the (cached) `CommonCmd` IntEnum of a model."""
+    if model not in MODELS:
+        raise ValueError(f"Unknown model: {model}. Must be one of: "
+                         f"{list(MODELS)}.")
+    layers = [import_module(f"{__package__}.{name}") for name in MODELS[model]]
+    commands = {}
+    names_by_code = {}
+    for layer in layers:
+        overrides = getattr(layer, 'OVERRIDES', set())
+        aliases = getattr(layer, 'ALIASES', set())
+        for name, code in layer.COMMANDS.items():
+            code = int(code)
+            if name in commands and commands[name] != code \
+                    and name not in overrides:
+                raise ValueError(f"{model}: {layer.__name__} changes {name} "
+                                 f"from 0x{commands[name]:02X} to 0x{code:02X} "
+                                 "without declaring an override.")
+            other = names_by_code.get(code)
+            if other not in (None, name) and name not in aliases:
+                raise ValueError(f"{model}: {name} ({layer.__name__}) and "
+                                 f"{other} share code 0x{code:02X}.")
+            if names_by_code.get(commands.get(name)) == name:  # Overridden.
+                del names_by_code[commands[name]]
+            commands[name] = code
+            names_by_code.setdefault(code, name)
+    return IntEnum('CommonCmd', list(commands.items()),
+                   module=layers[-1].__name__)
+
+
+@lru_cache(maxsize=None)
+def command_kinds(model: str):
+    """Return a dict mapping each code in a model's table to its kind."""
+    if model not in MODELS:
+        raise ValueError(f"Unknown model: {model}. Must be one of: "
+                         f"{list(MODELS)}.")
+    kinds = {}
+    for name in MODELS[model]:
+        layer = import_module(f"{__package__}.{name}")
+        kinds.update(getattr(layer, 'KINDS', {}))
+    table = command_table(model)
+    missing = [cmd.name for cmd in table if cmd.name not in kinds]
+    if missing:
+        raise ValueError(f"{model}: no kind declared for {missing}.")
+    return {cmd.value: kinds[cmd.name] for cmd in table}
+
+
+def lazy_common_cmd(module_name: str, model: str, *aliases: str):
+    """Return a module-level ``__getattr__`` that builds the module's
+    `CommonCmd` from the registry on first access.
+
+    :param aliases: other names that resolve to `CommonCmd` (i.e: the
+        module's former per-model enum, like ``SY08CommonCmd``).
+    """
+    def __getattr__(name: str):
+        if name == 'CommonCmd' or name in aliases:
+            return command_table(model)
+        raise AttributeError(f"module {module_name!r} has no attribute "
+                             f"{name!r}")
+    return __getattr__
@@ -1,30 +1,34 @@
 """Protocol codes exclusive to SV-04 Selector Valve."""
-from enum import IntEnum
-from itertools import chain
-from runze_control.protocol_codes.common_codes import CommonCmd as RunzeCommonCmd
+from runze_control.protocol_codes import registry
 
+MODEL = 'SV-04'
 
-class RotaryValveCommonCmd(IntEnum):
-  """Runze Protocol codes shared between Rotary Valves to issue
-    when querying/specifying the states of various settings via a
-    Common Command frame. Codes common to all devices are part of
-    runze_protocol_codes.CommonCmdCode
-  """
-  # Queries
-  GetMotorStatus = 0x4A 
-  GetPortPositon = 0x3E #current channel(port) position
-    
-  # Commands
-  MoveToPort = 0xA4 #Run to port position
-  MoveBetweenPort = 0xB4 #Run in between specified ports 
-  ResetvalvePosition = 0x45  # Move Valve to start position
-  ForceStop = 0x49
-  
+# Runze Protocol codes shared between Rotary Valves to issue when
+# querying/specifying the states of various settings via a Common Command
+# frame. Codes common to all devices are part of common_codes.CommonCmd.
+COMMANDS = \
+{
+    # Queries
+    'GetMotorStatus': 0x4A,
+    'GetPortPositon': 0x3E,  # current channel(port) position
 
-# FIXME: we should be doing dict-like updates here so that later cmds with
-#   the same name overwrite the previous cmd since we are building these
-#   containers of codes general-to-specific.
-# Combine enums
-# https://stackoverflow.com/a/41807919/3312269
-CommonCmd = IntEnum('CommonCmd',
-                    [(i.name, i.value) for i in chain(RunzeCommonCmd, RotaryValveCommonCmd)])
+    # Commands
+    'MoveToPort': 0xA4,  # Run to port position
+    'MoveBetweenPort': 0xB4,  # Run in between specified ports
+    'ResetvalvePosition': 0x45,  # Move Valve to start position
+    'ForceStop': 0x49,
+}
+
+KINDS = \
+{
+    'GetMotorStatus': registry.QUERY,
+    'GetPortPositon': registry.QUERY,
+    'MoveToPort': registry.ABSOLUTE,
+    'MoveBetweenPort': registry.ABSOLUTE,
+    'ResetvalvePosition': registry.ABSOLUTE,
+    'ForceStop': registry.ABSOLUTE,
+}
+
+# CommonCmd (common + rotary valve codes) is built on first use.
+# RotaryValveCommonCmd is kept as an alias of it.
+__getattr__ = registry.lazy_common_cmd(__name__, MODEL, 'RotaryValveCommonCmd')
@@ -1,39 +1,49 @@
 """Protocol codes exclusive to SY01B multichannel Syringe Pumps."""
-from enum import IntEnum
-from itertools import chain
-from runze_control.protocol_codes.syringe_pump_codes import CommonCmd as SyringeCommonCmd
+from runze_control.protocol_codes import registry
 
+MODEL = 'SY01B'
 
-# WARNING: the names of these enums are shared with SyringePumpCommonCmd,
-#   but not all values are the same!
-
-class SY01CommonCmd(IntEnum):
-    """Codes to issue when querying/specifying the states of various settings
-       via a Common Command frame."""
+# Codes to issue when querying/specifying the states of various settings via a
+# Common Command frame.
+# WARNING: some names are shared with other syringe pumps, but not all values
+#   are the same (i.e: RunInCCW is 0x4D on the SY08 and 0x43 here, where 0x4D
+#   is GetValveStatus). Each model has its own table (see registry.py).
+COMMANDS = \
+{
     # Queries
-    # Cmds 0x20 - 0x23 come from RunzeCommonCmd
-    GetPowerOnResetState = 0x2E
-    GetCurrentChannelAddress = 0xAE
+    # Cmds 0x20 - 0x23 come from common_codes.
+    'GetPowerOnResetState': 0x2E,
+    'GetCurrentChannelAddress': 0xAE,
+    'GetValveStatus': 0x4D,
 
-    GetValveStatus = 0x4D  # WARNING: Clashes with movement cmd for single channel syringe pump.
     # Commands
-    RunInCCW = 0x43  # Move valve counterclockwise a specified number of encoder
-                     # steps.
-    MoveValveToPort = 0x44  # Move valve to the port specified by B4. The
-                            # approach direction is determined automatically.
-                            # Values range from 1-N, where N is the number of
-                            # ports. Approach direction cannot be specified.
-    ResetValvePosition = 0x4C  # Move valve to reset position and stop.
-    MovePlungerAbsolute = 0x4E  # Move syringe plunger to an absolute position
-                                # in steps [0-6000].
-    ForcedReset = 0x4F  # Move syringe plunger to the start of travel and
-                        # back off by a small amount (improves service life.)
+    'RunInCCW': 0x43,  # Move valve counterclockwise a specified number of
+                       # encoder steps.
+    'MoveValveToPort': 0x44,  # Move valve to the port specified by B4. The
+                              # approach direction is determined automatically.
+                              # Values range from 1-N, where N is the number of
+                              # ports. Approach direction cannot be specified.
+    'ResetValvePosition': 0x4C,  # Move valve to reset position and stop.
+    'MovePlungerAbsolute': 0x4E,  # Move syringe plunger to an absolute position
+                                  # in steps [0-6000].
+    'ForcedReset': 0x4F,  # Move syringe plunger to the start of travel and
+                          # back off by a small amount (improves service life.)
+}
+
+ALIASES = {'GetPowerOnResetState'}  # Same command as GetPowerOnReset.
 
+KINDS = \
+{
+    'GetPowerOnResetState': registry.QUERY,
+    'GetCurrentChannelAddress': registry.QUERY,
+    'GetValveStatus': registry.QUERY,
+    'RunInCCW': registry.RELATIVE,
+    'MoveValveToPort': registry.ABSOLUTE,
+    'ResetValvePosition': registry.ABSOLUTE,
+    'MovePlungerAbsolute': registry.ABSOLUTE,
+    'ForcedReset': registry.ABSOLUTE,
+}
 
-# FIXME: we should be doing dict-like updates here so that later cmds with
-#   the same name overwrite the previous cmd since we are building these
-#   containers of codes general-to-specific.
-# Combine enums
-# https://stackoverflow.com/a/41807919/3312269
-CommonCmd = IntEnum('CommonCmd',
-                    [(i.name, i.value) for i in chain(SyringeCommonCmd, SY01CommonCmd)])
+# CommonCmd (common + syringe pump + SY01B codes) is built on first use.
+# SY01CommonCmd is kept as an alias of it.
+__getattr__ = registry.lazy_common_cmd(__name__, MODEL, 'SY01CommonCmd')
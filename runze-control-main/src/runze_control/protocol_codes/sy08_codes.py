@@ -1,20 +1,24 @@
 """Syringe pump device codes."""
-from enum import IntEnum
-from itertools import chain
-from runze_control.protocol_codes.syringe_pump_codes import CommonCmd as SyringePumpCommonCmd
+from runze_control.protocol_codes import registry
 
+MODEL = 'SY08'
 
-class SY08CommonCmd(IntEnum):
-    """SY08-exclusive Common command codes to issue when querying/specifying
-        the states of various settings via a Common Command frame. Codes
-        common to all devices are part of runze_protocol_codes.CommonCmdCode"""
+# SY08-exclusive Common command codes to issue when querying/specifying the
+# states of various settings via a Common Command frame. Shared codes are in
+# syringe_pump_codes and common_codes.
+COMMANDS = \
+{
     # Commands
-    MoveSyringeAbsolute = 0x4E # [0x0000 - 0x2EE0]
-    RunInCCW = 0x4D
+    'MoveSyringeAbsolute': 0x4E,  # [0x0000 - 0x2EE0]
+    'RunInCCW': 0x4D,
+}
 
+KINDS = \
+{
+    'MoveSyringeAbsolute': registry.ABSOLUTE,
+    'RunInCCW': registry.RELATIVE,
+}
 
-# Combine enums
-# https://stackoverflow.com/a/41807919/3312269
-CommonCmd = IntEnum('CommonCmd',
-                    [(i.name, i.value)
-                     for i in chain(SyringePumpCommonCmd, SY08CommonCmd)])
+# CommonCmd (common + syringe pump + SY08 codes) is built on first use.
+# SY08CommonCmd is kept as an alias of it.
+__getattr__ = registry.lazy_common_cmd(__name__, MODEL, 'SY08CommonCmd')
@@ -0,0 +1,254 @@
+"""Operate many syringe pumps as one."""
+from dataclasses import dataclass
+from runze_control.syringe_pump import SyringePump
+from serial import SerialException
+from time import perf_counter, sleep
+import logging
+import numpy as np
+import threading
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_S = 0.002  # How often to check for move replies.
+
+# Commands that only finish once a follow-up command is sent after their
+# reply: method -> follow-up method.
+_FOLLOW_UPS = {'reset_syringe_position': 'synchronize_reset_position'}
+
+
+@dataclass
+class ArrayResult:
+    """Outcome of a :class:`PumpArray` operation, one entry per pump."""
+    results: np.ndarray  # Return value of each pump's call (None if failed).
+    positions_steps: np.ndarray  # Driver-side plunger position afterwards.
+    errors: list  # Exception raised by each pump (None if it succeeded).
+    duration_s: float = 0
+
+    @property
+    def ok(self):
+        """Boolean array: True where the pump succeeded."""
+        return np.array([e is None for e in self.errors], dtype=bool)
+
+    @property
+    def success(self):
+        return all(e is None for e in self.errors)
+
+    def raise_errors(self):
+        """Raise the first error (if any), listing how many pumps failed."""
+        failed = [(i, e) for i, e in enumerate(self.errors) if e is not None]
+        if failed:
+            index, error = failed[0]
+            raise RuntimeError(f"{len(failed)}/{len(self.errors)} pump(s) "
+                               f"failed. Pump {index}: {error}") from error
+        return self
+
+
+class PumpArray:
+    """A list of syringe pumps operated together, i.e: the channels of a
+    parallel dosing head.
+
+    Methods take a scalar (applied to every pump) or one value per pump, and
+    run on all pumps concurrently: one thread per bus, and on each bus every
+    pump's move is started before any reply is awaited, so pumps sharing a
+    bus move at the same time too. Their replies are told apart by address
+    (see :class:`~runze_control.transport.SharedConnection`), so pumps on one
+    bus must have distinct addresses. Each method returns an
+    :class:`ArrayResult`; a pump that fails does not stop the others.
+
+    With ``wait=False``, methods return as soon as every move has started.
+    Call :meth:`wait` to block until they have all finished.
+
+    .. Note::
+       Moves are started without waiting for their reply, so a lost reply or
+       a stall fails that pump instead of being retried or recovered (see
+       :class:`~runze_control.recovery.RecoveryEngine`).
+    """
+
+    def __init__(self, pumps: list):
+        self.pumps = list(pumps)
+        addresses = set()
+        for pump in self.pumps:
+            if not isinstance(pump, SyringePump):
+                raise ValueError(f"{pump.__class__.__name__} is not a "
+                                 "syringe pump.")
+            if (pump.bus, pump.address) in addresses:
+                raise ValueError(f"More than one pump at address "
+                                 f"{pump.address} on {pump.bus.com_port}.")
+            addresses.add((pump.bus, pump.address))
+        self._pending = {}  # pump index -> (method, start time) of a move
+                            # whose reply hasn't been collected.
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pumps)
+
+    def __getitem__(self, index):
+        return self.pumps[index]
+
+    def __iter__(self):
+        return iter(self.pumps)
+
+    @property
+    def positions_steps(self):
+        """Driver-side plunger positions [steps]."""
+        return np.array([p.driver_steps for p in self.pumps])
+
+    def _broadcast(self, values):
+        values = np.asarray(values)
+        try:
+            return np.broadcast_to(values, (len(self.pumps),))
+        except ValueError:
+            raise ValueError(f"Expected a scalar or {len(self.pumps)} values, "
+                             f"got shape {values.shape}.")
+
+    def _by_bus(self, indices):
+        by_bus = {}
+        for index in indices:
+            by_bus.setdefault(self.pumps[index].bus, []).append(index)
+        return by_bus.values()
+
+    def _run(self, method: str, values=None, wait: bool = True,
+             moves: bool = True):
+        """Call `method` on every pump (with its entry of `values`, if any),
+        concurrently across buses.
+
+        :param moves: if True, `method` takes a `wait` argument. It is started
+            on every pump of a bus before any reply is collected.
+        """
+        start_s = perf_counter()
+        if self._pending:  # Moves started with wait=False.
+            self.wait()
+        values = None if values is None else self._broadcast(values)
+        count = len(self.pumps)
+        results = np.empty(count, dtype=object)
+        errors = [None] * count
+
+        def run_bus(indices: list):
+            for index in indices:
+                pump = self.pumps[index]
+                args = () if values is None else (values[index].item(),)
+                try:
+                    if moves:
+                        results[index] = getattr(pump, method)(*args,
+                                                               wait=False)
+                        if pump.cmd_send_time_s is not None:  # Reply due.
+                            with self._lock:
+                                self._pending[index] = (method,
+                                                        pump.cmd_send_time_s)
+                    else:
+                        results[index] = getattr(pump, method)(*args)
+                except Exception as e:
+                    errors[index] = e
+            if moves and wait:
+                self._collect(indices, errors)
+
+        self._fan_out(run_bus, range(count))
+        result = ArrayResult(results, self.positions_steps, errors,
+                             perf_counter() - start_s)
+        self._log_errors(method, result)
+        return result
+
+    def _fan_out(self, run_bus, indices):
+        threads = [threading.Thread(target=run_bus, args=(list(bus_indices),),
+                                    daemon=True)
+                   for bus_indices in self._by_bus(indices)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _collect(self, indices: list, errors: list):
+        """Wait for the replies of the pending moves of some pumps (all on
+        one bus)."""
+        with self._lock:
+            pending = [i for i in indices if i in self._pending]
+        while pending:
+            for index in list(pending):
+                pump = self.pumps[index]
+                with self._lock:
+                    method, sent_s = self._pending[index]
+                try:
+                    # Only this pump's replies (routed by address).
+                    reply = pump._get_reply(pump.protocol, wait=False)
+                    if not len(reply):
+                        if perf_counter() - sent_s < pump.LONG_TIMEOUT_S:
+                            continue
+                        pump.cmd_send_time_s = None
+                        raise SerialException("No reply received from "
+                                              "device.")
+                    pump._parse_runze_reply(reply)
+                    if method in _FOLLOW_UPS:
+                        getattr(pump, _FOLLOW_UPS[method])()
+                    pump._save_state()
+                except Exception as e:
+                    errors[index] = e
+                pending.remove(index)
+                with self._lock:
+                    del self._pending[index]
+            if pending:
+                sleep(POLL_INTERVAL_S)
+
+    def wait(self):
+        """Block until every move started with ``wait=False`` has finished.
+        Return an :class:`ArrayResult` with the errors of those moves."""
+        start_s = perf_counter()
+        errors = [None] * len(self.pumps)
+        with self._lock:
+            indices = list(self._pending)
+        self._fan_out(lambda bus_indices: self._collect(bus_indices, errors),
+                      indices)
+        result = ArrayResult(np.full(len(self.pumps), None, dtype=object),
+                             self.positions_steps, errors,
+                             perf_counter() - start_s)
+        self._log_errors("wait", result)
+        return result
+
+    def _log_errors(self, method: str, result: ArrayResult):
+        for index, error in enumerate(result.errors):
+            if error is not None:
+                pump = self.pumps[index]
+                logger.error(f"{method} failed on pump {index} (address "
+                             f"{pump.address} on {pump.bus.com_port}): "
+                             f"{error}")
+
+    # Moves.
+    def aspirate(self, microliters, wait: bool = True):
+        return self._run('aspirate', microliters, wait)
+
+    def withdraw(self, microliters, wait: bool = True):
+        return self._run('withdraw', microliters, wait)
+
+    def dispense(self, microliters, wait: bool = True):
+        return self._run('dispense', microliters, wait)
+
+    def aspirate_steps(self, steps, wait: bool = True):
+        return self._run('aspirate_steps', steps, wait)
+
+    def dispense_steps(self, steps, wait: bool = True):
+        return self._run('dispense_steps', steps, wait)
+
+    def move_absolute_in_steps(self, steps, wait: bool = True):
+        return self._run('move_absolute_in_steps', steps, wait)
+
+    def move_absolute_in_percent(self, percent, wait: bool = True):
+        return self._run('move_absolute_in_percent', percent, wait)
+
+    def set_speed_percent(self, percent, wait: bool = True):
+        return self._run('set_speed_percent', percent, wait)
+
+    def reset_syringe_position(self, wait: bool = True):
+        return self._run('reset_syringe_position', wait=wait)
+
+    # Queries.
+    def get_position_steps(self):
+        """Read every plunger position from the devices."""
+        return self._run('get_position_steps', moves=False)
+
+    def get_motor_status(self):
+        return self._run('get_motor_status', moves=False)
+
+    def force_stop(self):
+        """Halt every pump."""
+        with self._lock:
+            self._pending.clear()  # Stopping consumes the move replies.
+        return self._run('force_stop', moves=False)
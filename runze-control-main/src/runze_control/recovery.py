@@ -0,0 +1,177 @@
+"""Recover from device faults (i.e: a stalled motor) and resume the command
+that was interrupted."""
+from collections import deque
+from dataclasses import dataclass, field
+from runze_control.journal import Journal
+from runze_control.runze_device import DeviceError, RunzeDevice
+from runze_control.runze_protocol import ReplyStatus
+from time import perf_counter, time
+import threading
+
+# Recovery actions, run in this order.
+REHOME = 'rehome'  # Home the plunger and/or valve.
+RESTORE_SPEED = 'restore_speed'  # Re-apply the speed from before the fault.
+RESTORE_POSITION = 'restore_position'  # Move back to where the device was
+                                       # before the interrupted command.
+RETRY = 'retry'  # Issue the interrupted command again.
+ACTIONS = (REHOME, RESTORE_SPEED, RESTORE_POSITION, RETRY)
+
+DEFAULT_ACTIONS = \
+{
+    ReplyStatus.MotorStalled: ACTIONS,
+    ReplyStatus.OptocouplerError: ACTIONS,
+    ReplyStatus.UnknownLocations: ACTIONS,
+}
+
+
+@dataclass
+class RecoveryPolicy:
+    """What to do about each fault, and how often."""
+    # Reply status -> actions. Faults not listed are raised as usual.
+    actions: dict = field(default_factory=lambda: dict(DEFAULT_ACTIONS))
+    max_attempts: int = 2  # Recoveries per interrupted command.
+    max_recoveries: int = 5  # Recoveries per device within `window_s`.
+    window_s: float = 3600.0
+
+    def __post_init__(self):
+        for status, actions in self.actions.items():
+            unknown = set(actions) - set(ACTIONS)
+            if unknown:
+                raise ValueError(f"Unknown recovery action(s) for "
+                                 f"{ReplyStatus(status).name}: {unknown}. "
+                                 f"Must be among: {ACTIONS}.")
+
+
+class RecoveryEngine:
+    """Recovers attached devices from faults instead of failing the command.
+
+    When a command to an attached device is answered with a fault listed in
+    the policy, the engine runs the fault's actions (i.e: re-homes the
+    device, restores its speed and its position from before the command, and
+    issues the command again) and returns the retried command's reply, so
+    the caller carries on as if nothing happened. Only commands that wait for
+    their reply are recovered.
+
+    If the retried command faults again, recovery repeats up to
+    `max_attempts` times. A device that needs more than `max_recoveries`
+    recoveries within `window_s` is left alone (its faults are raised), since
+    it likely needs servicing. Every recovery is logged and kept in
+    `records`, and appended to an audit file (one JSON record per line) if
+    one is given.
+
+    .. Note::
+       Re-homing a syringe empties it through the port its valve is at.
+    """
+
+    RECORD_HISTORY = 1000  # Audit records kept in memory.
+
+    def __init__(self, policy: RecoveryPolicy = None, audit_path: str = None):
+        self.policy = policy or RecoveryPolicy()
+        self.journal = Journal(audit_path) if audit_path else None
+        self.records = deque(maxlen=self.RECORD_HISTORY)
+        self._recoveries = {}  # device -> deque of recovery start times.
+        self._lock = threading.Lock()
+
+    def attach(self, device: RunzeDevice):
+        """Recover `device` from faults from now on."""
+        device.recovery = self
+
+    def detach(self, device: RunzeDevice):
+        if device.recovery is self:
+            device.recovery = None
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _reserve(self, device: RunzeDevice):
+        """Count a recovery against the device's budget. Return False if the
+        budget is spent."""
+        now_s = perf_counter()
+        with self._lock:
+            history = self._recoveries.setdefault(device, deque())
+            while history and now_s - history[0] > self.policy.window_s:
+                history.popleft()
+            if len(history) >= self.policy.max_recoveries:
+                return False
+            history.append(now_s)
+            return True
+
+    def recover(self, device: RunzeDevice, error: DeviceError, func: int,
+                b3: int, b4: int):
+        """Recover from `error`, raised by the command `func` (with parameter
+        bytes `b3` and `b4`). Return the reply of the retried command, or
+        None if the policy doesn't retry it. Raise `error` (or whatever
+        stopped the recovery) if it can't be recovered."""
+        cmd = device.codes.CommonCmd._value2member_map_.get(func)
+        command = cmd.name if cmd is not None else f"0x{func:02X}"
+        if error.status not in self.policy.actions:
+            raise error
+        state = device._get_state()  # From before the interrupted command.
+        attempt = 0
+        while True:
+            attempt += 1
+            actions = self.policy.actions[error.status]
+            record = {'time': time(), 'port': device.bus.com_port,
+                      'address': device.address,
+                      'device': device.__class__.__name__,
+                      'command': command, 'parameter': b3 | (b4 << 8),
+                      'fault': error.status.name, 'attempt': attempt,
+                      'actions': list(actions)}
+            if attempt > self.policy.max_attempts:
+                return self._give_up(device, record, "attempts exhausted",
+                                     error)
+            if not self._reserve(device):
+                return self._give_up(device, record, "recovery budget spent",
+                                     error)
+            device.log.warning(f"{command} failed with {error.status.name}. "
+                               f"Recovering ({', '.join(actions)}; attempt "
+                               f"{attempt}/{self.policy.max_attempts}).")
+            start_s = perf_counter()
+            device._recovering = True
+            try:
+                if REHOME in actions:
+                    device._rehome()
+                if RESTORE_SPEED in actions:
+                    device._restore_speed(state)
+                if RESTORE_POSITION in actions:
+                    device._restore_position(state)
+                reply = device._send_common_cmd_frame_runze(func, b3, b4) \
+                    if RETRY in actions else None
+            except DeviceError as e:
+                record['duration_s'] = perf_counter() - start_s
+                if e.status in self.policy.actions:  # Try again.
+                    self._audit(device, {**record, 'outcome': 'failed',
+                                         'error': str(e)})
+                    error = e
+                    continue
+                return self._give_up(device, record, str(e), error)
+            except Exception as e:
+                record['duration_s'] = perf_counter() - start_s
+                return self._give_up(device, record, str(e) or repr(e), error)
+            finally:
+                device._recovering = False
+            record['duration_s'] = perf_counter() - start_s
+            self._audit(device, {**record, 'outcome': 'recovered'})
+            return reply
+
+    def _give_up(self, device: RunzeDevice, record: dict, reason: str,
+                 error: Exception):
+        self._audit(device, {**record, 'outcome': 'gave up', 'error': reason})
+        device.log.error(f"Not recovering from {record['fault']} "
+                         f"({record['command']}): {reason}.")
+        raise error
+
+    def _audit(self, device: RunzeDevice, record: dict):
+        self.records.append(record)
+        if self.journal is not None:
+            self.journal.append(record)
+        if record['outcome'] == 'recovered':
+            device.log.warning(f"Recovered from {record['fault']} in "
+                               f"{record['duration_s']:.2f}[s].")
@@ -0,0 +1,202 @@
+"""Bring up every device of an instrument from a rig file."""
+from runze_control.multichannel_syringe_pump import SY01B
+from runze_control.rotary_valve import RotaryValve
+from runze_control.syringe_pump import SY08, MiniSY04
+from runze_control.transport import usb_serial_number
+from serial import SerialException
+from time import perf_counter
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Rig file model name -> device class.
+MODELS = \
+{
+    'SY08': SY08,
+    'MiniSY04': MiniSY04,
+    'SY01B': SY01B,
+    'RotaryValve': RotaryValve,
+}
+
+# Optional rig file settings passed to the device constructor.
+DEVICE_KWARGS = ('syringe_volume_ul', 'position_count', 'position_map')
+
+
+def load_config(path: str):
+    """Read a rig file (JSON, or TOML if the path ends in .toml)."""
+    if str(path).lower().endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11.
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError("Reading TOML rig files requires Python 3.11+ "
+                                 "or the tomli package.")
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def port_key(port: str):
+    """Identify a port across reboots: by the USB serial number of a local
+    port (its name may change) or by the url itself."""
+    serial_number = usb_serial_number(port)
+    return port if serial_number is None else f"usb:{serial_number}"
+
+
+class DiscoveryCache:
+    """Baud rate and device addresses found on each port, kept in a JSON file
+    (written atomically)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.ports = {}  # port key -> {'baudrate': int, 'addresses': {...}}
+        try:
+            with open(path, 'r') as f:
+                self.ports = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.warning(f"Ignoring unreadable discovery cache: {path}.")
+
+    def get(self, key: str):
+        with self._lock:
+            return dict(self.ports.get(key, {}))
+
+    def update(self, key: str, baudrate: int, addresses: dict):
+        with self._lock:
+            entry = {'baudrate': baudrate, 'addresses': addresses}
+            if self.ports.get(key) == entry:
+                return
+            try:  # Keep entries written meanwhile by other processes.
+                with open(self.path, 'r') as f:
+                    self.ports = {**self.ports, **json.load(f)}
+            except (FileNotFoundError, ValueError):
+                pass
+            self.ports[key] = entry
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.ports, f, indent=2, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+
+class Rig:
+    """All devices of an instrument, described by a rig file and connected
+    concurrently.
+
+    A rig file lists each device by name::
+
+        {
+          "devices": {
+            "pump_a": {"model": "SY08", "port": "COM3", "address": 0,
+                       "syringe_volume_ul": 5000,
+                       "calibration": "pump_a_calibration.json"},
+            "selector": {"model": "RotaryValve", "port": "COM4", "address": 1,
+                         "position_count": 10,
+                         "position_map": {"waste": 1, "reagent_a": 3}}
+          }
+        }
+
+    `baudrate` and `address` are optional. Ports are brought up in parallel
+    (devices on the same port one after another). With a discovery cache, the
+    baud rate (and any unspecified address) found on each port last time is
+    tried first, so no baud rates need probing. Full discovery only runs if
+    the cached settings no longer work.
+    """
+
+    def __init__(self, config: dict, cache_path: str = None):
+        """Init and connect every device.
+
+        :param config: parsed rig file (see :func:`load_config`).
+        :param cache_path: optional discovery cache file.
+        """
+        self.config = config['devices']
+        for name, settings in self.config.items():
+            if settings.get('model') not in MODELS:
+                raise ValueError(f"Device {name} has an unknown model: "
+                                 f"{settings.get('model')}. Must be one of: "
+                                 f"{list(MODELS)}.")
+        self.cache = DiscoveryCache(cache_path) if cache_path else None
+        self.devices = {}
+        self.errors = {}  # Device name -> exception.
+        self.connect_s = None
+        self._connect()
+
+    @classmethod
+    def from_file(cls, path: str, cache_path: str = None):
+        return cls(load_config(path), cache_path)
+
+    def __getitem__(self, name: str):
+        return self.devices[name]
+
+    def close(self):
+        for device in self.devices.values():
+            device.close()
+
+    def _connect(self):
+        start_s = perf_counter()
+        by_port = {}
+        for name, settings in self.config.items():
+            by_port.setdefault(settings['port'], []).append(name)
+        threads = [threading.Thread(target=self._connect_port,
+                                    args=(port, names), daemon=True)
+                   for port, names in by_port.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.connect_s = perf_counter() - start_s
+        logger.info(f"Connected {len(self.devices)}/{len(self.config)} "
+                    f"device(s) on {len(by_port)} port(s) in "
+                    f"{self.connect_s:.2f}[s].")
+        if self.errors:
+            raise SerialException("Could not connect to: " + ", ".join(
+                f"{name} ({error})" for name, error in self.errors.items()))
+
+    def _connect_port(self, port: str, names: list):
+        key = port_key(port) if self.cache else None
+        cached = self.cache.get(key) if self.cache else {}
+        baudrate = cached.get('baudrate')
+        addresses = cached.get('addresses', {})
+        for name in names:
+            settings = self.config[name]
+            try:
+                device = self._connect_device(name, settings, baudrate,
+                                              addresses.get(name))
+            except Exception as e:
+                self.errors[name] = e
+                continue
+            self.devices[name] = device
+            baudrate = device.bus.baudrate  # Skip probing the next devices.
+            addresses[name] = device.address
+        if self.cache and baudrate is not None:
+            self.cache.update(key, baudrate, addresses)
+
+    def _connect_device(self, name: str, settings: dict, cached_baudrate: int,
+                        cached_address: int):
+        cls = MODELS[settings['model']]
+        kwargs = {k: settings[k] for k in DEVICE_KWARGS if k in settings}
+        baudrate = settings.get('baudrate', cached_baudrate)
+        address = settings.get('address', cached_address)
+        try:
+            device = cls(settings['port'], baudrate=baudrate, address=address,
+                         **kwargs)
+        except (SerialException, ValueError) as e:
+            if baudrate == settings.get('baudrate') \
+                    and address == settings.get('address'):
+                raise  # Nothing cached to fall back from.
+            logger.warning(f"Cached settings for {name} are stale ({e}). "
+                           "Running full discovery.")
+            device = cls(settings['port'], baudrate=settings.get('baudrate'),
+                         address=settings.get('address'), **kwargs)
+        if 'calibration' in settings:
+            device.set_calibration(settings['calibration'])
+        return device
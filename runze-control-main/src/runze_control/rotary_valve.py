@@ -9,36 +9,135 @@ from typing import Union
 
 class RotaryValve(RunzeDevice):
 
+    DEFAULT_POSITION_COUNT = 10
+
+    STATUS_QUERIES = \
+    {
+        **RunzeDevice.STATUS_QUERIES,
+        'motor_status': (('GetMotorStatus',), ReplyStatus),
+        'port_position': (('GetPortPositon',), int),
+    }
+
     def __init__(self, com_port: str, baudrate: int = None, address: int = 0x31,
                  protocol: Union[str, Protocol] = Protocol.RUNZE,
                  position_count: int = None, position_map: dict = None):
+        """Init.
+
+        :param position_count: number of ports. Defaults to 10.
+        :param position_map: optional dict mapping port names to port numbers.
+        """
         # Pass along unused kwargs to satisfy diamond inheritance.
         super().__init__(com_port=com_port, baudrate=baudrate,
                          address=address, protocol=protocol)
         self.codes = rotary_valve_codes
-        self.position_count = position_count
+        self.position_count = position_count or self.DEFAULT_POSITION_COUNT
         self.position_map = position_map
-    
+        self.current_port = None  # Cached port. None if unknown or parked.
+
     def get_motor_status(self):
         self.log.debug("Querying motor status.")
         reply = self._send_common_cmd_runze(self.codes.CommonCmd.GetMotorStatus)
         return reply['parameter']
 
+    def _resolve_port(self, position: Union[str, int]):
+        """Return the port number of a port number or `position_map` name."""
+        if isinstance(position, str):
+            if not self.position_map or position not in self.position_map:
+                raise ValueError(f"Port name '{position}' is not in the "
+                                 "position map.")
+            position = self.position_map[position]
+        if not (1 <= position <= self.position_count):
+            raise ValueError(f"Position must be between 1 and "
+                             f"{self.position_count}.")
+        return position
+
+    def transitions(self, start: int, end: int, clockwise: bool):
+        """Number of port transitions from `start` to `end` in one direction."""
+        if clockwise:
+            return (end - start) % self.position_count
+        return (start - end) % self.position_count
+
+    def _move(self, position: int, clockwise: bool, wait: bool = True):
+        # Parameter is the desired position (low byte) and the port after it
+        # (clockwise) or before it (counterclockwise) (high byte).
+        hint = position + 1 if clockwise else position - 1
+        param = (hint << 8) | position
+        self.current_port = None  # Unknown until the move succeeds.
+        reply = self._send_common_cmd_runze(self.codes.CommonCmd.MoveToPort,
+                                            param, wait=wait)
+        self.current_port = position
+        if wait:
+            self._save_state()
+        return reply
+
+    def _get_state(self):
+        return {'current_port': self.current_port}
+
+    def _reconcile_state(self, state: dict):
+        """The valve reports its own port, so just refresh the cache."""
+        return self.get_Port_position() == state.get('current_port')
+
+    def _resync(self):
+        self.get_Port_position()
+
+    def _rehome(self):
+        self.reset_valve_position()
+
+    def _restore_position(self, state: dict):
+        if state.get('current_port'):
+            self.move_to_port(state['current_port'])
+
     def move_clockwise_to_position(self, position: Union[str, int]):
-        if not (1<= position<= 10):
-            raise ValueError("Position must be between 1 and 10")
-        #parameter of move clockwive is desired positon + 1 and desire position 
-        param= ((position+1)<<8)| position
-        return self._send_common_cmd_runze(self.codes.RotaryValveCommonCmd.MoveToPort, param)
-    
+        return self._move(self._resolve_port(position), True)
+
     def move_counterclockwise_to_position(self, position: Union[str, int]):
-        if not (1<= position<= 10):
-            raise ValueError("Position must be between 1 and 10")
-        #parameter of move clockwive is desired positon + 1 and desire position 
-        param= ((position-1)<<8)| position
-        return self._send_common_cmd_runze(self.codes.RotaryValveCommonCmd.MoveToPort, param)
-    
+        return self._move(self._resolve_port(position), False)
+
+    def move_to_port(self, position: Union[str, int], wait: bool = True):
+        """Move to a port (number or `position_map` name) in whichever
+        direction passes the fewest ports.
+
+        The current port is cached from the last move or
+        :meth:`get_Port_position` (and queried if unknown). If the valve is
+        moved by other means, call :meth:`get_Port_position` to refresh it.
+        """
+        position = self._resolve_port(position)
+        if self.current_port is None:
+            self.get_Port_position()
+        if self.current_port == position:
+            self.log.debug(f"Already at port {position}.")
+            return None
+        clockwise = self.current_port in (None, 0) or \
+            self.transitions(self.current_port, position, True) \
+            <= self.transitions(self.current_port, position, False)
+        self.log.debug(f"Moving {'' if clockwise else 'counter'}clockwise "
+                       f"from port {self.current_port} to port {position}.")
+        return self._move(position, clockwise, wait=wait)
+
+    def move_between_ports(self, port_a: Union[str, int],
+                           port_b: Union[str, int], wait: bool = True):
+        """Park the rotor halfway between two adjacent ports (i.e: to block
+        every port)."""
+        port_a = self._resolve_port(port_a)
+        port_b = self._resolve_port(port_b)
+        if min(self.transitions(port_a, port_b, True),
+               self.transitions(port_a, port_b, False)) != 1:
+            raise ValueError(f"Ports {port_a} and {port_b} are not adjacent.")
+        self.current_port = None
+        return self._send_common_cmd_runze(
+            self.codes.CommonCmd.MoveBetweenPort, (port_b << 8) | port_a,
+            wait=wait)
+
+    def reset_valve_position(self, wait: bool = True):
+        """Move the valve to its reset position."""
+        self.log.debug("Resetting valve position.")
+        self.current_port = None
+        return self._send_common_cmd_runze(
+            self.codes.CommonCmd.ResetvalvePosition, wait=wait)
+
     def get_Port_position(self):
         self.log.debug("Querying Port position.")
         reply = self._send_common_cmd_runze(self.codes.CommonCmd.GetPortPositon)
-        return reply['parameter']
+        port = reply['parameter']
+        self.current_port = port if 1 <= port <= self.position_count else None
+        return port
@@ -0,0 +1,210 @@
+"""Route liquid through a manifold of valves, pumps, and tubing.
+
+The manifold is a weighted graph. Every selector valve (stand-alone or built
+into a multichannel syringe pump) contributes a common port and its outer
+ports; tubing connects any two ports or named terminals (reservoirs, waste,
+outlets, ...). A route through a valve connects the common port to exactly
+one outer port, which sets the valve position that the route requires.
+"""
+from dataclasses import dataclass, field
+from runze_control import sv_device_codes
+from typing import Hashable
+import heapq
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+COMMON_PORT = 0  # Port index of a valve's common (center) port. For a
+                 # multichannel syringe pump, this is the syringe.
+
+
+@dataclass
+class _Valve:
+    name: str
+    position_count: int
+    dead_volume_ul: float
+    port_switch_s: float
+    device: object  # Optional device driver (i.e: a RotaryValve).
+    position: int = None  # Last known position (used if device has none).
+
+
+@dataclass
+class Route:
+    """A route between two nodes of a :class:`FluidicGraph`."""
+    nodes: list  # Nodes from source to destination.
+    valve_positions: list = field(default_factory=list)  # (valve, port) pairs
+                                                         # in path order.
+    dead_volume_ul: float = 0
+    switch_time_s: float = 0  # Valve switching time (from the positions the
+                              # route was planned with). In port transitions
+                              # for valves without a known switching time.
+
+
+class FluidicGraph:
+    """Weighted graph of a fluidic manifold with cached route finding.
+
+    Nodes are terminal names (any hashable, i.e: "reagent_a") or
+    (valve name, port) tuples, where port :data:`COMMON_PORT` is the common
+    port.
+    """
+
+    def __init__(self):
+        self.valves = {}
+        self.edges = {}  # node -> {neighbor: tubing volume [uL]}
+        self._routes = {}  # Route cache.
+
+    def add_valve(self, name: str, position_count: int, model: str = None,
+                  dead_volume_ul: float = None, port_switch_s: float = None,
+                  device=None):
+        """Add a selector valve (or the valve of a multichannel syringe pump).
+
+        :param model: part number in :data:`sv_device_codes.DEAD_VOLUME_UL`
+            (i.e: "SV07-T10") for the port-to-port dead volume.
+        :param dead_volume_ul: port-to-port dead volume (overrides `model`).
+        :param port_switch_s: rotation time between adjacent ports. Without
+            it, time-optimal routes minimize port transitions.
+        :param device: the device driver (a
+            :class:`~runze_control.rotary_valve.RotaryValve` or a
+            :class:`~runze_control.multichannel_syringe_pump.MultiChannelSyringePump`)
+            used by :meth:`apply` and to read the current position.
+        """
+        if dead_volume_ul is None:
+            dead_volume_ul = sv_device_codes.DEAD_VOLUME_UL[model] \
+                if model is not None else 0.0
+        self.valves[name] = _Valve(name, position_count, dead_volume_ul,
+                                   port_switch_s, device)
+        for port in range(position_count + 1):
+            self.edges.setdefault((name, port), {})
+        self._routes.clear()
+
+    def connect(self, a: Hashable, b: Hashable, volume_ul: float = 0.0):
+        """Connect two nodes with tubing of the specified internal volume."""
+        for node in (a, b):
+            if isinstance(node, tuple) and node not in self.edges:
+                raise ValueError(f"Unknown valve port: {node}.")
+        self.edges.setdefault(a, {})[b] = volume_ul
+        self.edges.setdefault(b, {})[a] = volume_ul
+        self._routes.clear()
+
+    def position(self, valve_name: str):
+        """Current position of a valve (None if unknown)."""
+        valve = self.valves[valve_name]
+        # RotaryValve tracks `current_port`, MultiChannelSyringePump
+        # `valve_port`.
+        for attribute in ('current_port', 'valve_port'):
+            port = getattr(valve.device, attribute, None)
+            if port is not None:
+                return port
+        return valve.position
+
+    def _switch_cost(self, valve: _Valve, port: int):
+        current = self.position(valve.name)
+        if current == port:
+            return 0.0
+        if current is None:  # Unknown: assume the average rotation.
+            transitions = valve.position_count / 4
+        else:
+            n = valve.position_count
+            transitions = min((port - current) % n, (current - port) % n)
+        return transitions * (valve.port_switch_s or 1.0)
+
+    def route(self, source: Hashable, destination: Hashable,
+              cost: str = "dead_volume"):
+        """Return the cheapest :class:`Route` from `source` to `destination`.
+
+        :param cost: "dead_volume" (tubing plus valve dead volume) or "time"
+            (valve switching time from the current positions). Ties are broken
+            by the other cost.
+        """
+        if cost not in ("dead_volume", "time"):
+            raise ValueError(f"Cost ({cost}) must be 'dead_volume' or 'time'.")
+        # Both costs rank routes by switching time (as the cost or the
+        # tie-break), which depends on where the valves are now.
+        key = (source, destination, cost) \
+            + tuple(self.position(name) for name in self.valves)
+        route = self._routes.get(key)
+        if route is None:
+            route = self._find_route(source, destination, cost)
+            self._routes[key] = route
+        return route
+
+    def _find_route(self, source: Hashable, destination: Hashable, cost: str):
+        for node in (source, destination):
+            if node not in self.edges:
+                raise ValueError(f"Unknown node: {node}.")
+        # Dijkstra over (node, valves used so far). A valve connects its
+        # common port to one outer port at a time, so a route may pass
+        # through each valve only once.
+        counter = itertools.count()
+        start = (source, frozenset())
+        best = {start: (0.0, 0.0)}
+        previous = {}
+        queue = [((0.0, 0.0), next(counter), start)]
+        while queue:
+            costs, _, state = heapq.heappop(queue)
+            if costs > best.get(state, costs):
+                continue
+            node, used = state
+            if node == destination:
+                return self._build_route(previous, state, costs, cost)
+            for neighbor, volume_ul, valve, port in self._neighbors(node):
+                if valve is not None and valve.name in used:
+                    continue
+                dead_volume_ul, switch_s = costs if cost == "dead_volume" \
+                    else costs[::-1]
+                dead_volume_ul += volume_ul
+                new_used = used
+                if valve is not None:  # One traversal of the valve.
+                    outer = port if port != COMMON_PORT else node[1]
+                    dead_volume_ul += valve.dead_volume_ul
+                    switch_s += self._switch_cost(valve, outer)
+                    new_used = used | {valve.name}
+                new_costs = (dead_volume_ul, switch_s) if cost == "dead_volume" \
+                    else (switch_s, dead_volume_ul)
+                new_state = (neighbor, new_used)
+                if new_costs < best.get(new_state, (float('inf'),) * 2):
+                    best[new_state] = new_costs
+                    previous[new_state] = state
+                    heapq.heappush(queue, (new_costs, next(counter), new_state))
+        raise ValueError(f"No route from {source} to {destination}.")
+
+    def _neighbors(self, node: Hashable):
+        """Yield (neighbor, tubing volume, valve or None, neighbor port)."""
+        for neighbor, volume_ul in self.edges.get(node, {}).items():
+            yield neighbor, volume_ul, None, None
+        if isinstance(node, tuple) and node[0] in self.valves:
+            valve = self.valves[node[0]]
+            if node[1] == COMMON_PORT:
+                for port in range(1, valve.position_count + 1):
+                    yield (valve.name, port), 0.0, valve, port
+            else:
+                yield (valve.name, COMMON_PORT), 0.0, valve, COMMON_PORT
+
+    def _build_route(self, previous: dict, state: tuple, costs: tuple,
+                     cost: str):
+        nodes = [state[0]]
+        while state in previous:
+            state = previous[state]
+            nodes.append(state[0])
+        nodes.reverse()
+        route = Route(nodes=nodes)
+        route.dead_volume_ul, route.switch_time_s = \
+            costs if cost == "dead_volume" else costs[::-1]
+        for a, b in zip(nodes, nodes[1:]):
+            if isinstance(a, tuple) and isinstance(b, tuple) and a[0] == b[0] \
+                    and a[0] in self.valves:
+                route.valve_positions.append((a[0], max(a[1], b[1])))
+        return route
+
+    def apply(self, route: Route):
+        """Move every valve on the route into position."""
+        for name, port in route.valve_positions:
+            valve = self.valves[name]
+            if valve.device is None:
+                raise ValueError(f"Valve {name} has no device to move.")
+            if hasattr(valve.device, 'move_to_port'):
+                valve.device.move_to_port(port)
+            else:
+                valve.device.move_valve_to_position(port)
+            valve.position = port
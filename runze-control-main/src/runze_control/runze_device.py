@@ -1,14 +1,18 @@
 """Syringe Pump Driver."""
 from functools import reduce, wraps
-from runze_control.protocol_codes import common_codes
+from runze_control.bus import Bus, Priority
+from runze_control.protocol_codes import common_codes, registry
 from runze_control.protocol import *
 from runze_control.runze_protocol import FACTORY_CMD_PWD_CODE
+from runze_control.status import DeviceStatus
+from runze_control.transport import SharedConnection, open_transport
 from runze_control import runze_protocol
 from runze_control import dt_protocol
 from runze_control import oem_protocol
 from serial import Serial, SerialException
 from typing import Union
-from time import perf_counter
+from itertools import islice
+from time import perf_counter, sleep, time
 import logging
 import struct
 
@@ -31,6 +35,14 @@ def set_protocol(com_port: str, baudrate: int = 9600,
                    f"cycle for changes to take effect.")
 
 
+class DeviceError(RuntimeError):
+    """A device replied with an error status."""
+
+    def __init__(self, status: runze_protocol.ReplyStatus):
+        super().__init__(f"Device replied with error code: {status.name}.")
+        self.status = status
+
+
 class RunzeDevice:
     """Base class for a generic Runze Fluid device exposing commands common
     to all devices."""
@@ -46,6 +58,22 @@ class RunzeDevice:
         Protocol.RUNZE: [9600, 19200, 38400, 57600, 115200]
     }
 
+    MAX_RETRIES = 2  # Resends after a lost or corrupted reply.
+    REPLY_POLL_INTERVAL_S = 0.002  # How often to poll for a move's reply.
+
+    # DeviceStatus field -> (queries, decoder of their reply parameters).
+    # Fields whose queries the model lacks are skipped (see snapshot()).
+    STATUS_QUERIES = \
+    {
+        'reported_address': (('GetAddress',), int),
+        'rs232_baudrate': (('GetRS232Baudrate',),
+                           runze_protocol.RS232BaudrateReply.get),
+        'rs485_baudrate': (('GetRS485Baudrate',),
+                           runze_protocol.RS485BaudrateReply.get),
+        'firmware_version': (('GetFirmwareVersion',),
+                             lambda p: float(f"{p & 0xFF}.{p >> 8}")),
+    }
+
     RUNZE_DEFAULT_ADDRESS = 0x00 # max: 127 (128 devices).
     ASCII_DEFAULT_ADDRESS = 0x31 # ASCII: '0' max: 0x3F (16 devices).
 
@@ -93,12 +121,24 @@ class RunzeDevice:
         self.ser = None
         logger_name = self.__class__.__name__ + (f".{com_port}")
         self._timeout_s = self.__class__.DEFAULT_TIMEOUT_S
+        self.max_retries = 0  # No retries while probing baud rates.
         self.log = logging.getLogger(logger_name)
         self.codes = common_codes  # Can be overwritten in child class.
         self.cmd_send_time_s = None # Time last command was sent to the device
                                     # before reply was received or None if no
                                     # issued command is waiting for a reply.
+        self.bus = Bus.get(com_port)  # Shared with other devices on this port.
+        self._reply_waiters = 0  # Number of threads blocked reading a reply.
+        self.state_store = None  # Optional StateStore (see state.py).
+        self.recovery = None  # Optional RecoveryEngine (see recovery.py).
+        self._recovering = False  # True while `recovery` is at work.
+        self._resync_pending = False  # True once the port has reconnected.
+        self._discovering = False  # True while the address is unknown.
         # if baudrate is unspecified, try all of them before giving up.
+        # Other devices already talk over an open port, so only its baud rate
+        # can be tried there.
+        if baudrate is None:
+            baudrate = SharedConnection.open_baudrate(com_port)
         baudrates = [baudrate] if baudrate is not None \
                     else RunzeDevice.VALID_BAUDRATES[self.protocol]
         # Try all valid baud rates or the one specified.
@@ -110,14 +150,20 @@ class RunzeDevice:
                     self.log.debug(f"Connecting to device on port: {com_port}"
                                    f" at {br}[bps]" + log_msg_suffix)
                     # We will manually apply the timeout in the _send method.
-                    self.ser = Serial(com_port, br, timeout=0)
+                    self.ser = open_transport(com_port, br)
+                    self.ser.address = address  # Only read our replies.
                     self.ser.reset_input_buffer()
                     self.ser.reset_output_buffer()
                     # Test link by issuing a protocol-dependent dummy command.
                     if address is None:
                         self.log.debug("Discovering device address.")
                         self.address = 0 # Specify a temp dummy address.
-                        self.address = self.get_address()
+                        self._discovering = True
+                        try:
+                            self.address = self.get_address()
+                        finally:
+                            self._discovering = False
+                        self.ser.address = self.address
                     if self.protocol == Protocol.RUNZE and (address != None):
                         device_address = self.get_address()
                         if self.address != device_address:
@@ -128,9 +174,14 @@ class RunzeDevice:
                         raise NotImplementedError
                     elif self.protocol == Protocol.OEM:
                         raise NotImplementedError
+                    self.bus.baudrate = br
+                    self.bus.devices.add(self)
+                    self.ser.on_reconnect = self._on_reconnect
                     break
                 except SerialException as e:
                     self.cmd_send_time_s = None # Forget about last msg sent.
+                    if self.ser is not None:
+                        self.ser.close()
                     # Raise exception only if we've tried all valid baud rates.
                     self.log.debug(f"Connecting failed.")
                     if br == baudrates[-1]:
@@ -141,6 +192,14 @@ class RunzeDevice:
             raise
         # Restore long timeout (required for long syringe moves.)
         self._timeout_s = self.__class__.LONG_TIMEOUT_S
+        self.max_retries = self.__class__.MAX_RETRIES
+
+    def close(self):
+        """Close the connection to the device (shared connections stay open
+        while other devices use them)."""
+        self.bus.devices.discard(self)
+        if self.ser is not None:
+            self.ser.close()
 
     def get_firmware_version(self):
         if self.protocol == Protocol.RUNZE:
@@ -154,6 +213,45 @@ class RunzeDevice:
         else:
             raise NotImplementedError
 
+    def snapshot(self):
+        """Read the device's status (address, baud rates, firmware version,
+        and, per model, motor status, plunger position, and valve port) in one
+        pipelined burst of queries. Driver-side state is left untouched.
+
+        :return: a :class:`~runze_control.status.DeviceStatus`.
+        """
+        fields, funcs = self._status_queries()
+        timestamp = time()
+        sent_s = perf_counter()
+        replies = self._send_queries_runze(funcs)
+        return self._status_from_replies(fields, replies, timestamp, sent_s,
+                                         perf_counter() - sent_s)
+
+    def _status_queries(self):
+        """Return the status fields this model can report, as (name, number
+        of queries, decoder) tuples, and the queries to send for them."""
+        if self.protocol != Protocol.RUNZE:
+            raise NotImplementedError
+        fields = []
+        funcs = []
+        for name, (queries, decode) in self.STATUS_QUERIES.items():
+            if all(hasattr(self.codes.CommonCmd, q) for q in queries):
+                fields.append((name, len(queries), decode))
+                funcs.extend(getattr(self.codes.CommonCmd, q) for q in queries)
+        return fields, funcs
+
+    def _status_from_replies(self, fields: list, replies: list,
+                             timestamp: float, sent_s: float,
+                             latency_s: float):
+        """Decode the parsed replies to :meth:`_status_queries`."""
+        parameters = iter([reply['parameter'] for reply in replies])
+        values = {name: decode(*islice(parameters, count))
+                  for name, count, decode in fields}
+        return DeviceStatus(model=self.__class__.__name__,
+                            port=self.bus.com_port, address=self.address,
+                            timestamp=timestamp, time_s=sent_s,
+                            latency_s=latency_s, **values)
+
     def get_protocol(self):
         """Get the protocol that the device is set to communicate in."""
         raise NotImplementedError
@@ -164,8 +262,13 @@ class RunzeDevice:
         #    return Protocol.DT
 
     def set_address(self, address: int):
-        """Set the device for this bus (only necessary for RS485)."""
-        pass
+        """Set the device for this bus (only necessary for RS485).
+        Takes effect after a power cycle."""
+        if not (0 <= address <= 0x7F):
+            raise ValueError(f"Address ({address}) is out of range [0 - 127].")
+        self.log.debug(f"Setting address to 0x{address:02x}.")
+        self._send_factory_cmd_runze(common_codes.FactoryCmd.SetAddress,
+                                     address)
 
     def get_address(self):
         """ Get the device address. Under Runze Protocol, any device
@@ -190,8 +293,41 @@ class RunzeDevice:
         """Set the multicast address for this bus (only necessary for RS485).
         Specifying multiple valves with the same multicast address enables
         sending the same commands to groups of valves simultaneously.
+        Takes effect after a power cycle.
+
+        :param multicast_channel: channel to set [1 - 4].
         """
-        pass
+        if not (1 <= multicast_channel <= 4):
+            raise ValueError(f"Multicast channel ({multicast_channel}) is out "
+                             "of range [1 - 4].")
+        self.log.debug(f"Setting multicast channel {multicast_channel} "
+                       f"address to 0x{address:02x}.")
+        func = common_codes.FactoryCmd[f"MulticastCh{multicast_channel}Address"]
+        self._send_factory_cmd_runze(func, address)
+
+    def get_multicast_address(self, multicast_channel: int):
+        """Get the multicast address of the specified channel [1 - 4]."""
+        if not (1 <= multicast_channel <= 4):
+            raise ValueError(f"Multicast channel ({multicast_channel}) is out "
+                             "of range [1 - 4].")
+        func = getattr(self.codes.CommonCmd,
+                       f"GetMulticastChannel{multicast_channel}Address")
+        return self._send_query_runze(func)['parameter']
+
+    def set_power_on_reset(self, enabled: bool):
+        """Enable or disable resetting the actuator on power-up.
+        Takes effect after a power cycle."""
+        self._send_factory_cmd_runze(common_codes.FactoryCmd.PowerOnReset,
+                                     int(enabled))
+
+    def get_power_on_reset(self):
+        return bool(self._send_query_runze(
+            self.codes.CommonCmd.GetPowerOnReset)['parameter'])
+
+    def set_parameter_lock(self, locked: bool):
+        """Lock (or unlock) the factory parameters against changes."""
+        self._send_factory_cmd_runze(common_codes.FactoryCmd.ParameterLock,
+                                     int(locked))
 
     def get_rs232_baudrate(self):
         reply = self._send_query_runze(self.codes.CommonCmd.GetRS232Baudrate)
@@ -201,6 +337,27 @@ class RunzeDevice:
         reply = self._send_query_runze(self.codes.CommonCmd.GetRS485Baudrate)
         return runze_protocol.RS485BaudrateReply[reply['parameter']]
 
+    def set_rs232_baudrate(self, baudrate: int):
+        """Set the RS232 baud rate. Takes effect after a power cycle."""
+        self.log.debug(f"Setting RS232 baud rate to {baudrate}[bps].")
+        self._send_factory_cmd_runze(common_codes.FactoryCmd.SetRS232Baudrate,
+                                     self._baudrate_code(baudrate))
+
+    def set_rs485_baudrate(self, baudrate: int):
+        """Set the RS485 baud rate. Takes effect after a power cycle."""
+        self.log.debug(f"Setting RS485 baud rate to {baudrate}[bps].")
+        self._send_factory_cmd_runze(common_codes.FactoryCmd.SetRS485Baudrate,
+                                     self._baudrate_code(baudrate))
+
+    @staticmethod
+    def _baudrate_code(baudrate: int):
+        """Convert a baud rate to its Runze Protocol parameter code."""
+        codes = {v: k for k, v in runze_protocol.RS232BaudrateReply.items()}
+        if baudrate not in codes:
+            raise ValueError(f"Baud rate ({baudrate}[bps]) is invalid and must "
+                             f"be one of the following values: {list(codes)}.")
+        return codes[baudrate]
+
     def get_can_baudrate(self):
         raise NotImplementedError
 
@@ -218,9 +375,62 @@ class RunzeDevice:
             return True # No reply has been received yet.
         return False
 
-    def wait_for_reply(self, force: bool = False):
-        return self._parse_runze_reply(self._get_reply(protocol=self.protocol,
-                                                       force=force))
+    def wait_for_reply(self, force: bool = False, timeout_s: float = None):
+        """Wait for (and return) the reply to a previously issued command.
+
+        :param timeout_s: how long to wait. Defaults to the device timeout.
+        """
+        reply = self._parse_runze_reply(self._get_reply(protocol=self.protocol,
+                                                        force=force,
+                                                        timeout_s=timeout_s))
+        if reply is not None:
+            self._save_state()
+        return reply
+
+    def _get_state(self):
+        """Return the driver-side state worth persisting (see
+        :class:`~runze_control.state.StateStore`)."""
+        return {}
+
+    def _reconcile_state(self, state: dict):
+        """Adopt a persisted state if it agrees with the device. Return True
+        if it was adopted."""
+        return True
+
+    def _save_state(self):
+        """Persist the driver-side state after a confirmed command."""
+        if self.state_store is not None:
+            self.state_store.save(self)
+
+    def _rehome(self):
+        """Home the device after a fault (see
+        :class:`~runze_control.recovery.RecoveryEngine`)."""
+        raise NotImplementedError
+
+    def _restore_speed(self, state: dict):
+        """Re-apply the speed in a state from :meth:`_get_state`."""
+        pass
+
+    def _restore_position(self, state: dict):
+        """Move back to the position in a state from :meth:`_get_state`."""
+        pass
+
+    def _on_reconnect(self):
+        """Called by the port once it has reconnected after its USB-serial
+        adapter dropped out. The device itself kept running, so re-read its
+        state before the next command instead of re-homing."""
+        self._resync_pending = True
+
+    def _resync(self):
+        """Re-read the driver-side state from the device (see
+        :meth:`_on_reconnect`)."""
+        pass
+
+    def _resync_if_reconnected(self):
+        if self._resync_pending:
+            self._resync_pending = False
+            self.log.warning("Port reconnected. Resynchronizing state.")
+            self._resync()
 
     def _send_cmd_dt(self, cmd_str: str, execute: bool = True):
         """Send a command over DT protocol and return the reply."""
@@ -267,15 +477,61 @@ class RunzeDevice:
         b3, b4 = param_value.to_bytes(2, 'little')
         return self._send_common_cmd_frame_runze(func, b3, b4, wait, force)
 
+    def _send_queries_runze(self, funcs: list, timeout_s: float = None):
+        """Send several queries back-to-back in a single write and return
+        their parsed replies (in order).
+
+        The queries are pipelined: all frames go out in one burst and all
+        replies are collected afterwards, so the burst costs one bus
+        turnaround instead of one per query.
+
+        :param timeout_s: how long to wait for all replies after the burst has
+            been sent. Defaults to the short device timeout.
+        """
+        timeout_s = self.DEFAULT_TIMEOUT_S if timeout_s is None else timeout_s
+        packets = b''.join(self._encode_common_cmd_runze(func) for func in funcs)
+        expected_bytes = len(funcs) * runze_protocol.REPLY_NUM_BYTES
+        reply = bytes()
+        with self.bus.transaction():
+            if self.cmd_send_time_s is not None:
+                raise RuntimeError("Cannot issue a command while the previous "
+                                   "command has not yet replied.")
+            self._resync_if_reconnected()
+            self.log.debug(f"Sending {len(funcs)} pipelined queries (hex): "
+                           f"{packets.hex(' ')}")
+            self.bus.write(self.ser, packets)
+            self.cmd_send_time_s = perf_counter()
+            try:
+                while len(reply) < expected_bytes:
+                    try:
+                        reply += self.ser.read(expected_bytes - len(reply))
+                    except SerialException:
+                        pass
+                    if perf_counter() - self.cmd_send_time_s >= timeout_s:
+                        break
+            finally:
+                self.cmd_send_time_s = None
+            self._resync_if_reconnected()
+        self.log.debug(f"Replies (hex): {reply.hex(' ')}")
+        if len(reply) < expected_bytes:
+            raise SerialException(f"Only received "
+                f"{len(reply) // runze_protocol.REPLY_NUM_BYTES} of "
+                f"{len(funcs)} replies from device.")
+        n = runze_protocol.REPLY_NUM_BYTES
+        return [self._parse_runze_reply(reply[i:i+n])
+                for i in range(0, expected_bytes, n)]
+
     def _send_factory_cmd_runze(self, func: Union[common_codes.FactoryCmd, int],
                                 param_value, wait: bool = True, force: bool = False):
         """Send a factory command frame to issue a command over Runze Protocol.
            Return a reply frame as a dict."""
-        # Pack Factory Command password in the appropriate location.
+        # Pack Factory Command password (B3-B6) and parameter (B7-B10) as
+        # individual bytes.
         cmd_bytes = struct.pack(runze_protocol.PacketFormat.SendFactory.value,
                                 runze_protocol.PacketFields.STX,
                                 self.address, func,
-                                FACTORY_CMD_PWD_CODE, param_value,
+                                *FACTORY_CMD_PWD_CODE.to_bytes(4, 'big'),
+                                *param_value.to_bytes(4, 'little'),
                                 runze_protocol.PacketFields.ETX)
         checksum = sum(bytearray(cmd_bytes))
         packet = cmd_bytes + checksum.to_bytes(2, 'little')
@@ -289,75 +545,288 @@ class RunzeDevice:
                                      force: bool = False):
         """Send a common command frame to issue a command over Runze Protocol.
            Return a reply frame as a dict."""
+        packet = self._encode_common_cmd_frame_runze(func, b3, b4)
+        try:
+            if force or not wait or not self.max_retries:
+                return self._parse_runze_reply(
+                    self._send(packet, protocol=Protocol.RUNZE, wait=wait,
+                               force=force))
+            return self._send_with_retries(packet, func, b3 | (b4 << 8))
+        except DeviceError as e:
+            if self.recovery is None or self._recovering or force or not wait:
+                raise
+            return self.recovery.recover(self, e, func, b3, b4)
+
+    def _command_kind(self, func: Union[common_codes.CommonCmd, int]):
+        """Return the kind of a command (see :mod:`registry`). Unknown
+        commands count as relative moves, so they are never resent blindly."""
+        model = getattr(self.codes, 'MODEL', None)
+        if model is None:
+            return registry.RELATIVE
+        return registry.command_kinds(model).get(int(func), registry.RELATIVE)
+
+    def _send_with_retries(self, packet: bytes,
+                           func: Union[common_codes.CommonCmd, int],
+                           param_value: int):
+        """Send a command and wait for its reply. If the reply is lost or
+        corrupted, recover according to the command's kind.
+
+        Queries wait for a short timeout and are resent immediately. Absolute
+        moves (which reply once they finish, so they keep the long timeout)
+        are resent once the device has stopped (see :meth:`_wait_until_stopped`)
+        and a MotorBusy reply to the resend is retried the same way. A
+        relative move is only resent if reading back the position (see
+        :meth:`_reconcile_relative_move`) shows it never started.
+        """
+        kind = self._command_kind(func)
+        timeout_s = self.DEFAULT_TIMEOUT_S if kind == registry.QUERY else None
+        start_s = perf_counter()
+        attempt = 0
+        while True:
+            try:
+                reply = self._parse_runze_reply(
+                    self._send(packet, protocol=Protocol.RUNZE,
+                               timeout_s=timeout_s))
+                break
+            except (SerialException, DeviceError) as e:
+                # The device was still finishing the move we resent.
+                resend_busy = isinstance(e, DeviceError) and attempt \
+                    and kind == registry.ABSOLUTE \
+                    and e.status == runze_protocol.ReplyStatus.MotorBusy
+                if isinstance(e, DeviceError) and not resend_busy:
+                    raise
+                # The reply is gone. Don't wait for it any longer.
+                self.cmd_send_time_s = None
+                self.ser.reset_input_buffer()
+                if attempt == self.max_retries:
+                    self.bus.retry_failures += 1
+                    raise
+                attempt += 1
+                if kind == registry.ABSOLUTE:
+                    try:
+                        self._wait_until_stopped()
+                    except SerialException:
+                        self.bus.retry_failures += 1
+                        raise
+                elif kind == registry.RELATIVE:
+                    try:
+                        reply = self._reconcile_relative_move(func,
+                                                              param_value)
+                    except SerialException:
+                        self.bus.retry_failures += 1
+                        raise
+                    if reply is not None:  # It ran to completion.
+                        self.bus.reconciled += 1
+                        break
+                self.bus.resends[kind] += 1
+                self.log.warning(f"{e} Resending {kind} command 0x{func:02X} "
+                                 f"(retry {attempt}/{self.max_retries}).")
+        if attempt:
+            self.bus.retry_latencies_s.append(perf_counter() - start_s)
+        return reply
+
+    def _wait_until_stopped(self):
+        """Poll the motor status until the device stops (i.e: before resending
+        a move whose reply was lost), dropping stale replies on the way."""
+        if not hasattr(self.codes.CommonCmd, 'GetMotorStatus'):
+            return
+        deadline_s = perf_counter() + self.LONG_TIMEOUT_S
+        while True:
+            # The lost move's reply may still come in. Don't take it for ours.
+            self.ser.reset_input_buffer()
+            reply = self._send_query_runze(self.codes.CommonCmd.GetMotorStatus)
+            if reply['parameter'] != runze_protocol.ReplyStatus.MotorBusy:
+                break
+            if perf_counter() >= deadline_s:
+                raise SerialException("Device did not stop after a move's "
+                                      "reply was lost.")
+            sleep(0.01)
+        self.ser.reset_input_buffer()
+
+    def _reconcile_relative_move(self, func: Union[common_codes.CommonCmd, int],
+                                 param_value: int):
+        """Decide what happened to a relative move whose reply was lost.
+
+        Return a stand-in reply if the move completed. Return None if it never
+        started (so it can be resent). Raise SerialException if that can't be
+        told (the default) or if the move only partially completed.
+        """
+        raise SerialException("Reply to a relative move was lost. Resending "
+                              "it could move twice.")
+
+    def _encode_common_cmd_runze(self, func: Union[common_codes.CommonCmd, int],
+                                 param_value: int = 0, address: int = None):
+        """Encode (but don't send) a common command frame over Runze Protocol.
+        `address` defaults to the device address."""
+        b3, b4 = param_value.to_bytes(2, 'little')
+        return self._encode_common_cmd_frame_runze(func, b3, b4, address)
+
+    def _encode_common_cmd_frame_runze(self,
+                                       func: Union[common_codes.CommonCmd, int],
+                                       b3: int, b4: int, address: int = None):
+        """Encode (but don't send) a common command frame over Runze Protocol.
+        `address` defaults to the device address."""
+        address = self.address if address is None else address
         cmd_bytes = struct.pack(runze_protocol.PacketFormat.SendCommon.value,
                                 runze_protocol.PacketFields.STX,
-                                self.address, func, b3, b4,
+                                address, func, b3, b4,
                                 runze_protocol.PacketFields.ETX)
         checksum = sum(bytearray(cmd_bytes))
-        packet = cmd_bytes + checksum.to_bytes(2, 'little')
-        return self._parse_runze_reply(self._send(packet,
-                                                  protocol=Protocol.RUNZE,
-                                                  wait=wait,
-                                                  force=force))
+        return cmd_bytes + checksum.to_bytes(2, 'little')
 
     def _parse_runze_reply(self, reply: bytes):
         """Parse reply sent over Runze protocol into respective fields."""
         if not len(reply):
             return None
+        if len(reply) != runze_protocol.REPLY_NUM_BYTES \
+                or reply[0] != runze_protocol.PacketFields.STX \
+                or reply[5] != runze_protocol.PacketFields.ETX \
+                or sum(reply[:6]) & 0xFFFF != int.from_bytes(reply[6:], 'little') \
+                or reply[2] not in runze_protocol.ReplyStatus._value2member_map_:
+            raise SerialException(f"Corrupted reply (hex): {reply.hex(' ')}.")
+        # The device answers discovery with its own address.
+        if reply[1] != self.address and not self._discovering:
+            raise SerialException(f"Reply from address 0x{reply[1]:02x} "
+                                  f"(hex): {reply.hex(' ')} is not from this "
+                                  f"device (0x{self.address:02x}).")
         reply_struct = struct.unpack(runze_protocol.PacketFormat.Reply, reply)
         parsed_reply = dict(zip(runze_protocol.CommonReplyFields, reply_struct))
         error = runze_protocol.ReplyStatus(parsed_reply['status'])
         #self.log.debug(f"parsed: {parsed_reply}, status: {error.name}")
         if error != runze_protocol.ReplyStatus.NormalState:
-            raise RuntimeError(f"Device replied with error code: {error.name}.")
+            raise DeviceError(error)
         return parsed_reply
 
     def _send(self, packet: bytes, protocol: Protocol = Protocol.DT,
-              wait: bool = True, force: bool = False):
-        """Send a message over the specified protocol and return the reply."""
-        if self.cmd_send_time_s is not None and not force:
-            raise RuntimeError("Cannot issue a command while the previous "
-                               "command has not yet replied.")
-        self.log.debug(f"Sending (hex): {packet.hex(' ')}")
-        self.ser.write(packet)
-        self.cmd_send_time_s = perf_counter()
-        if not wait:
-            self.log.debug("Not waiting for reply from device.")
-            return bytes()  # Empty reply
-        # Every command issues a reply. Get it.
-        reply = self._get_reply(protocol, wait)
+              wait: bool = True, force: bool = False, timeout_s: float = None):
+        """Send a message over the specified protocol and return the reply.
+
+        If `force`, the message is sent with stop priority: it skips ahead of
+        all queued bus traffic (see :class:`~runze_control.bus.Bus`).
+
+        :param timeout_s: how long to wait for the reply. Defaults to the
+            device timeout.
+        """
+        if force:
+            self.log.debug(f"Sending with stop priority (hex): {packet.hex(' ')}")
+            self.bus.write(self.ser, packet, Priority.STOP)
+            self.cmd_send_time_s = perf_counter()
+            if not wait:
+                return bytes()  # Empty reply
+            reply = self._get_reply(protocol, wait, force=True,
+                                    timeout_s=timeout_s)
+        else:
+            # Another thread waiting on this device's reply doesn't hold the
+            # bus meanwhile (see _get_reply). Let it have its reply first.
+            while self._reply_waiters and self.cmd_send_time_s is not None:
+                sleep(self.REPLY_POLL_INTERVAL_S)
+            with self.bus.transaction():
+                # Checked in the transaction: another thread's query to this
+                # device may still be in flight until then.
+                if self.cmd_send_time_s is not None:
+                    raise RuntimeError("Cannot issue a command while the "
+                                       "previous command has not yet replied.")
+                self._resync_if_reconnected()
+                self.log.debug(f"Sending (hex): {packet.hex(' ')}")
+                self.bus.write(self.ser, packet)
+                self.cmd_send_time_s = perf_counter()
+                if not wait:
+                    self.log.debug("Not waiting for reply from device.")
+                    return bytes()  # Empty reply
+                # Every command issues a reply. Get it. A reply that is due
+                # right away is read before the bus is released, so no other
+                # frame goes out while it is on the wire.
+                hold = self._holds_bus_for_reply(timeout_s)
+                if hold:
+                    reply = self._get_reply(protocol, wait,
+                                            timeout_s=timeout_s)
+            if not hold:
+                reply = self._get_reply(protocol, wait, timeout_s=timeout_s)
         if len(reply) == 0:
             raise SerialException("No reply received from device.")
         return reply
 
     def _get_reply(self, protocol: Protocol = Protocol.DT, wait: bool = True,
-                   force: bool = False):
+                   force: bool = False, timeout_s: float = None):
         """Retrieve the reply from a previously-issued command.
         If wait, wait up to the timeout period to retrieve the reply.
         Otherwise return immediately with an empty reply if reply has not been
         received.
+        If `force`, don't wait for a bus transaction to read the reply (e.g:
+        the reply to a stop frame while another thread is waiting on a move).
+
+        A long wait (i.e: for a move, which only replies once it finishes)
+        takes the bus for each poll of the reply and releases it in between,
+        so other devices can use the bus while this one is busy.
         """
         if self.cmd_send_time_s is None and not force:
             raise SerialException("Cannot retrieve a reply. "
                                   "No command has been issued.")
+        if force:
+            return self._read_reply(protocol, wait, timeout_s)
+        # An explicit timeout counts from now. Otherwise the device timeout
+        # counts from when the command was sent.
+        deadline_s = perf_counter() if timeout_s is not None \
+            or self.cmd_send_time_s is None else self.cmd_send_time_s
+        deadline_s += self._timeout_s if timeout_s is None else timeout_s
+        hold = self._holds_bus_for_reply(timeout_s)
+        self._reply_waiters += 1  # Between polls too.
+        try:
+            while True:
+                with self.bus.transaction():
+                    reply = self._read_reply(
+                        protocol, wait and hold,
+                        max(deadline_s - perf_counter(), 0))
+                    if self.cmd_send_time_s is None:  # Free for follow-ups.
+                        self._resync_if_reconnected()
+                if len(reply) or not wait or perf_counter() >= deadline_s:
+                    return reply
+                sleep(self.REPLY_POLL_INTERVAL_S)
+        finally:
+            self._reply_waiters -= 1
+
+    def _holds_bus_for_reply(self, timeout_s: float = None):
+        """True if a reply awaited for `timeout_s` (defaults to the device
+        timeout) is due right away, so it is awaited holding the bus."""
+        timeout_s = self._timeout_s if timeout_s is None else timeout_s
+        return timeout_s <= self.DEFAULT_TIMEOUT_S
+
+    def _read_reply(self, protocol: Protocol, wait: bool,
+                    timeout_s: float = None):
         reply = bytes()
-        while True:
-            # pyseral Timeout is zero, so these calls return immediately if no reply.
-            try:
-                if protocol == Protocol.RUNZE:
-                    reply += self.ser.read(runze_protocol.REPLY_NUM_BYTES)
-                elif protocol == Protocol.DT:
-                    reply += self.ser.read_until(
-                        dt_protocol.PacketFields.REPLY_FRAME_END.encode('ascii'))
-                elif protocol == Protocol.OEM:
-                    # check checksum.
-                    raise NotImplementedError("OEM protocol not yet implemented.")
-            except SerialException:
-                pass
-            if len(reply) or not wait:
-                break
-            if perf_counter() - self.cmd_send_time_s >= self._timeout_s:
-                break
+        # An explicit timeout counts from now. Otherwise the device timeout
+        # counts from when the command was sent.
+        start_s = perf_counter()
+        if timeout_s is None:
+            timeout_s = self._timeout_s
+            if self.cmd_send_time_s is not None:
+                start_s = self.cmd_send_time_s
+        self._reply_waiters += 1
+        try:
+            while True:
+                # pyseral Timeout is zero, so these calls return immediately if no reply.
+                try:
+                    if protocol == Protocol.RUNZE:
+                        reply += self.ser.read(runze_protocol.REPLY_NUM_BYTES
+                                               - len(reply))
+                    elif protocol == Protocol.DT:
+                        reply += self.ser.read_until(
+                            dt_protocol.PacketFields.REPLY_FRAME_END.encode('ascii'))
+                    elif protocol == Protocol.OEM:
+                        # check checksum.
+                        raise NotImplementedError("OEM protocol not yet implemented.")
+                except SerialException:
+                    pass
+                if len(reply) and (protocol != Protocol.RUNZE or len(reply)
+                                   >= runze_protocol.REPLY_NUM_BYTES):
+                    break
+                if not len(reply) and not wait:
+                    break  # A partial reply is finished even if not `wait`.
+                if perf_counter() - start_s >= timeout_s:
+                    break
+                sleep(0)  # Let other threads (i.e: a stop) run meanwhile.
+        finally:
+            self._reply_waiters -= 1
         self.log.debug(f"Reply (hex): {reply.hex(' ')}")
         if len(reply):
             self.cmd_send_time_s = None  # Cmd-reply loop finished. Unassign.
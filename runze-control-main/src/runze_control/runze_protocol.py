@@ -8,6 +8,8 @@ except ImportError:
         pass
 
 FACTORY_CMD_PWD_CODE = 0xFFEEBBAA  # Password for applying factory commands.
+COMMON_CMD_NUM_BYTES = 8  # 6 fields plus a 2-byte checksum.
+FACTORY_CMD_NUM_BYTES = 14  # 12 fields plus a 2-byte checksum.
 REPLY_NUM_BYTES = 8
 
 
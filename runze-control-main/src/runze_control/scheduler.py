@@ -0,0 +1,285 @@
+"""Send commands at precise (absolute) times."""
+from dataclasses import dataclass
+from math import inf
+from runze_control.multichannel_syringe_pump import MultiChannelSyringePump
+from runze_control.runze_device import RunzeDevice
+from runze_control.syringe_pump import SyringePump
+from serial import SerialException
+from time import perf_counter
+from typing import Callable
+import heapq
+import itertools
+import logging
+import numpy as np
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ScheduledCommand:
+    """A command frame to be sent at `deadline_s` (:func:`time.perf_counter`
+    timebase)."""
+    device: RunzeDevice
+    frame: bytes  # Pre-encoded frame.
+    deadline_s: float
+    on_reply: Callable = None  # Called with the parsed reply.
+    sent_s: float = None  # When the frame was handed to the port.
+    replied_s: float = None
+    reply: dict = None
+    error: Exception = None
+
+    @property
+    def lateness_s(self):
+        """Actual minus target send time (None if not sent)."""
+        return None if self.sent_s is None else self.sent_s - self.deadline_s
+
+    @property
+    def done(self):
+        return self.reply is not None or self.error is not None
+
+
+class CommandScheduler:
+    """Sends pre-encoded command frames at absolute deadlines from a dedicated
+    thread.
+
+    The thread sleeps until shortly before the next deadline, takes the bus,
+    and then spins until the deadline to write the frame, so wake-up latency
+    of the OS scheduler never delays a command. Commands due at the same time
+    are written back-to-back (without waiting for each to drain) so commands
+    on different buses go out together. Nothing is logged on the time-critical
+    path. Replies are collected in between deadlines.
+
+    Actual send times are recorded on each :class:`ScheduledCommand`; see
+    :meth:`jitter_stats`.
+
+    .. Note::
+       Frames on the *same* bus are still serialized by the wire: each one
+       goes out one frame time (see :meth:`Bus.transfer_time_s`) after the
+       previous one.
+
+    """
+
+    POLL_INTERVAL_S = 0.002  # Reply polling interval between deadlines.
+
+    def __init__(self, spin_window_s: float = 0.002,
+                 realtime_priority: bool = True):
+        """Init.
+
+        :param spin_window_s: stop sleeping this long before each deadline.
+            It should exceed the OS wake-up latency.
+        :param realtime_priority: try to run the dispatch thread with realtime
+            (SCHED_FIFO) priority. Requires privileges; falls back to normal
+            priority otherwise.
+        """
+        self.spin_window_s = spin_window_s
+        self.realtime_priority = realtime_priority
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.commands = []  # Every ScheduledCommand, in scheduling order.
+        self._queue = []  # heap of (deadline, order, ScheduledCommand).
+        self._order = itertools.count()
+        self._in_flight = []  # Sent commands awaiting their reply.
+        self._planned_steps = {}  # Pump -> plunger position after the last
+                                  # scheduled plunger move.
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def start(self):
+        """Start the dispatch thread."""
+        if self._thread is not None:
+            raise RuntimeError("Scheduler is already running.")
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="CommandScheduler")
+        self._thread.start()
+
+    def stop(self):
+        """Stop the dispatch thread. Unsent commands are discarded."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def join(self, timeout_s: float = None):
+        """Wait until every scheduled command has been sent and has replied.
+        Return False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._queue and not self._in_flight, timeout_s)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def schedule(self, device: RunzeDevice, func, param_value: int = 0,
+                 deadline_s: float = None, on_reply: Callable = None):
+        """Schedule a common command for `deadline_s` (default: now).
+
+        :return: the :class:`ScheduledCommand`.
+        """
+        frame = device._encode_common_cmd_runze(func, param_value)
+        command = ScheduledCommand(
+            device, frame, perf_counter() if deadline_s is None else deadline_s,
+            on_reply)
+        with self._cond:
+            self.commands.append(command)
+            heapq.heappush(self._queue,
+                           (command.deadline_s, next(self._order), command))
+            self._cond.notify_all()
+        return command
+
+    def schedule_dispense(self, pump: SyringePump, microliters: float,
+                          deadline_s: float):
+        """Schedule a relative dispense. Consecutive scheduled dispenses on a
+        pump continue from each other's end position."""
+        position_steps = self._planned_steps.get(pump, pump.driver_steps)
+        steps = -pump.volume_converter.relative_steps(-microliters,
+                                                      position_steps)
+        target_steps = position_steps - steps
+        if target_steps < 0:
+            raise ValueError(f"Cannot dispense {microliters}[uL]. The syringe "
+                             "would be empty.")
+        self._planned_steps[pump] = target_steps
+
+        def on_reply(reply: dict):
+            pump.driver_steps = target_steps
+
+        if isinstance(pump, MultiChannelSyringePump):  # No relative moves.
+            return self.schedule(pump, pump.codes.CommonCmd.MovePlungerAbsolute,
+                                 target_steps, deadline_s, on_reply)
+        return self.schedule(pump, pump.codes.CommonCmd.RunInCW, steps,
+                             deadline_s, on_reply)
+
+    def jitter_stats(self, tolerance_s: float = None):
+        """Return a dict of send time errors (actual minus target, seconds) or
+        None if nothing has been sent.
+
+        :param tolerance_s: if specified, also count commands sent more than
+            this far from their deadline.
+        """
+        with self._cond:
+            lateness_s = np.array([c.lateness_s for c in self.commands
+                                   if c.sent_s is not None])
+            failed = sum(c.error is not None for c in self.commands)
+        if not len(lateness_s):
+            return None
+        abs_lateness_s = np.abs(lateness_s)
+        stats = {'count': len(lateness_s),
+                 'mean_s': float(lateness_s.mean()),
+                 'std_s': float(lateness_s.std()),
+                 'p99_s': float(np.percentile(abs_lateness_s, 99)),
+                 'max_s': float(abs_lateness_s.max()),
+                 'failed': failed}
+        if tolerance_s is not None:
+            stats['out_of_tolerance'] = int((abs_lateness_s > tolerance_s).sum())
+        return stats
+
+    def _raise_priority(self):
+        if not self.realtime_priority:
+            return
+        try:
+            policy = os.SCHED_FIFO
+            os.sched_setscheduler(0, policy, os.sched_param(
+                os.sched_get_priority_min(policy)))
+            self.log.debug("Dispatching with realtime priority.")
+        except (AttributeError, OSError):  # Unsupported or not permitted.
+            self.log.debug("Dispatching with normal priority.")
+
+    def _run(self):
+        self._raise_priority()
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                if not self._queue and not self._in_flight:
+                    self._cond.wait()
+                    continue
+                next_s = self._queue[0][0] if self._queue else inf
+            sleep_s = next_s - self.spin_window_s - perf_counter()
+            if sleep_s > 0:
+                if self._in_flight and sleep_s > self.POLL_INTERVAL_S:
+                    self._collect_replies()
+                    sleep_s = min(sleep_s, self.POLL_INTERVAL_S)
+                with self._cond:  # Wakes up early if something is scheduled.
+                    if not self._stopped:
+                        self._cond.wait(sleep_s)
+                continue
+            with self._cond:
+                batch = []
+                while self._queue and self._queue[0][0] <= next_s:
+                    batch.append(heapq.heappop(self._queue)[2])
+            self._dispatch(batch, next_s)
+
+    def _dispatch(self, batch: list, deadline_s: float):
+        buses = list(dict.fromkeys(c.device.bus for c in batch))
+        for bus in buses:
+            bus.acquire()
+        try:
+            ready = []
+            for command in batch:
+                device = command.device
+                if device.cmd_send_time_s is not None:  # Previous reply?
+                    self._collect_reply(device)
+                if device.cmd_send_time_s is not None:
+                    command.error = RuntimeError("Cannot issue a command while "
+                        "the previous command has not yet replied.")
+                else:
+                    ready.append(command)
+            while perf_counter() < deadline_s:
+                pass
+            for command in ready:
+                device = command.device
+                command.sent_s = perf_counter()
+                device.bus.write(device.ser, command.frame, drain=False)
+                device.cmd_send_time_s = command.sent_s
+            for ser in dict.fromkeys(c.device.ser for c in ready):
+                ser.flush()
+        finally:
+            for bus in buses:
+                bus.release()
+        with self._cond:
+            self._in_flight.extend(ready)
+            self._cond.notify_all()
+        for command in batch:
+            if command.error is not None:
+                self.log.error(f"Command scheduled for {command.deadline_s:.4f}"
+                               f"[s] was not sent: {command.error}")
+
+    def _collect_reply(self, device: RunzeDevice):
+        """Read the reply to the in-flight command of `device` (if any)."""
+        for command in self._in_flight:
+            if command.device is device:
+                self._poll(command)
+                break
+
+    def _collect_replies(self):
+        for command in list(self._in_flight):
+            self._poll(command)
+
+    def _poll(self, command: ScheduledCommand):
+        device = command.device
+        try:
+            reply = device._get_reply(device.protocol, wait=False)
+            if not len(reply):
+                if perf_counter() - command.sent_s < device._timeout_s:
+                    return
+                device.cmd_send_time_s = None
+                raise SerialException("No reply received from device.")
+            command.replied_s = perf_counter()
+            command.reply = device._parse_runze_reply(reply)
+            if command.on_reply is not None:
+                command.on_reply(command.reply)
+        except Exception as e:
+            command.error = e
+            self.log.error(f"Command sent at {command.sent_s:.4f}[s] failed: "
+                           f"{e}")
+        with self._cond:
+            self._in_flight.remove(command)
+            self._cond.notify_all()
@@ -0,0 +1,862 @@
+"""Software stand-in for Runze Fluid devices sharing a serial bus.
+
+A :class:`SimulatedBus` is opened with a ``sim://<name>`` url wherever a com
+port is expected::
+
+    from runze_control.simulator import SimulatedBus, SimulatedSyringePump
+    from runze_control.protocol_codes import sy08_codes
+    from runze_control.syringe_pump import SY08
+
+    bus = SimulatedBus("rig", baudrate=9600)
+    bus.add_device(SimulatedSyringePump(address=0, codes=sy08_codes))
+    pump = SY08("sim://rig", address=0, syringe_volume_ul=5000)
+
+Frames take their wire time at the bus baud rate, moves reply when the
+simulated motion completes, and frames sent at the wrong baud rate are
+ignored (just like a real device would ignore a garbled frame).
+"""
+from contextlib import closing
+from runze_control import runze_protocol
+from runze_control.runze_protocol import ReplyStatus
+from runze_control.protocol_codes import common_codes
+from time import perf_counter, sleep
+import heapq
+import itertools
+import numpy as np
+import select
+import serial
+import socket
+import struct
+import threading
+import weakref
+
+# Make ``sim://`` urls resolvable by serial.serial_for_url.
+if 'runze_control.urlhandler' not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append('runze_control.urlhandler')
+
+BITS_PER_BYTE = 10  # 8 data bits plus a start and a stop bit.
+
+
+def encode_reply(address: int, status: int, parameter: int):
+    """Encode a Runze Protocol reply frame."""
+    reply = struct.pack("<BBBHB", runze_protocol.PacketFields.STX, address,
+                        status, parameter & 0xFFFF,
+                        runze_protocol.PacketFields.ETX)
+    return reply + (sum(reply) & 0xFFFF).to_bytes(2, 'little')
+
+
+class _Reply:
+    """A reply frame that becomes readable at `time_s` unless cancelled."""
+
+    _counter = itertools.count()
+
+    def __init__(self, time_s: float, data: bytes):
+        self.time_s = time_s
+        self.data = data
+        self.cancelled = False
+        self._order = next(_Reply._counter)
+
+    def __lt__(self, other):
+        return (self.time_s, self._order) < (other.time_s, other._order)
+
+
+class SimulatedDevice:
+    """A device answering the commands common to all Runze devices.
+
+    Child classes add handlers for their own commands. Handlers are looked up
+    by the command's name in `codes`, so the simulator always agrees with the
+    codes the driver uses for that model.
+    """
+
+    def __init__(self, address: int = 0x00, codes=common_codes,
+                 firmware_version: tuple = (1, 0), rs232_baudrate: int = None,
+                 rs485_baudrate: int = None):
+        """Init.
+
+        :param rs232_baudrate: RS232 baud rate. Defaults to the baud rate of
+            the bus the device is added to. (Same for `rs485_baudrate`.)
+        """
+        self.address = address
+        self.codes = codes
+        self.firmware_version = firmware_version
+        self.rs232_baudrate = rs232_baudrate
+        self.rs485_baudrate = rs485_baudrate
+        self.pending_settings = {}  # Factory settings applied on power cycle.
+        self.multicast_channels = [0, 0, 0, 0]  # 0: channel unused.
+        self.multicast_addresses = set()  # Addresses listened to silently.
+        self.power_on_reset = 0
+        self.parameter_lock = 0
+        self.bus = None  # Assigned when added to a bus.
+        self.frames_received = 0
+        self.faults = []  # Statuses that end the next moves halfway.
+
+    def handle(self, func: int, param: int, time_s: float):
+        """Execute a common command received at `time_s`.
+        Return a list of (time_s, status, parameter) replies."""
+        self.frames_received += 1
+        try:
+            name = self.codes.CommonCmd(func).name
+        except ValueError:
+            return [(time_s, ReplyStatus.ParameterError, 0)]
+        handler = getattr(self, f"_on_{name}", None)
+        if handler is None:
+            return [(time_s, ReplyStatus.ParameterError, 0)]
+        return handler(param, time_s)
+
+    def inject_fault(self, status: ReplyStatus = ReplyStatus.MotorStalled,
+                     count: int = 1):
+        """Make the next `count` moves stop halfway and reply with `status`
+        (i.e: a stalled motor)."""
+        self.faults.extend([status] * count)
+
+    def _end_move(self, start: float, target: float, duration_s: float):
+        """Return (end position, duration, reply status) of a move, which
+        stops halfway if a fault is pending."""
+        if not self.faults:
+            return target, duration_s, ReplyStatus.NormalState
+        return start + (target - start) / 2, duration_s / 2, \
+            self.faults.pop(0)
+
+    def handle_factory(self, func: int, param: int, time_s: float):
+        """Store a factory setting received at `time_s`. Like the real devices,
+        settings take effect after the next :meth:`power_cycle`.
+        Return a list of (time_s, status, parameter) replies."""
+        self.frames_received += 1
+        try:
+            name = common_codes.FactoryCmd(func).name
+        except ValueError:
+            return [(time_s, ReplyStatus.ParameterError, 0)]
+        if name in ("SetRS232Baudrate", "SetRS485Baudrate") \
+                and param not in runze_protocol.RS232BaudrateReply:
+            return [(time_s, ReplyStatus.ParameterError, 0)]
+        self.pending_settings[name] = param
+        return [(time_s, ReplyStatus.NormalState, 0)]
+
+    def baudrate(self, interface: str):
+        """Baud rate the device listens at on the specified interface."""
+        return self.rs485_baudrate if interface == "rs485" \
+            else self.rs232_baudrate
+
+    def power_cycle(self):
+        """Apply pending factory settings."""
+        for name, param in self.pending_settings.items():
+            if name == "SetAddress":
+                self.address = param
+            elif name == "SetRS232Baudrate":
+                self.rs232_baudrate = runze_protocol.RS232BaudrateReply[param]
+            elif name == "SetRS485Baudrate":
+                self.rs485_baudrate = runze_protocol.RS485BaudrateReply[param]
+            elif name.startswith("MulticastCh"):
+                self.multicast_channels[int(name[len("MulticastCh")]) - 1] = param
+                self.multicast_addresses = \
+                    {a for a in self.multicast_channels if a}
+            elif name == "PowerOnReset":
+                self.power_on_reset = param
+            elif name == "ParameterLock":
+                self.parameter_lock = param
+        self.pending_settings = {}
+
+    @staticmethod
+    def _baud_code(baudrate: int):
+        return {v: k for k, v in runze_protocol.RS232BaudrateReply.items()}[baudrate]
+
+    def _on_GetAddress(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, self.address)]
+
+    def _on_GetRS232Baudrate(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState,
+                 self._baud_code(self.rs232_baudrate))]
+
+    def _on_GetRS485Baudrate(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState,
+                 self._baud_code(self.rs485_baudrate))]
+
+    def _on_GetCanBaudRate(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, 0)]
+
+    def _on_GetCanDestinationAddress(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, 0)]
+
+    def _on_GetFirmwareVersion(self, param, time_s):
+        major, minor = self.firmware_version
+        return [(time_s, ReplyStatus.NormalState, major | (minor << 8))]
+
+    def _on_GetPowerOnReset(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, self.power_on_reset)]
+
+    def _on_GetMulticastChannel1Address(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, self.multicast_channels[0])]
+
+    def _on_GetMulticastChannel2Address(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, self.multicast_channels[1])]
+
+    def _on_GetMulticastChannel3Address(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, self.multicast_channels[2])]
+
+    def _on_GetMulticastChannel4Address(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, self.multicast_channels[3])]
+
+
+class _Motion:
+    """Linear motion of an actuator between two positions."""
+
+    def __init__(self, start_s: float, end_s: float, start: float, end: float):
+        self.start_s = start_s
+        self.end_s = end_s
+        self.start = start
+        self.end = end
+        self.reply = None  # Reply issued on completion.
+
+    def position(self, time_s: float):
+        if time_s >= self.end_s or self.end_s == self.start_s:
+            return self.end
+        fraction = (time_s - self.start_s) / (self.end_s - self.start_s)
+        return self.start + (self.end - self.start) * max(fraction, 0)
+
+
+class _MotionHistory:
+    """Every motion of one actuator, in the order they were started."""
+
+    def __init__(self, motion: _Motion):
+        self.motions = [motion]
+
+    @property
+    def current(self):
+        return self.motions[-1]
+
+    def append(self, motion: _Motion):
+        self.motions.append(motion)
+
+    def positions(self, times_s):
+        """Actuator positions at (an array of) times. A motion supersedes the
+        previous one from its start time onward."""
+        times_s = np.asarray(times_s, dtype=float)
+        starts_s = np.array([m.start_s for m in self.motions])
+        index = np.maximum(np.searchsorted(starts_s, times_s, side='right') - 1, 0)
+        positions = np.empty(times_s.shape)
+        for i in np.unique(index):
+            m = self.motions[i]
+            mask = index == i
+            if m.end_s == m.start_s:
+                positions[mask] = m.end
+                continue
+            fraction = np.clip((times_s[mask] - m.start_s)
+                               / (m.end_s - m.start_s), 0, 1)
+            positions[mask] = m.start + (m.end - m.start) * fraction
+        return positions
+
+    def moving(self, times_s):
+        """Whether the actuator is moving at (an array of) times."""
+        times_s = np.asarray(times_s, dtype=float)
+        starts_s = np.array([m.start_s for m in self.motions])
+        ends_s = np.array([m.end_s for m in self.motions])
+        index = np.maximum(np.searchsorted(starts_s, times_s, side='right') - 1, 0)
+        return times_s < ends_s[index]
+
+
+class SimulatedSyringePump(SimulatedDevice):
+    """A single-channel syringe pump (SY08, MiniSY04)."""
+
+    def __init__(self, address: int = 0x00, codes=None,
+                 max_position_steps: int = 12000, steps_per_rev: int = 400,
+                 speed_rpm: int = 300, residual_reply_on_stop: bool = True,
+                 **kwargs):
+        """Init.
+
+        :param steps_per_rev: plunger steps per motor revolution. Together with
+            the speed (in rpm) this sets how long simulated moves take.
+        :param residual_reply_on_stop: if True, a move interrupted by ForceStop
+            still issues its reply (as the SY08 does).
+        """
+        if codes is None:
+            from runze_control.protocol_codes import syringe_pump_codes
+            codes = syringe_pump_codes
+        super().__init__(address=address, codes=codes, **kwargs)
+        self.max_position_steps = max_position_steps
+        self.steps_per_rev = steps_per_rev
+        self.speed_rpm = speed_rpm
+        self.residual_reply_on_stop = residual_reply_on_stop
+        self.plunger_history = _MotionHistory(_Motion(0, 0, 0, 0))
+
+    @property
+    def plunger(self):
+        return self.plunger_history.current
+
+    @plunger.setter
+    def plunger(self, motion: _Motion):
+        self.plunger_history.append(motion)
+
+    def plunger_positions(self, times_s):
+        """Plunger positions [steps] at (an array of) times, i.e: for
+        measuring the delivered flow."""
+        return self.plunger_history.positions(times_s)
+
+    def steps_per_s(self):
+        return self.speed_rpm * self.steps_per_rev / 60.0
+
+    def position_steps(self, time_s: float):
+        return round(self.plunger.position(time_s))
+
+    def is_moving(self, time_s: float):
+        return time_s < self.plunger.end_s
+
+    def _start_plunger_move(self, target: int, time_s: float):
+        if self.is_moving(time_s):
+            return [(time_s, ReplyStatus.MotorBusy, 0)]
+        if not (0 <= target <= self.max_position_steps):
+            return [(time_s, ReplyStatus.ParameterError, 0)]
+        start = self.position_steps(time_s)
+        end, duration_s, status = self._end_move(
+            start, target, abs(target - start) / self.steps_per_s())
+        self.plunger = _Motion(time_s, time_s + duration_s, start, round(end))
+        return [(time_s + duration_s, status, 0, self.plunger)]
+
+    def _on_GetMotorStatus(self, param, time_s):
+        status = ReplyStatus.MotorBusy if self.is_moving(time_s) \
+            else ReplyStatus.NormalState
+        return [(time_s, ReplyStatus.NormalState, status)]
+
+    def _on_GetSyringePosition(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, self.position_steps(time_s))]
+
+    def _on_SynchronizeSyringePosition(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, 0)]
+
+    def _on_RunInCW(self, param, time_s):
+        if param == 0:
+            return [(time_s, ReplyStatus.ParameterError, 0)]
+        return self._start_plunger_move(self.position_steps(time_s) - param,
+                                        time_s)
+
+    def _on_RunInCCW(self, param, time_s):
+        if param == 0:
+            return [(time_s, ReplyStatus.ParameterError, 0)]
+        return self._start_plunger_move(self.position_steps(time_s) + param,
+                                        time_s)
+
+    def _on_MoveSyringeAbsolute(self, param, time_s):
+        return self._start_plunger_move(param, time_s)
+
+    def _on_ResetSyringePosition(self, param, time_s):
+        return self._start_plunger_move(0, time_s)
+
+    def _on_SetDynamicSpeed(self, param, time_s):
+        if self.is_moving(time_s):
+            return [(time_s, ReplyStatus.MotorBusy, 0)]
+        self.speed_rpm = param
+        return [(time_s, ReplyStatus.NormalState, 0)]
+
+    def _on_ForceStop(self, param, time_s):
+        replies = []
+        if self.is_moving(time_s):
+            stopped_at = self.plunger.position(time_s)
+            if self.plunger.reply is not None:
+                self.plunger.reply.cancelled = True
+                if self.residual_reply_on_stop:
+                    replies.append((time_s, ReplyStatus.NormalState, 0))
+            self.plunger = _Motion(time_s, time_s, stopped_at, stopped_at)
+        replies.append((time_s, ReplyStatus.NormalState, 0))
+        return replies
+
+    def _on_GetFirmwareSubVersion(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, 0)]
+
+
+class SimulatedRotaryValve(SimulatedDevice):
+    """A rotary selector valve (SV-04)."""
+
+    def __init__(self, address: int = 0x00, codes=None, position_count: int = 10,
+                 port_switch_s: float = 0.05, **kwargs):
+        """Init.
+
+        :param port_switch_s: time to rotate from one port to the adjacent one.
+        """
+        if codes is None:
+            from runze_control.protocol_codes import rotary_valve_codes
+            codes = rotary_valve_codes
+        super().__init__(address=address, codes=codes, **kwargs)
+        self.position_count = position_count
+        self.port_switch_s = port_switch_s
+        self.rotor_history = _MotionHistory(_Motion(0, 0, 1, 1))  # In ports.
+
+    @property
+    def rotor(self):
+        return self.rotor_history.current
+
+    @rotor.setter
+    def rotor(self, motion: _Motion):
+        self.rotor_history.append(motion)
+
+    def port(self, time_s: float):
+        position = self.rotor.position(time_s)
+        if self.rotor.end_s > time_s or position != int(position):
+            return 0  # Rotating or parked between ports.
+        return int(position)
+
+    def ports(self, times_s):
+        """Ports at (an array of) times (0 while rotating or parked between
+        ports)."""
+        positions = self.rotor_history.positions(times_s)
+        ports = np.rint(positions).astype(int)
+        ports[self.rotor_history.moving(times_s) | (ports != positions)] = 0
+        return ports
+
+    def is_moving(self, time_s: float):
+        return time_s < self.rotor.end_s
+
+    def _start_rotor_move(self, target: float, clockwise: bool, time_s: float):
+        if self.is_moving(time_s):
+            return [(time_s, ReplyStatus.MotorBusy, 0)]
+        start = self.rotor.position(time_s)
+        if clockwise:
+            transitions = (target - start) % self.position_count
+        else:
+            transitions = (start - target) % self.position_count
+        if not clockwise:
+            transitions = -transitions
+        end, duration_s, status = self._end_move(
+            start, start + transitions, abs(transitions) * self.port_switch_s)
+        if status == ReplyStatus.NormalState:
+            end = target
+        self.rotor = _Motion(time_s, time_s + duration_s, start,
+                             (end - 1) % self.position_count + 1)
+        return [(time_s + duration_s, status, 0, self.rotor)]
+
+    def _on_GetMotorStatus(self, param, time_s):
+        status = ReplyStatus.MotorBusy if self.is_moving(time_s) \
+            else ReplyStatus.NormalState
+        return [(time_s, ReplyStatus.NormalState, status)]
+
+    def _on_GetPortPositon(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, self.port(time_s))]
+
+    def _on_MoveToPort(self, param, time_s):
+        target = param & 0xFF
+        direction_hint = param >> 8
+        if not (1 <= target <= self.position_count):
+            return [(time_s, ReplyStatus.ParameterError, 0)]
+        # The high byte is the port after (clockwise) or before the target.
+        clockwise = direction_hint != target - 1
+        return self._start_rotor_move(target, clockwise, time_s)
+
+    def _on_MoveBetweenPort(self, param, time_s):
+        port_a, port_b = param & 0xFF, param >> 8
+        n = self.position_count
+        if not (1 <= port_a <= n and 1 <= port_b <= n):
+            return [(time_s, ReplyStatus.ParameterError, 0)]
+        if port_b == port_a % n + 1:
+            target = port_a + 0.5
+        elif port_a == port_b % n + 1:
+            target = port_b + 0.5
+        else:
+            return [(time_s, ReplyStatus.ParameterError, 0)]
+        start = self.rotor.position(time_s)
+        clockwise = (target - start) % n <= (start - target) % n
+        return self._start_rotor_move(target, clockwise, time_s)
+
+    def _on_ResetvalvePosition(self, param, time_s):
+        return self._start_rotor_move(1, True, time_s)
+
+    def _on_ForceStop(self, param, time_s):
+        if self.is_moving(time_s):
+            if self.rotor.reply is not None:
+                self.rotor.reply.cancelled = True
+            stopped_at = self.rotor.position(time_s)
+            self.rotor = _Motion(time_s, time_s, stopped_at, stopped_at)
+        return [(time_s, ReplyStatus.NormalState, 0)]
+
+
+class SimulatedMultiChannelSyringePump(SimulatedSyringePump):
+    """A syringe pump with an integrated rotary valve (SY01B)."""
+
+    def __init__(self, address: int = 0x00, codes=None,
+                 max_position_steps: int = 6000, position_count: int = 6,
+                 port_switch_s: float = 0.05, **kwargs):
+        """Init.
+
+        :param port_switch_s: time to rotate the valve from one port to the
+            adjacent one. The valve always takes the shortest way.
+        """
+        if codes is None:
+            from runze_control.protocol_codes import sy01_codes
+            codes = sy01_codes
+        super().__init__(address=address, codes=codes,
+                         max_position_steps=max_position_steps, **kwargs)
+        self.position_count = position_count
+        self.port_switch_s = port_switch_s
+        self.valve_history = _MotionHistory(_Motion(0, 0, 1, 1))  # In ports.
+
+    @property
+    def valve(self):
+        return self.valve_history.current
+
+    @valve.setter
+    def valve(self, motion: _Motion):
+        self.valve_history.append(motion)
+
+    def valve_port(self, time_s: float):
+        return round(self.valve.position(time_s)) if self.valve.end_s <= time_s \
+            else 0
+
+    def valve_ports(self, times_s):
+        """Valve ports at (an array of) times (0 while rotating)."""
+        ports = np.rint(self.valve_history.positions(times_s)).astype(int)
+        ports[self.valve_history.moving(times_s)] = 0
+        return ports
+
+    def is_moving(self, time_s: float):
+        return super().is_moving(time_s) or time_s < self.valve.end_s
+
+    def _start_valve_move(self, target: int, time_s: float):
+        if self.is_moving(time_s):
+            return [(time_s, ReplyStatus.MotorBusy, 0)]
+        if not (1 <= target <= self.position_count):
+            return [(time_s, ReplyStatus.ParameterError, 0)]
+        start = self.valve_port(time_s)
+        transitions = min((target - start) % self.position_count,
+                          (start - target) % self.position_count)
+        end, duration_s, status = self._end_move(
+            start, target, transitions * self.port_switch_s)
+        self.valve = _Motion(time_s, time_s + duration_s, start, round(end))
+        return [(time_s + duration_s, status, 0, self.valve)]
+
+    def _start_plunger_move(self, target: int, time_s: float):
+        if time_s < self.valve.end_s:
+            return [(time_s, ReplyStatus.MotorBusy, 0)]
+        return super()._start_plunger_move(target, time_s)
+
+    def _on_MovePlungerAbsolute(self, param, time_s):
+        return self._start_plunger_move(param, time_s)
+
+    def _on_MoveValveToPort(self, param, time_s):
+        return self._start_valve_move(param, time_s)
+
+    def _on_ResetValvePosition(self, param, time_s):
+        return self._start_valve_move(1, time_s)
+
+    def _on_GetValveStatus(self, param, time_s):
+        return [(time_s, ReplyStatus.NormalState, self.valve_port(time_s))]
+
+    def _on_RunInCCW(self, param, time_s):
+        # 0x43 rotates the valve (not the plunger) on this model.
+        return [(time_s, ReplyStatus.ParameterError, 0)]
+
+    def _on_ForceStop(self, param, time_s):
+        if time_s < self.valve.end_s:
+            if self.valve.reply is not None:
+                self.valve.reply.cancelled = True
+            stopped_at = round(self.valve.position(time_s))
+            self.valve = _Motion(time_s, time_s, stopped_at, stopped_at)
+        return super()._on_ForceStop(param, time_s)
+
+
+class SimulatedBus:
+    """A simulated serial bus with any number of simulated devices on it.
+
+    Buses are registered by name and opened as ``sim://<name>``. As on a real
+    RS-485 line, every open handle receives every reply, whichever handle
+    sent the command.
+    """
+
+    _buses = {}
+
+    def __init__(self, name: str, baudrate: int = 9600,
+                 interface: str = "rs232", response_latency_s: float = 0.0005,
+                 reply_loss: float = 0.0, reply_corruption: float = 0.0,
+                 seed: int = None):
+        """Init.
+
+        :param baudrate: default baud rate of devices added to this bus.
+        :param interface: "rs232" or "rs485". Selects which of the devices'
+            baud rate settings apply.
+        :param response_latency_s: device processing time between the end of
+            a received frame and the start of its reply.
+        :param reply_loss: probability that a reply never reaches the host.
+        :param reply_corruption: probability that a reply arrives with a
+            flipped bit.
+        :param seed: seed for the loss and corruption draws.
+        """
+        self.name = name
+        self.baudrate = baudrate
+        self.interface = interface
+        self.response_latency_s = response_latency_s
+        self.reply_loss = reply_loss
+        self.reply_corruption = reply_corruption
+        self.rng = np.random.default_rng(seed)
+        self.devices = []
+        self.handles = weakref.WeakSet()  # Open SimulatedSerial handles.
+        self.line_free_s = 0  # When the host's last frame finishes sending.
+        self.lock = threading.RLock()
+        self.wire_log = []  # (frame end time, frame) of every host frame.
+        self.plugged_in_s = 0  # When the (simulated) USB adapter returns.
+        self.plug_count = 0  # Handles opened before the last unplug are dead.
+        SimulatedBus._buses[name] = self
+
+    @classmethod
+    def get(cls, name: str):
+        return cls._buses[name]
+
+    @property
+    def url(self):
+        return f"sim://{self.name}"
+
+    def add_device(self, device: SimulatedDevice):
+        device.bus = self
+        if device.rs232_baudrate is None:
+            device.rs232_baudrate = self.baudrate
+        if device.rs485_baudrate is None:
+            device.rs485_baudrate = self.baudrate
+        self.devices.append(device)
+        return device
+
+    def power_cycle(self):
+        """Power cycle every device on the bus."""
+        with self.lock:
+            for device in self.devices:
+                device.power_cycle()
+
+    def unplug(self, duration_s: float):
+        """Drop the host's USB-serial adapter for `duration_s`. Devices keep
+        running, but open handles fail for good (like a re-enumerated tty),
+        and new ones can't be opened until the adapter is back."""
+        with self.lock:
+            self.plug_count += 1
+            self.plugged_in_s = perf_counter() + duration_s
+
+    def is_plugged_in(self):
+        return perf_counter() >= self.plugged_in_s
+
+    def transfer_time_s(self, num_bytes: int, baudrate: int = None):
+        return num_bytes * BITS_PER_BYTE / (baudrate or self.baudrate)
+
+    def transmit(self, handle, data: bytes):
+        """Put host bytes on the wire and dispatch complete frames.
+        Return the time at which the last byte has been sent."""
+        with self.lock:
+            start_s = max(perf_counter(), self.line_free_s)
+            self.line_free_s = start_s + self.transfer_time_s(len(data),
+                                                              handle.baudrate)
+            handle.rx_frame_buffer += data
+            self._dispatch(handle, start_s)
+            return self.line_free_s
+
+    def _dispatch(self, handle, start_s: float):
+        buf = handle.rx_frame_buffer
+        sent_s = start_s
+        while len(buf):
+            if buf[0] != runze_protocol.PacketFields.STX:
+                del buf[0]  # Resynchronize on the next frame start.
+                continue
+            if len(buf) < runze_protocol.COMMON_CMD_NUM_BYTES:
+                return
+            frame_len = runze_protocol.COMMON_CMD_NUM_BYTES \
+                if buf[5] == runze_protocol.PacketFields.ETX \
+                else runze_protocol.FACTORY_CMD_NUM_BYTES
+            if len(buf) < frame_len:
+                return
+            frame = bytes(buf[:frame_len])
+            del buf[:frame_len]
+            sent_s += self.transfer_time_s(frame_len, handle.baudrate)
+            self.wire_log.append((sent_s, frame))
+            if sum(frame[:-2]) & 0xFFFF != int.from_bytes(frame[-2:], 'little'):
+                continue  # Devices ignore frames with bad checksums.
+            self._deliver(handle, frame, sent_s)
+
+    def _deliver(self, handle, frame: bytes, time_s: float):
+        address, func = frame[1], frame[2]
+        if len(frame) == runze_protocol.COMMON_CMD_NUM_BYTES:
+            param = frame[3] | (frame[4] << 8)
+        else:
+            password = runze_protocol.FACTORY_CMD_PWD_CODE.to_bytes(4, 'big')
+            if frame[3:7] != password:
+                return  # Devices ignore factory frames without the password.
+            param = int.from_bytes(frame[7:11], 'little')
+        for device in self.devices:
+            multicast = address in device.multicast_addresses
+            if device.address != address and not multicast:
+                continue
+            if device.baudrate(self.interface) != handle.baudrate:
+                continue  # The device sees garbage. Ignore it.
+            if len(frame) == runze_protocol.COMMON_CMD_NUM_BYTES:
+                replies = device.handle(func, param, time_s)
+            else:
+                replies = device.handle_factory(func, param, time_s)
+            if multicast:
+                continue  # Devices don't reply to multicast frames.
+            for reply_s, status, parameter, *motion in replies:
+                ready_s = reply_s + self.response_latency_s \
+                    + self.transfer_time_s(runze_protocol.REPLY_NUM_BYTES,
+                                           handle.baudrate)
+                data = encode_reply(device.address, status, parameter)
+                draw = self.rng.random()
+                if draw < self.reply_loss:
+                    continue
+                if draw < self.reply_loss + self.reply_corruption:
+                    data = bytearray(data)
+                    data[self.rng.integers(len(data))] ^= \
+                        1 << int(self.rng.integers(8))
+                    data = bytes(data)
+                reply = _Reply(ready_s, data)
+                if motion:
+                    motion[0].reply = reply
+                for listener in list(self.handles):
+                    listener.push_reply(reply)
+
+
+class SimulatedSerial(serial.SerialBase):
+    """pyserial handle on a :class:`SimulatedBus` (opened via ``sim://<name>``).
+
+    Reads never block for longer than the configured timeout, and `flush`
+    waits until every written byte would have left the wire.
+    """
+
+    def open(self):
+        if self.is_open:
+            raise serial.SerialException("Port is already open.")
+        if self._port is None:
+            raise serial.SerialException("Port must be configured before it "
+                                         "can be used.")
+        name = self._port.split("://", 1)[-1]
+        try:
+            self.sim_bus = SimulatedBus.get(name)
+        except KeyError:
+            raise serial.SerialException(f"No simulated bus named '{name}'.")
+        if not self.sim_bus.is_plugged_in():
+            raise serial.SerialException(f"Could not open port {self._port}: "
+                                         "no such device.")
+        self._plug_count = self.sim_bus.plug_count
+        self.rx_frame_buffer = bytearray()
+        self._pending = []  # heap of _Reply.
+        self._rx = bytearray()
+        self._lock = threading.Lock()
+        self._tx_done_s = 0
+        self.is_open = True
+        self.sim_bus.handles.add(self)
+
+    def close(self):
+        self.is_open = False
+        if hasattr(self, 'sim_bus'):
+            self.sim_bus.handles.discard(self)
+
+    def _reconfigure_port(self):
+        pass
+
+    def push_reply(self, reply: _Reply):
+        with self._lock:
+            heapq.heappush(self._pending, reply)
+
+    def _check_plugged_in(self):
+        if self._plug_count != self.sim_bus.plug_count:
+            raise serial.SerialException("device reports readiness to read "
+                                         "but returned no data (device "
+                                         "disconnected?)")
+
+    def _collect(self):
+        self._check_plugged_in()
+        now = perf_counter()
+        with self._lock:
+            while self._pending and self._pending[0].time_s <= now:
+                reply = heapq.heappop(self._pending)
+                if not reply.cancelled:
+                    self._rx += reply.data
+
+    @property
+    def in_waiting(self):
+        self._collect()
+        return len(self._rx)
+
+    def read(self, size: int = 1):
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+        deadline_s = None if self._timeout is None \
+            else perf_counter() + self._timeout
+        while True:
+            self._collect()
+            if len(self._rx) >= size:
+                break
+            if deadline_s is not None and perf_counter() >= deadline_s:
+                break
+        with self._lock:
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+        return data
+
+    def write(self, data: bytes):
+        if not self.is_open:
+            raise serial.PortNotOpenError()
+        self._check_plugged_in()
+        data = bytes(data)
+        self._tx_done_s = self.sim_bus.transmit(self, data)
+        return len(data)
+
+    def flush(self):
+        remaining_s = self._tx_done_s - perf_counter()
+        if remaining_s > 0:
+            sleep(remaining_s)
+
+    def reset_input_buffer(self):
+        self._collect()
+        with self._lock:
+            self._rx.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+
+class SimulatedSerialServer:
+    """Serves a :class:`SimulatedBus` over TCP like a serial-to-Ethernet
+    converter (raw TCP mode), so devices can connect to it with a
+    ``socket://host:port`` url.
+
+    Each client connection gets its own handle on the bus, so every client
+    receives every reply.
+    """
+
+    POLL_INTERVAL_S = 0.0002  # How often to forward replies to clients.
+
+    def __init__(self, sim_bus: SimulatedBus, host: str = "127.0.0.1",
+                 port: int = 0):
+        """Init and start serving.
+
+        :param port: TCP port. 0 picks a free one (see :attr:`url`).
+        """
+        self.sim_bus = sim_bus
+        self.clients = 0  # Number of connections accepted so far.
+        self._server = socket.create_server((host, port))
+        self._stopped = threading.Event()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self._server.getsockname()[:2]
+        return f"socket://{host}:{port}"
+
+    def close(self):
+        self._stopped.set()
+        self._server.close()
+
+    def _accept(self):
+        while not self._stopped.is_set():
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return  # Closed.
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.clients += 1
+            threading.Thread(target=self._serve, args=(client,),
+                             daemon=True).start()
+
+    def _serve(self, client: socket.socket):
+        handle = SimulatedSerial(self.sim_bus.url, self.sim_bus.baudrate,
+                                 timeout=0)
+        with client, closing(handle):
+            while not self._stopped.is_set():
+                readable, _, _ = select.select([client], [], [],
+                                               self.POLL_INTERVAL_S)
+                if readable:
+                    data = client.recv(4096)
+                    if not data:
+                        return  # Client disconnected.
+                    handle.write(data)
+                if handle.in_waiting:
+                    client.sendall(handle.read(handle.in_waiting))
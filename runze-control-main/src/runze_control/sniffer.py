@@ -0,0 +1,315 @@
+"""Passively decode Runze Protocol traffic on a bus.
+
+Run as a tool with::
+
+    python -m runze_control.sniffer /dev/ttyUSB0 --baudrate 115200 \\
+        --model 0=SY08 --model 3=SV-04 --capture capture.csv
+
+"""
+from collections import deque
+from dataclasses import dataclass
+from runze_control import runze_protocol
+from runze_control.protocol_codes import common_codes, registry
+from runze_control.runze_protocol import PacketFields, ReplyStatus
+from serial import serial_for_url
+from time import perf_counter
+import argparse
+import numpy as np
+import struct
+import threading
+
+# Status codes never collide with common command codes (0x20 and up), so the
+# third byte tells replies and commands apart.
+_REPLY_STATUSES = frozenset(int(s) for s in ReplyStatus)
+_FACTORY_PASSWORD = runze_protocol.FACTORY_CMD_PWD_CODE.to_bytes(4, 'big')
+_COMMON = struct.Struct("<BBBHBH")
+_STX = bytes([PacketFields.STX])
+
+
+@dataclass
+class Frame:
+    """One decoded frame."""
+    time_s: float  # When its last byte arrived (:func:`time.perf_counter`).
+    kind: str  # "command", "factory", or "reply".
+    address: int
+    code: int  # Command code or reply status.
+    parameter: int
+    name: str  # Command name or reply status name.
+    latency_s: float = None  # Of a reply: time since its command.
+
+
+class FrameDecoder:
+    """Splits a byte stream into Runze Protocol frames and decodes them.
+
+    Bytes that don't form a valid frame (i.e: line noise, traffic at another
+    baud rate) are skipped and counted in `garbage_bytes`.
+    """
+
+    def __init__(self, baudrate: int = None, models: dict = None):
+        """Init.
+
+        :param baudrate: line rate. Used to timestamp each frame within a
+            chunk of received bytes.
+        :param models: optional dict mapping addresses to models in
+            :data:`registry.MODELS` (i.e: {0: "SY08"}) to name their commands.
+            Codes from other addresses are named after every model that
+            defines them (i.e: "GetValveStatus/RunInCCW").
+        """
+        self.byte_s = 0 if baudrate is None else 10 / baudrate
+        self.garbage_bytes = 0
+        self._buffer = bytearray()
+        self._names = {}  # (address, code) -> name.
+        self._default_names = {}  # code -> name.
+        for address, model in (models or {}).items():
+            for cmd in registry.command_table(model):
+                self._names.setdefault((address, cmd.value), cmd.name)
+        names = {}
+        for model in registry.MODELS:
+            for cmd in registry.command_table(model):
+                names.setdefault(cmd.value, set()).add(cmd.name)
+        for cmd in common_codes.CommonCmd:  # Prefer the common name.
+            names[cmd.value] = {cmd.name}
+        self._default_names = {code: "/".join(sorted(n))
+                               for code, n in names.items()}
+
+    def name(self, address: int, code: int):
+        name = self._names.get((address, code))
+        if name is None:
+            name = self._default_names.get(code, f"0x{code:02X}")
+        return name
+
+    def feed(self, data: bytes, time_s: float):
+        """Decode the frames completed by `data` (received at `time_s`)."""
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        start = 0
+        end = len(buffer)
+        while True:
+            stx = buffer.find(_STX, start)
+            if stx < 0:
+                self.garbage_bytes += end - start
+                start = end
+                break
+            self.garbage_bytes += stx - start
+            start = stx
+            if end - start < runze_protocol.COMMON_CMD_NUM_BYTES:
+                break  # Wait for the rest.
+            frame = self._decode(buffer, start, end, time_s)
+            if frame is None:  # Incomplete factory frame.
+                break
+            if frame is False:  # Not a frame. Resync on the next STX.
+                self.garbage_bytes += 1
+                start += 1
+                continue
+            frames.append(frame[0])
+            start += frame[1]
+        del buffer[:start]
+        return frames
+
+    def _decode(self, buffer: bytearray, start: int, end: int, time_s: float):
+        """Return (frame, length), None if more bytes are needed, or False if
+        there is no frame at `start`."""
+        n = runze_protocol.COMMON_CMD_NUM_BYTES
+        if buffer[start + 5] == PacketFields.ETX:
+            stx, address, code, parameter, etx, checksum = \
+                _COMMON.unpack_from(buffer, start)
+            if sum(buffer[start:start + 6]) & 0xFFFF == checksum:
+                frame_time_s = time_s - (end - start - n) * self.byte_s
+                if code in _REPLY_STATUSES:
+                    return Frame(frame_time_s, "reply", address, code,
+                                 parameter, ReplyStatus(code).name), n
+                return Frame(frame_time_s, "command", address, code,
+                             parameter, self.name(address, code)), n
+        n = runze_protocol.FACTORY_CMD_NUM_BYTES
+        if buffer[start + 3:start + 7] != _FACTORY_PASSWORD[:end - start - 3]:
+            return False
+        if end - start < n:
+            return None
+        if buffer[start + 11] != PacketFields.ETX or sum(
+                buffer[start:start + 12]) & 0xFFFF != \
+                int.from_bytes(buffer[start + 12:start + 14], 'little'):
+            return False
+        code = buffer[start + 2]
+        name = common_codes.FactoryCmd(code).name \
+            if code in common_codes.FactoryCmd._value2member_map_ \
+            else f"0x{code:02X}"
+        return Frame(time_s - (end - start - n) * self.byte_s, "factory",
+                     buffer[start + 1], code,
+                     int.from_bytes(buffer[start + 7:start + 11], 'little'),
+                     name), n
+
+
+class AddressStats:
+    """Traffic statistics of one address."""
+
+    LATENCY_HISTORY = 10000  # Latency samples kept.
+
+    def __init__(self):
+        self.commands = 0
+        self.replies = 0
+        self.errors = 0  # Replies with a status other than NormalState.
+        self.unanswered = 0  # Commands followed by another command instead
+                             # of a reply.
+        self.latencies_s = deque(maxlen=self.LATENCY_HISTORY)
+
+    def latency_stats(self):
+        """Return a dict of reply latency statistics (seconds) or None if no
+        replies were seen."""
+        if not self.latencies_s:
+            return None
+        samples = np.array(self.latencies_s)
+        return {'count': len(samples), 'mean_s': float(samples.mean()),
+                'p99_s': float(np.percentile(samples, 99)),
+                'max_s': float(samples.max())}
+
+
+class BusSniffer:
+    """Reads a bus passively, decodes every frame, pairs commands with their
+    replies, and keeps per-address statistics.
+
+    Bytes are read in bulk (whatever has arrived, blocking up to
+    `read_timeout_s` for the first byte) and nothing is logged per frame, so
+    a busy 115200[bps] bus costs only a few percent of one CPU.
+    """
+
+    def __init__(self, port: str, baudrate: int, models: dict = None,
+                 capture_path: str = None, read_timeout_s: float = 0.05):
+        """Init.
+
+        :param port: com port or pyserial url of the listen-only tap.
+        :param models: optional dict mapping addresses to models (see
+            :class:`FrameDecoder`).
+        :param capture_path: optional CSV file to record every frame to.
+        """
+        self.ser = serial_for_url(port, baudrate, timeout=read_timeout_s)
+        self.decoder = FrameDecoder(baudrate, models)
+        self.stats = {}  # address -> AddressStats.
+        self.frames = 0
+        self._pending = {}  # address -> time of its unanswered command.
+        self._capture = None
+        if capture_path is not None:
+            self._capture = open(capture_path, 'w', buffering=1 << 16)
+            self._capture.write("time_s,kind,address,code,name,parameter,"
+                                "latency_s\n")
+        self._stopped = threading.Event()
+
+    def run(self, duration_s: float = None, on_frames=None):
+        """Sniff until :meth:`stop` is called (or for `duration_s`).
+
+        :param on_frames: optional callback receiving each list of newly
+            decoded frames.
+        """
+        self._stopped.clear()
+        end_s = None if duration_s is None else perf_counter() + duration_s
+        try:
+            while not self._stopped.is_set():
+                if end_s is not None and perf_counter() >= end_s:
+                    break
+                data = self.ser.read(max(self.ser.in_waiting, 1))
+                if not data:
+                    continue
+                frames = self.decoder.feed(data, perf_counter())
+                if frames:
+                    self._account(frames)
+                    if on_frames is not None:
+                        on_frames(frames)
+        finally:
+            if self._capture is not None:
+                self._capture.flush()
+
+    def stop(self):
+        self._stopped.set()
+
+    def close(self):
+        self.stop()
+        self.ser.close()
+        if self._capture is not None:
+            self._capture.close()
+
+    def _account(self, frames: list):
+        self.frames += len(frames)
+        for frame in frames:
+            stats = self.stats.get(frame.address)
+            if stats is None:
+                stats = self.stats[frame.address] = AddressStats()
+            if frame.kind == "reply":
+                stats.replies += 1
+                if frame.code != ReplyStatus.NormalState:
+                    stats.errors += 1
+                sent_s = self._pending.pop(frame.address, None)
+                if sent_s is not None:
+                    frame.latency_s = frame.time_s - sent_s
+                    stats.latencies_s.append(frame.latency_s)
+            else:
+                stats.commands += 1
+                if frame.address in self._pending:
+                    stats.unanswered += 1
+                self._pending[frame.address] = frame.time_s
+            if self._capture is not None:
+                latency = "" if frame.latency_s is None \
+                    else f"{frame.latency_s:.6f}"
+                self._capture.write(
+                    f"{frame.time_s:.6f},{frame.kind},{frame.address},"
+                    f"{frame.code},{frame.name},{frame.parameter},{latency}\n")
+
+    def summary(self):
+        """Return a multi-line, human-readable summary of the statistics."""
+        lines = [f"{self.frames} frames, {self.decoder.garbage_bytes} garbage "
+                 "bytes."]
+        for address in sorted(self.stats):
+            stats = self.stats[address]
+            line = (f"  0x{address:02X}: {stats.commands} commands, "
+                    f"{stats.replies} replies, {stats.errors} errors, "
+                    f"{stats.unanswered} unanswered")
+            latency = stats.latency_stats()
+            if latency is not None:
+                line += (f", latency mean {latency['mean_s']*1e3:.2f}[ms] "
+                         f"p99 {latency['p99_s']*1e3:.2f}[ms] "
+                         f"max {latency['max_s']*1e3:.2f}[ms]")
+            lines.append(line + ".")
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Passively decode Runze Protocol traffic on a bus.")
+    parser.add_argument("port", help="com port (or pyserial url) of the tap")
+    parser.add_argument("--baudrate", type=int, default=9600)
+    parser.add_argument("--model", action="append", default=[],
+                        metavar="ADDRESS=MODEL",
+                        help="model at an address, i.e: 0=SY08 (repeatable). "
+                             f"Models: {', '.join(registry.MODELS)}.")
+    parser.add_argument("--capture", help="CSV file to record frames to")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="statistics printout interval [s]")
+    parser.add_argument("--frames", action="store_true",
+                        help="print every decoded frame")
+    args = parser.parse_args()
+    models = {}
+    for entry in args.model:
+        address, model = entry.split("=", 1)
+        models[int(address, 0)] = model
+
+    def print_frames(frames: list):
+        for frame in frames:
+            latency = "" if frame.latency_s is None \
+                else f" ({frame.latency_s*1e3:.2f}[ms])"
+            print(f"{frame.time_s:.6f} {frame.kind:>7} 0x{frame.address:02X} "
+                  f"{frame.name} {frame.parameter}{latency}")
+
+    sniffer = BusSniffer(args.port, args.baudrate, models, args.capture)
+    try:
+        while True:
+            sniffer.run(args.interval,
+                        on_frames=print_frames if args.frames else None)
+            print(sniffer.summary())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sniffer.close()
+        print(sniffer.summary())
+
+
+if __name__ == "__main__":
+    main()
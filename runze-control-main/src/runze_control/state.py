@@ -0,0 +1,90 @@
+"""Persist driver-side device state (i.e: plunger position) across restarts."""
+from runze_control.runze_device import RunzeDevice
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """Crash-safe store of driver-side device state, keyed by port, address,
+    and model.
+
+    The store is a small JSON file that is rewritten atomically (written to a
+    temporary file, flushed to disk, and renamed over the original) whenever
+    an attached device's state changes, so a crash at any point leaves either
+    the old or the new state on disk, never a partial one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records = {}
+        try:
+            with open(path, 'r') as f:
+                self._records = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            logger.warning(f"Ignoring unreadable state file: {path}.")
+
+    @staticmethod
+    def key(device: RunzeDevice):
+        return f"{device.bus.com_port}|{device.address}|" \
+               f"{device.__class__.__name__}"
+
+    def get(self, device: RunzeDevice):
+        """Return the persisted state of a device (None if there is none)."""
+        with self._lock:
+            record = self._records.get(self.key(device))
+            return dict(record) if record is not None else None
+
+    def attach(self, device: RunzeDevice):
+        """Attach a device to the store so that its state is saved after every
+        confirmed command.
+
+        If the device has a persisted state, it is reconciled against the
+        device itself (i.e: the reported plunger position) and reused if they
+        agree.
+
+        :return: True if a persisted state was reused (i.e: the syringe does
+            not need to be homed).
+        """
+        record = self.get(device)
+        reused = record is not None and device._reconcile_state(record)
+        device.state_store = self
+        if reused:
+            logger.debug(f"Reusing persisted state of {self.key(device)}: "
+                         f"{record}.")
+        else:
+            self.save(device)
+        return reused
+
+    def detach(self, device: RunzeDevice):
+        device.state_store = None
+
+    def save(self, device: RunzeDevice):
+        """Persist the current state of a device (if it changed)."""
+        key = self.key(device)
+        state = device._get_state()
+        with self._lock:
+            if self._records.get(key) == state:
+                return
+            self._records[key] = state
+            self._write()
+
+    def forget(self, device: RunzeDevice):
+        """Drop the persisted state of a device (i.e: after a power cycle)."""
+        with self._lock:
+            if self._records.pop(self.key(device), None) is not None:
+                self._write()
+
+    def _write(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._records, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,158 @@
+"""Snapshots of device status, read in one pipelined burst of queries."""
+from dataclasses import dataclass
+from runze_control import runze_protocol
+from runze_control.runze_protocol import ReplyStatus
+from serial import SerialException
+from time import perf_counter, time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DeviceStatus:
+    """Status of one device (see :meth:`RunzeDevice.snapshot`). Fields the
+    device model can't report are None."""
+    model: str  # Driver class name, i.e: "SY08".
+    port: str
+    address: int  # Address the driver talks to.
+    timestamp: float  # When the queries were sent (:func:`time.time`).
+    time_s: float  # Same, in the :func:`time.perf_counter` timebase.
+    latency_s: float  # From sending the queries to receiving every reply.
+    reported_address: int = None
+    rs232_baudrate: int = None
+    rs485_baudrate: int = None
+    firmware_version: float = None
+    motor_status: ReplyStatus = None
+    position_steps: int = None  # Syringe plunger position.
+    port_position: int = None  # Valve port (0 if between ports).
+
+    @property
+    def busy(self):
+        return self.motor_status == ReplyStatus.MotorBusy
+
+
+def snapshot(devices: list):
+    """Snapshot many devices at once. The queries for every device on a bus
+    go out in one write (see :func:`_snapshot_bus`), and buses are read in
+    parallel (one thread per bus).
+
+    :return: dict mapping each device to its :class:`DeviceStatus` or to the
+        exception raised while reading it.
+    """
+    start_s = perf_counter()
+    by_bus = {}
+    for device in devices:
+        by_bus.setdefault(device.bus, []).append(device)
+    results = {}
+
+    def snapshot_bus(bus_devices: list):
+        # Replies are told apart by address, so a batch holds each address
+        # once.
+        while bus_devices:
+            batch = {}
+            for device in bus_devices:
+                batch.setdefault(device.address, device)
+            batch = list(batch.values())
+            try:
+                results.update(_snapshot_bus(batch))
+            except Exception as e:
+                results.update({device: e for device in batch})
+            bus_devices = [d for d in bus_devices if d not in batch]
+
+    threads = [threading.Thread(target=snapshot_bus, args=(bus_devices,),
+                                daemon=True) for bus_devices in by_bus.values()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    failures = [d for d, r in results.items() if isinstance(r, Exception)]
+    logger.debug(f"Snapshot of {len(devices)} device(s) on {len(by_bus)} "
+                 f"bus(es) in {perf_counter() - start_s:.3f}[s].")
+    for device in failures:
+        logger.error(f"Could not snapshot device at address {device.address} "
+                     f"on {device.bus.com_port}: {results[device]}")
+    return results
+
+
+def _snapshot_bus(devices: list):
+    """Snapshot devices on one bus (each at its own address) with every
+    device's queries in a single write. The connection routes each reply to
+    the device it comes from (see
+    :class:`~runze_control.transport.SharedConnection`), so each device reads
+    its own replies.
+
+    :return: dict mapping each device to its :class:`DeviceStatus` or to the
+        exception raised while reading it.
+    """
+    results = {}
+    queries = {}  # device -> (fields, funcs)
+    for device in devices:
+        try:
+            queries[device] = device._status_queries()
+        except Exception as e:
+            results[device] = e
+    if not queries:
+        return results
+    bus = next(iter(queries)).bus
+    replies = {device: bytes() for device in queries}
+    latencies_s = {}
+    with bus.transaction():
+        for device in list(queries):
+            if device.cmd_send_time_s is not None:
+                results[device] = RuntimeError(
+                    "Cannot issue a command while the previous command has "
+                    "not yet replied.")
+                del queries[device], replies[device]
+                continue
+            device._resync_if_reconnected()
+        if not queries:
+            return results
+        packets = b''.join(device._encode_common_cmd_runze(func)
+                           for device, (_, funcs) in queries.items()
+                           for func in funcs)
+        expected = {device: len(funcs) * runze_protocol.REPLY_NUM_BYTES
+                    for device, (_, funcs) in queries.items()}
+        # Counts from the end of the burst. The replies may follow it.
+        timeout_s = max(d.DEFAULT_TIMEOUT_S for d in queries) \
+            + bus.transfer_time_s(sum(expected.values()))
+        timestamp = time()
+        logger.debug(f"Sending {sum(len(f) for _, f in queries.values())} "
+                     f"pipelined queries to {len(queries)} device(s).")
+        sent_s = perf_counter()
+        bus.write(next(iter(queries)).ser, packets)
+        deadline_s = perf_counter() + timeout_s
+        for device in queries:
+            device.cmd_send_time_s = sent_s
+        try:
+            pending = set(queries)
+            while pending and perf_counter() < deadline_s:
+                for device in list(pending):
+                    try:
+                        replies[device] += device.ser.read(
+                            expected[device] - len(replies[device]))
+                    except SerialException:
+                        pass
+                    if len(replies[device]) >= expected[device]:
+                        latencies_s[device] = perf_counter() - sent_s
+                        pending.discard(device)
+        finally:
+            for device in queries:
+                device.cmd_send_time_s = None
+        for device in queries:
+            device._resync_if_reconnected()
+    n = runze_protocol.REPLY_NUM_BYTES
+    for device, (fields, funcs) in queries.items():
+        reply = replies[device]
+        try:
+            if len(reply) < expected[device]:
+                raise SerialException(f"Only received {len(reply) // n} of "
+                                      f"{len(funcs)} replies from device.")
+            parsed = [device._parse_runze_reply(reply[i:i+n])
+                      for i in range(0, expected[device], n)]
+            results[device] = device._status_from_replies(
+                fields, parsed, timestamp, sent_s, latencies_s[device])
+        except Exception as e:
+            results[device] = e
+    return results
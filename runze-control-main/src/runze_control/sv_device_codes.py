@@ -2,7 +2,6 @@
 from enum import IntEnum
 
 # Port-to-Port Dead Volumes for various specific models
-# TODO: make dict, keyed by part number sub-fields.
 SV01_DEAD_VOLUME_UL = 4.5
 SV07_X_S_T6_DEAD_VOLUME_UL = 27.5
 SV07_X_S_T8_DEAD_VOLUME_UL = SV07_X_S_T6_DEAD_VOLUME_UL
@@ -10,6 +9,17 @@ SV07_X_S_T10_DEAD_VOLUME_UL = SV07_X_S_T6_DEAD_VOLUME_UL
 SV07_X_S_T12_DEAD_VOLUME_UL = 22.43
 SV07_X_S_T16_DEAD_VOLUME_UL = 33.68
 
+# Keyed by part number (without the variable sub-fields).
+DEAD_VOLUME_UL = \
+{
+    "SV01": SV01_DEAD_VOLUME_UL,
+    "SV07-T6": SV07_X_S_T6_DEAD_VOLUME_UL,
+    "SV07-T8": SV07_X_S_T8_DEAD_VOLUME_UL,
+    "SV07-T10": SV07_X_S_T10_DEAD_VOLUME_UL,
+    "SV07-T12": SV07_X_S_T12_DEAD_VOLUME_UL,
+    "SV07-T16": SV07_X_S_T16_DEAD_VOLUME_UL,
+}
+
 
 class CommonCmdCode(IntEnum):
     """Codes to issue when querying/specifying the states of various settings
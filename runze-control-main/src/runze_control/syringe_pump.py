@@ -1,15 +1,29 @@
 """Protocol codes common to all syringe pumps."""
 from runze_control.protocol import Protocol
+from runze_control import runze_protocol
 from runze_control.runze_protocol import ReplyStatus
 from runze_control.runze_device import RunzeDevice
 from runze_control.protocol_codes import syringe_pump_codes
 from runze_control.protocol_codes import mini_sy04_codes
 from runze_control.protocol_codes import sy08_codes
+from runze_control.volume import Calibration, VolumeConverter
+from serial import SerialException
 from typing import Union
+import logging
 
 
 class SyringePump(RunzeDevice):
 
+    # Relative plunger moves: command name -> direction of travel in steps.
+    RELATIVE_PLUNGER_MOVES = {'RunInCW': -1, 'RunInCCW': 1}
+
+    STATUS_QUERIES = \
+    {
+        **RunzeDevice.STATUS_QUERIES,
+        'motor_status': (('GetMotorStatus',), ReplyStatus),
+        'position_steps': (('GetSyringePosition',), int),
+    }
+
     def __init__(self, com_port: str, baudrate: int = None,
                  address: int = None,
                  protocol: Union[str, Protocol] = Protocol.RUNZE,
@@ -30,6 +44,11 @@ class SyringePump(RunzeDevice):
         self.syringe_volume_ul = syringe_volume_ul
         self.syringe_speed_percent = None
         self.driver_steps = 0
+        self.volume_converter = None
+        self._ul_per_step = None
+        if syringe_volume_ul is not None:
+            self.set_calibration(Calibration.linear(syringe_volume_ul,
+                                                    self.max_position_steps))
         # Connect to port.
         super().__init__(com_port=com_port, baudrate=baudrate,
                          address=address, protocol=protocol)
@@ -38,21 +57,106 @@ class SyringePump(RunzeDevice):
                                          # self.codes if needed (i.e: if we
                                          # added to them) and hold a superset.
 
+    def set_calibration(self, calibration: Union[Calibration, str]):
+        """Use a measured volume-to-steps calibration for volume-based moves.
+
+        :param calibration: a :class:`~runze_control.volume.Calibration` or
+            the path of a file saved with :meth:`Calibration.save`.
+        """
+        if not isinstance(calibration, Calibration):
+            calibration = Calibration.load(calibration)
+        self.volume_converter = VolumeConverter(calibration)
+        self._ul_per_step = calibration.max_volume_ul / calibration.steps[-1]
+
     def reset_syringe_position(self, wait: bool = True):
-        """Reset and home the syringe."""
+        """Reset and home the syringe.
+
+        If not `wait`, return once the reset has started. Then, once the reset
+        replies, call :meth:`synchronize_reset_position` to finish it.
+        """
         self.log.debug("Requesting default speed. If device is freshly "
             "powered on, the speed change will not take place until after the "
             "first reset.")
         self.set_speed_percent(self.__class__.DEFAULT_SPEED_PERCENT)
         self.log.debug(f"Resetting syringe (moving to optocoupler position).")
-        self._send_query_runze(self.codes.CommonCmd.ResetSyringePosition)
+        self._send_common_cmd_runze(self.codes.CommonCmd.ResetSyringePosition,
+                                    wait=wait)
+        if wait:
+            self.synchronize_reset_position()
+
+    def synchronize_reset_position(self):
+        """Mark the (just reached) reset position as position 0."""
         # Per datasheet, after reset, the syringe needs to be told that the
         # reset position is the 0 position.
         self.log.debug(f"Synchronizing syringe position as '0'.")
         self._send_query_runze(self.codes.CommonCmd.SynchronizeSyringePosition)
         self.driver_steps = 0  # Reset local step count.
+        self._save_state()
         self.log.debug(f"Syringe reset.")
 
+    def _get_state(self):
+        return {'driver_steps': self.driver_steps,
+                'speed_percent': self.syringe_speed_percent}
+
+    def _reconcile_state(self, state: dict):
+        """Reuse the persisted state if the device still reports the plunger
+        position we last confirmed (i.e: it has not been power cycled)."""
+        position_steps = self.get_position_steps()
+        if position_steps != state.get('driver_steps'):
+            self.log.warning(f"Persisted position ({state.get('driver_steps')}"
+                             f"[steps]) disagrees with the device "
+                             f"({position_steps}[steps]). Re-home the syringe.")
+            return False
+        # A power-cycled device also reports 0 until it is homed, so 0 only
+        # matches if the device homes itself on power-up.
+        if position_steps == 0 and not self.get_power_on_reset():
+            self.log.warning("Device reports position 0, as it does after a "
+                             "power cycle. Re-home the syringe.")
+            return False
+        self.syringe_speed_percent = state.get('speed_percent')
+        self.log.debug("Reusing persisted state.")
+        return True
+
+    def _resync(self):
+        self.get_position_steps()
+
+    def _rehome(self):
+        self.reset_syringe_position()
+
+    def _restore_speed(self, state: dict):
+        if state.get('speed_percent') is not None:
+            self.set_speed_percent(state['speed_percent'])
+
+    def _restore_position(self, state: dict):
+        if state.get('driver_steps'):
+            self.move_absolute_in_steps(state['driver_steps'])
+
+    def _reconcile_relative_move(self, func, param_value: int):
+        """Read back the plunger position (once it stops) to find out whether
+        a relative plunger move whose reply was lost ran."""
+        cmd = self.codes.CommonCmd._value2member_map_.get(func)
+        direction = None if cmd is None \
+            else self.RELATIVE_PLUNGER_MOVES.get(cmd.name)
+        if direction is None:
+            return super()._reconcile_relative_move(func, param_value)
+        start_steps = self.driver_steps
+        target_steps = start_steps + direction * param_value
+        self._wait_until_stopped()
+        position_steps = self.get_position_steps()
+        if position_steps == start_steps:
+            return None  # Never started. Safe to resend.
+        if position_steps != target_steps:
+            raise SerialException(f"Relative move to {target_steps}[steps] "
+                                  f"lost its reply and stopped at "
+                                  f"{position_steps}[steps].")
+        self.log.warning("Reply to a relative move was lost, but the move "
+                         "completed.")
+        self.driver_steps = start_steps  # The caller applies the move.
+        return dict(zip(runze_protocol.CommonReplyFields,
+                        (runze_protocol.PacketFields.STX, self.address,
+                         ReplyStatus.NormalState, position_steps,
+                         runze_protocol.PacketFields.ETX, None)))
+
     def get_position_steps(self):
         """return the syringe position in linear steps."""
         reply = self._send_query_runze(self.codes.CommonCmd.GetSyringePosition)
@@ -64,16 +168,19 @@ class SyringePump(RunzeDevice):
         return self.driver_steps
 
     def get_position_ul(self):
-        return (self.get_position_steps() * self.syringe_volume_ul
-                / self.max_position_steps)
+        return float(self.volume_converter.calibration.steps_to_ul(
+            self.get_position_steps()))
 
     def get_position_percent(self):
         return self.get_position_steps() * 100.0 / self.max_position_steps
 
     def aspirate(self, microliters: float, wait: bool = True):
         """Relative plunger move to withdraw the specified number of microliters."""
-        steps_per_ul = self.max_position_steps / self.syringe_volume_ul
-        steps = round(microliters * steps_per_ul)
+        steps = self.volume_converter.relative_steps(microliters,
+                                                     self.driver_steps)
+        if not steps:  # Less than a step. It carries into the next move.
+            self.log.debug(f"Skipping {microliters} [uL] move: under 1 step.")
+            return
         self.aspirate_steps(steps, wait=wait)
 
     def withdraw(self, microliters: float, wait: bool = True):
@@ -82,35 +189,48 @@ class SyringePump(RunzeDevice):
 
     def dispense(self, microliters: float, wait: bool = True):
         """Relative plunger move to dispense the specified number of microliters."""
-        steps_per_ul = self.max_position_steps / self.syringe_volume_ul
-        steps = round(microliters * steps_per_ul)
+        steps = -self.volume_converter.relative_steps(-microliters,
+                                                      self.driver_steps)
+        if not steps:  # Less than a step. It carries into the next move.
+            self.log.debug(f"Skipping {microliters} [uL] move: under 1 step.")
+            return
         self.dispense_steps(steps, wait=wait)
 
     def aspirate_steps(self, steps: int, wait: bool = True):
-        ul = steps * self.syringe_volume_ul / self.max_position_steps
-        self.log.debug(f"Aspirating {ul:.2f} [uL] i.e {steps} [steps].")
+        if self.log.isEnabledFor(logging.DEBUG) and self._ul_per_step:
+            self.log.debug(f"Aspirating {steps * self._ul_per_step:.2f} [uL] "
+                           f"i.e {steps} [steps].")
         self._send_common_cmd_runze(self.codes.CommonCmd.RunInCCW, steps, wait)
         self.driver_steps += steps
+        if wait:
+            self._save_state()
 
     def withdraw_steps(self, steps: int, wait: bool = True):
         return self.aspirate_steps(steps, wait=wait)
 
     def dispense_steps(self, steps: int, wait: bool = True):
-        ul = steps * self.syringe_volume_ul / self.max_position_steps
-        self.log.debug(f"Dispensing {ul:.2f} [uL] i.e {steps} [steps].")
+        if self.log.isEnabledFor(logging.DEBUG) and self._ul_per_step:
+            self.log.debug(f"Dispensing {steps * self._ul_per_step:.2f} [uL] "
+                           f"i.e {steps} [steps].")
         self._send_common_cmd_runze(self.codes.CommonCmd.RunInCW, steps, wait)
         self.driver_steps -= steps
+        if wait:
+            self._save_state()
 
     def force_stop(self):
         """Halt the syringe pump in its current location."""
         # SY08 leaves a residual reply that needs to be cleared if we are
         # halting an active movement command.
-        was_busy = super().is_busy()  # Save whether we are waiting on a reply.
+        # Save whether we are waiting on a reply. (Don't read it here; another
+        # thread may hold the bus while waiting on it.)
+        was_busy = self.cmd_send_time_s is not None
+        # If another thread is blocked on that reply, let it consume it.
+        reply_has_waiter = self._reply_waiters > 0
         self._send_common_cmd_runze(self.codes.CommonCmd.ForceStop,
                                     wait=True, force=True)
         # Clear the irrelevant reply from the aborted command.
-        if was_busy:
-            self.wait_for_reply(force=True)
+        if was_busy and not reply_has_waiter:
+            self.wait_for_reply(force=True, timeout_s=self.DEFAULT_TIMEOUT_S)
         # Update local step count.
         self.get_position_steps()
 
@@ -148,6 +268,8 @@ class SyringePump(RunzeDevice):
         self._send_common_cmd_runze(self.codes.CommonCmd.SetDynamicSpeed,
                                     speed_rpm, wait)
         self.syringe_speed_percent = percent # If no errors, save for getter fn.
+        if wait:
+            self._save_state()
 
     def get_speed_percent(self):
         """Return the current speed in percent.
@@ -172,6 +294,13 @@ class SyringePump(RunzeDevice):
 class MiniSY04(SyringePump):
     """Mini SY04 Syringe Pump"""
 
+    STATUS_QUERIES = \
+    {
+        **SyringePump.STATUS_QUERIES,
+        'firmware_version': (('GetFirmwareVersion', 'GetFirmwareSubVersion'),
+                             lambda version, sub: float(f"{version}.{sub}")),
+    }
+
     DEFAULT_SPEED_PERCENT = 60
     SYRINGE_VOLUME_TO_MAX_RPM = \
     {
@@ -304,6 +433,8 @@ class SY08(SyringePump):
         self._send_common_cmd_runze(sy08_codes.CommonCmd.MoveSyringeAbsolute,
                                     steps, wait)
         self.driver_steps = steps
+        if wait:
+            self._save_state()
 
     def move_absolute_in_percent(self, percent: float, wait: bool = True):
         """Absolute move (in percent)."""
@@ -317,3 +448,5 @@ class SY08(SyringePump):
         self._send_common_cmd_runze(sy08_codes.CommonCmd.MoveSyringeAbsolute,
                                     steps, wait)
         self.driver_steps = steps
+        if wait:
+            self._save_state()
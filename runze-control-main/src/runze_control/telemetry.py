@@ -0,0 +1,262 @@
+"""Background telemetry sampling for Runze devices."""
+from runze_control.bus import Bus
+from runze_control.runze_device import RunzeDevice
+from time import perf_counter
+import logging
+import numpy as np
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Telemetry channel name -> device method that samples it.
+CHANNELS = \
+{
+    'position_steps': 'get_position_steps',
+    'motor_status': 'get_motor_status',
+    'port_position': 'get_Port_position',
+}
+
+
+class RingBuffer:
+    """Preallocated, fixed-capacity buffer of timestamped integer samples.
+
+    Samples are stored in a NumPy structured array with a float64 `time_s`
+    field (:func:`time.perf_counter` timebase) followed by one int64 field per
+    channel. Once full, the oldest samples are overwritten.
+    """
+
+    def __init__(self, capacity: int, fields: list):
+        if capacity < 1:
+            raise ValueError("Ring buffer capacity must be at least 1.")
+        self.capacity = capacity
+        self.dtype = np.dtype([('time_s', 'f8')] + [(f, 'i8') for f in fields])
+        self._data = np.zeros(capacity, dtype=self.dtype)
+        self._count = 0  # Total number of samples ever written.
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, time_s: float, **values):
+        """Store one sample. Every channel must be specified."""
+        with self._lock:
+            row = self._data[self._count % self.capacity]
+            row['time_s'] = time_s
+            for name, value in values.items():
+                row[name] = value
+            self._count += 1
+
+    def latest(self):
+        """Return a copy of the most recent sample or None if empty."""
+        with self._lock:
+            if self._count == 0:
+                return None
+            return self._data[(self._count - 1) % self.capacity].copy()
+
+    def window(self, n: int = None, since_s: float = None):
+        """Return a chronologically-ordered copy of the most recent samples.
+
+        :param n: return at most this many samples (all stored if None).
+        :param since_s: return only samples taken at or after this
+            :func:`time.perf_counter` time.
+        """
+        with self._lock:
+            stored = min(self._count, self.capacity)
+            count = stored if n is None else min(n, stored)
+            start = self._count - count
+            indices = np.arange(start, self._count) % self.capacity
+            samples = self._data[indices]  # Fancy indexing copies.
+        if since_s is not None:
+            samples = samples[samples['time_s'] >= since_s]
+        return samples
+
+
+class _DeviceTelemetry:
+    """Sampling schedule and storage for a single device."""
+
+    def __init__(self, device: RunzeDevice, rate_hz: float, channels: list,
+                 history: int):
+        self.device = device
+        self.requested_rate_hz = rate_hz
+        self.rate_hz = rate_hz  # May be reduced to respect the bus budget.
+        self.channels = channels
+        self.buffer = RingBuffer(history, channels)
+        self.next_due_s = perf_counter()
+
+    @property
+    def period_s(self):
+        return 1.0 / self.rate_hz
+
+
+class TelemetryPoller:
+    """Samples device positions and statuses in a background thread.
+
+    Polls always yield to control commands (see :class:`~runze_control.bus.Bus`)
+    and the combined polling load on each bus is capped at
+    `max_bus_utilization` of the bus's wire capacity, computed from the baud
+    rate and the size of a query plus its reply. Samples land in a
+    :class:`RingBuffer` per device, so consumers can read the latest state or
+    a window of history without touching the bus.
+
+    Devices with an outstanding (unwaited) command are not polled until their
+    reply has been retrieved.
+    """
+
+    DEFAULT_RATE_HZ = 10.0
+    DEFAULT_HISTORY = 1000  # Samples kept per device.
+    DEFAULT_MAX_BUS_UTILIZATION = 0.5  # Fraction of wire time polls may use.
+
+    def __init__(self, rate_hz: float = DEFAULT_RATE_HZ,
+                 history: int = DEFAULT_HISTORY,
+                 max_bus_utilization: float = DEFAULT_MAX_BUS_UTILIZATION):
+        if not (0 < max_bus_utilization <= 1):
+            raise ValueError("Max bus utilization must be in range (0 - 1].")
+        self.rate_hz = rate_hz
+        self.history = history
+        self.max_bus_utilization = max_bus_utilization
+        self._entries = {}  # keyed by device.
+        self._bus_next_poll_s = {}  # Earliest next poll time per bus.
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_device(self, device: RunzeDevice, rate_hz: float = None,
+                   channels: list = None):
+        """Sample `device` at `rate_hz` (or the poller default).
+
+        :param channels: names from :data:`CHANNELS` to sample. Defaults to
+            every channel the device supports.
+        """
+        if channels is None:
+            channels = [name for name, method in CHANNELS.items()
+                        if hasattr(device, method)]
+        for name in channels:
+            if not hasattr(device, CHANNELS[name]):
+                raise ValueError(f"{device.__class__.__name__} does not "
+                                 f"support telemetry channel '{name}'.")
+        rate_hz = self.rate_hz if rate_hz is None else rate_hz
+        if rate_hz <= 0:
+            raise ValueError("Sampling rate must be positive.")
+        with self._lock:
+            self._entries[device] = _DeviceTelemetry(device, rate_hz, channels,
+                                                     self.history)
+            self._apply_bus_budget(device.bus)
+        self._wake_event.set()
+
+    def remove_device(self, device: RunzeDevice):
+        with self._lock:
+            del self._entries[device]
+            self._apply_bus_budget(device.bus)
+
+    def latest(self, device: RunzeDevice):
+        """Return the latest sample for `device` as a dict or None."""
+        sample = self._entries[device].buffer.latest()
+        if sample is None:
+            return None
+        return {name: sample[name].item() for name in sample.dtype.names}
+
+    def history_window(self, device: RunzeDevice, n: int = None,
+                       since_s: float = None):
+        """Return a structured array of recent samples for `device`."""
+        return self._entries[device].buffer.window(n=n, since_s=since_s)
+
+    def effective_rate_hz(self, device: RunzeDevice):
+        """Return the sampling rate actually scheduled for `device`."""
+        return self._entries[device].rate_hz
+
+    def bus_utilization(self, bus: Bus):
+        """Return the fraction of wire time scheduled for polls on `bus`."""
+        return sum(e.rate_hz * len(e.channels) * bus.query_time_s()
+                   for e in self._entries.values() if e.device.bus is bus)
+
+    def _apply_bus_budget(self, bus: Bus):
+        """Reduce the rates of devices on `bus` if their requested rates would
+        exceed the bus budget.
+
+        The budget is shared max-min fairly: devices asking for less than an
+        equal share get their requested rate and the remainder is split among
+        the rest.
+        """
+        entries = [e for e in self._entries.values() if e.device.bus is bus]
+        cost = {e: len(e.channels) * bus.query_time_s() for e in entries}
+        demand = sum(e.requested_rate_hz * cost[e] for e in entries)
+        if demand > self.max_bus_utilization:
+            logger.warning(f"Requested telemetry rates on {bus.com_port} need "
+                           f"{demand*100:.1f}% of the bus. Reducing them to "
+                           f"fit {self.max_bus_utilization*100:.1f}%.")
+        budget = self.max_bus_utilization
+        remaining = sorted(entries, key=lambda e: e.requested_rate_hz * cost[e])
+        while remaining:
+            share = budget / len(remaining)
+            e = remaining.pop(0)
+            e.rate_hz = min(e.requested_rate_hz, share / cost[e])
+            budget -= e.rate_hz * cost[e]
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=self.__class__.__name__)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._wake_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            with self._lock:
+                entries = list(self._entries.values())
+            if not entries:
+                self._wake_event.wait()
+                self._wake_event.clear()
+                continue
+            entry = min(entries, key=lambda e: e.next_due_s)
+            bus = entry.device.bus
+            due_s = max(entry.next_due_s, self._bus_next_poll_s.get(bus, 0))
+            delay_s = due_s - perf_counter()
+            if delay_s > 0:
+                self._wake_event.wait(delay_s)
+                self._wake_event.clear()
+                continue  # Re-evaluate; a new device may be due sooner.
+            if not bus.try_acquire_poll():
+                # Yield to control traffic; try again one query-time later.
+                entry.next_due_s = perf_counter() + bus.query_time_s()
+                continue
+            try:
+                self._sample(entry)
+            finally:
+                bus.release_poll()
+
+    def _sample(self, entry: _DeviceTelemetry):
+        bus = entry.device.bus
+        start_s = perf_counter()
+        try:
+            values = {name: getattr(entry.device, CHANNELS[name])()
+                      for name in entry.channels}
+        except Exception as e:
+            logger.error(f"Telemetry poll of {entry.device.log.name} failed: {e}")
+        else:
+            entry.buffer.append(start_s, **values)
+        end_s = perf_counter()
+        # Cap actual bus usage too: idle the bus proportionally to how long
+        # this poll took (which includes device latency, not just wire time).
+        elapsed_s = end_s - start_s
+        self._bus_next_poll_s[bus] = \
+            end_s + elapsed_s * (1.0/self.max_bus_utilization - 1.0)
+        entry.next_due_s += entry.period_s
+        if entry.next_due_s < end_s:  # Skip samples we can no longer make.
+            entry.next_due_s = end_s + entry.period_s
@@ -0,0 +1,262 @@
+"""Plan and run liquid transfers larger than one syringe stroke with a
+multichannel syringe pump (SY01B)."""
+from dataclasses import dataclass, field
+from math import ceil
+from runze_control.multichannel_syringe_pump import MultiChannelSyringePump
+from time import perf_counter
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PumpTiming:
+    """Timing model used for transfer time estimates."""
+    steps_per_s_per_rpm: float  # Plunger speed per motor rpm.
+    port_switch_s: float  # Valve rotation between adjacent ports.
+    command_s: float = 0  # Wire time of a command and its reply.
+
+    @classmethod
+    def measure(cls, pump: MultiChannelSyringePump, port: int):
+        """Time one full plunger stroke (in and out through `port`) and one
+        adjacent valve switch.
+
+        .. Warning::
+           This moves a full syringe of liquid in and out through `port`.
+
+        """
+        pump.move_valve_to_position(port)
+        pump.move_absolute_in_steps(0)
+        speed_percent = pump.syringe_speed_percent or pump.DEFAULT_SPEED_PERCENT
+        pump.set_speed_percent(speed_percent)
+        rpm = round(speed_percent * pump.max_speed_rpm / 100.0)
+        command_s = pump.bus.query_time_s()
+        start_s = perf_counter()
+        pump.move_absolute_in_steps(pump.max_position_steps)
+        stroke_s = perf_counter() - start_s - command_s
+        pump.move_absolute_in_steps(0)
+        neighbor = port % pump.position_count + 1
+        start_s = perf_counter()
+        pump.move_valve_to_position(neighbor)
+        port_switch_s = perf_counter() - start_s - command_s
+        pump.move_valve_to_position(port)
+        return cls(steps_per_s_per_rpm=pump.max_position_steps / (stroke_s * rpm),
+                   port_switch_s=port_switch_s, command_s=command_s)
+
+
+@dataclass
+class TransferStep:
+    """One command of a transfer plan."""
+    action: str  # "valve", "speed", or "plunger".
+    value: float  # Port, speed [%], or absolute plunger position [steps].
+    estimated_s: float = 0
+    volume_ul: float = 0  # Volume moved by a plunger step (+: aspirated).
+    transitions: int = 0  # Valve rotation of a valve step [ports].
+
+
+@dataclass
+class TransferPlan:
+    """Sequence of commands that carries out a transfer. See
+    :class:`TransferPlanner`."""
+    steps: list = field(default_factory=list)  # TransferStep list.
+    strokes: int = 0
+
+    @property
+    def estimated_s(self):
+        return sum(step.estimated_s for step in self.steps)
+
+    @property
+    def valve_moves(self):
+        return sum(step.action == "valve" for step in self.steps)
+
+    @property
+    def valve_transitions(self):
+        """Total valve rotation in ports."""
+        return sum(step.transitions for step in self.steps)
+
+    def execute(self, pump: MultiChannelSyringePump):
+        """Run the plan on the pump it was planned for. Return the elapsed
+        time."""
+        start_s = perf_counter()
+        for step in self.steps:
+            if step.action == "valve":
+                pump.move_valve_to_position(step.value)
+            elif step.action == "speed":
+                pump.set_speed_percent(step.value)
+            else:
+                pump.move_absolute_in_steps(step.value)
+        elapsed_s = perf_counter() - start_s
+        logger.debug(f"Transfer took {elapsed_s:.2f}[s] (estimated: "
+                     f"{self.estimated_s:.2f}[s]).")
+        return elapsed_s
+
+
+class TransferPlanner:
+    """Plans transfers of any volume between the ports of a multichannel
+    syringe pump.
+
+    Volumes are split into the fewest syringe strokes, port visits within a
+    stroke are ordered to minimize valve rotation (the valve always takes the
+    shortest way between two ports), and every leg runs at the highest speed
+    allowed for it.
+    """
+
+    def __init__(self, pump: MultiChannelSyringePump, timing: PumpTiming,
+                 max_aspirate_speed_percent: float = 100.0,
+                 max_dispense_speed_percent: float = 100.0,
+                 port_speed_limits: dict = None):
+        """Init.
+
+        :param pump: a multichannel syringe pump with a known syringe volume
+            and port count.
+        :param timing: pump timing model (see :meth:`PumpTiming.measure`).
+        :param port_speed_limits: dict mapping ports to the maximum speed [%]
+            of any leg through that port (i.e: for narrow tubing).
+        """
+        if pump.syringe_volume_ul is None or pump.position_count is None:
+            raise ValueError("Pump must specify its syringe volume and port "
+                             "count.")
+        self.pump = pump
+        self.timing = timing
+        self.max_aspirate_speed_percent = max_aspirate_speed_percent
+        self.max_dispense_speed_percent = max_dispense_speed_percent
+        self.port_speed_limits = port_speed_limits or {}
+
+    @property
+    def stroke_ul(self):
+        return float(self.pump.volume_converter.calibration.max_volume_ul)
+
+    def rotation(self, start: int, end: int):
+        """Valve transitions between two ports (shortest way)."""
+        n = self.pump.position_count
+        return min((end - start) % n, (start - end) % n)
+
+    def _order_ports(self, start: int, ports: list, end: int = None):
+        """Order port visits from `start` (returning to `end`, if specified)
+        with the least valve rotation.
+
+        On a ring, an optimal tour goes one way to some port, then the other
+        way to the rest, so only those candidates are compared.
+        """
+        n = self.pump.position_count
+        ahead = sorted(set(ports), key=lambda p: (p - start) % n)
+        candidates = []
+        for k in range(len(ahead) + 1):
+            clockwise = ahead[:k]
+            counterclockwise = ahead[k:][::-1]
+            candidates += [clockwise + counterclockwise,
+                           counterclockwise + clockwise]
+
+        def cost(order: list):
+            stops = [start] + order + ([end] if end is not None else [])
+            return sum(self.rotation(a, b) for a, b in zip(stops, stops[1:]))
+
+        return min(candidates, key=cost)
+
+    def _speed(self, limit_percent: float, port: int):
+        return min(limit_percent, self.port_speed_limits.get(port, 100.0))
+
+    def plan_distribution(self, source_port: int, destinations: dict,
+                          start_port: int = None):
+        """Plan moving liquid from one source port to one or more destination
+        ports.
+
+        Each stroke aspirates everything it will deliver at once, then visits
+        its destination ports in turn.
+
+        :param destinations: dict mapping destination ports to volumes [uL].
+        :param start_port: current valve port. Defaults to the source port.
+        :return: a :class:`TransferPlan`.
+        """
+        n = self.pump.position_count
+        for port in [source_port, *destinations]:
+            if not (1 <= port <= n):
+                raise ValueError(f"Port ({port}) must be between 1 and {n}.")
+        if any(volume <= 0 for volume in destinations.values()):
+            raise ValueError("Destination volumes must be positive.")
+        if self.pump.driver_steps != 0:
+            raise ValueError("Syringe must be empty before a transfer.")
+        # Assign deliveries to strokes in (overall) visiting order. A
+        # destination may be split across two strokes.
+        total_ul = sum(destinations.values())
+        stroke_count = ceil(total_ul / self.stroke_ul - 1e-9)
+        order = self._order_ports(source_port, list(destinations),
+                                  source_port if stroke_count > 1 else None)
+        strokes = [[]]
+        room_ul = self.stroke_ul
+        for port in order:
+            remaining_ul = destinations[port]
+            while remaining_ul > 1e-9:
+                if room_ul <= 1e-9:
+                    strokes.append([])
+                    room_ul = self.stroke_ul
+                volume_ul = min(remaining_ul, room_ul)
+                strokes[-1].append((port, volume_ul))
+                room_ul -= volume_ul
+                remaining_ul -= volume_ul
+        plan = TransferPlan(strokes=len(strokes))
+        port = source_port if start_port is None else start_port
+        speed = self.pump.syringe_speed_percent
+        calibration = self.pump.volume_converter.calibration
+        position = self.pump.driver_steps
+        rpm_per_percent = self.pump.max_speed_rpm / 100.0
+
+        def add_valve(target: int):
+            nonlocal port
+            if target == port:
+                return
+            transitions = self.rotation(port, target)
+            plan.steps.append(TransferStep(
+                "valve", target, self.timing.command_s
+                + transitions * self.timing.port_switch_s,
+                transitions=transitions))
+            port = target
+
+        def add_plunger(target: int, speed_percent: float, volume_ul: float):
+            nonlocal speed, position
+            if speed_percent != speed:
+                plan.steps.append(TransferStep("speed", speed_percent,
+                                               self.timing.command_s))
+                speed = speed_percent
+            rpm = round(speed_percent * rpm_per_percent)
+            plan.steps.append(TransferStep(
+                "plunger", target, self.timing.command_s + abs(target - position)
+                / (self.timing.steps_per_s_per_rpm * rpm), volume_ul))
+            position = target
+
+        for index, deliveries in enumerate(strokes):
+            last = (index == len(strokes) - 1)
+            ports = [p for p, _ in deliveries]
+            # Visit this stroke's ports in the best order (ending back at the
+            # source unless this is the last stroke).
+            stroke_order = self._order_ports(source_port, ports,
+                                             None if last else source_port)
+            volumes = {}
+            for p, volume_ul in deliveries:
+                volumes[p] = volumes.get(p, 0) + volume_ul
+            stroke_ul = min(sum(volumes.values()), self.stroke_ul)
+            # Plunger targets on the absolute volume scale so rounding never
+            # accumulates.
+            add_valve(source_port)
+            add_plunger(round(float(calibration.ul_to_steps(stroke_ul))),
+                        self._speed(self.max_aspirate_speed_percent,
+                                    source_port), stroke_ul)
+            syringe_ul = stroke_ul
+            for p in stroke_order:
+                syringe_ul = max(syringe_ul - volumes[p], 0)
+                add_valve(p)
+                add_plunger(round(float(calibration.ul_to_steps(syringe_ul))),
+                            self._speed(self.max_dispense_speed_percent, p),
+                            -volumes[p])
+        logger.debug(f"Planned {total_ul}[uL] from port {source_port} to "
+                     f"{len(destinations)} port(s): {plan.strokes} stroke(s), "
+                     f"{plan.valve_moves} valve move(s), ~{plan.estimated_s:.1f}"
+                     "[s].")
+        return plan
+
+    def plan_transfer(self, source_port: int, destination_port: int,
+                      volume_ul: float, start_port: int = None):
+        """Plan moving `volume_ul` from one port to another."""
+        return self.plan_distribution(source_port,
+                                      {destination_port: volume_ul},
+                                      start_port=start_port)
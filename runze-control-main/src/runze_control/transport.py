@@ -0,0 +1,371 @@
+"""Open the port a device talks through: a local serial port, a serial server
+on the network (``socket://`` or ``rfc2217://``), or an in-process loopback
+(``loop://``)."""
+from runze_control import runze_protocol
+from serial import SerialException, serial_for_url
+from time import perf_counter, sleep
+import logging
+import socket
+import threading
+
+logger = logging.getLogger(__name__)
+
+# URL schemes that are opened as is. Others (local serial ports and other
+# pyserial URLs) reconnect by themselves.
+DIRECT_SCHEMES = ('socket', 'rfc2217', 'loop')
+
+
+def open_transport(url: str, baudrate: int):
+    """Open a pyserial-compatible port for one device. Reads never block.
+
+    Every device on an endpoint shares one connection to it, which routes
+    each reply to the device it comes from (see :class:`SharedConnection`).
+    Local serial ports (i.e: "COM3", "/dev/ttyUSB0") and other pyserial URLs
+    (i.e: ``sim://``) reconnect by themselves (see
+    :class:`ReconnectingSerial`).
+    """
+    return SharedConnection.open(url, baudrate)
+
+
+def usb_serial_number(port: str):
+    """Return the USB serial number of a local port's adapter or None."""
+    if "://" in port:
+        return None
+    try:
+        from serial.tools.list_ports import comports
+    except ImportError:
+        return None
+    for info in comports():
+        if info.device == port and info.serial_number:
+            return info.serial_number
+    return None
+
+
+def find_usb_port(serial_number: str):
+    """Return the local port of the USB adapter with this serial number (its
+    name may have changed since it was plugged in) or None."""
+    from serial.tools.list_ports import comports
+    for info in comports():
+        if info.serial_number == serial_number:
+            return info.device
+    return None
+
+
+class ReconnectingSerial:
+    """A device's port that survives its USB-serial adapter dropping out.
+
+    When a read or write fails, the port is reopened (waiting up to
+    `RECONNECT_TIMEOUT_S` for the adapter to re-enumerate) at the same baud
+    rate and the call is retried. The adapter is found by its USB serial
+    number, so it may come back under another name (i.e: /dev/ttyUSB1 instead
+    of /dev/ttyUSB0). Afterwards, `on_reconnect` (if set) is called so the
+    device can resynchronize its state.
+    """
+
+    RECONNECT_TIMEOUT_S = 10.0
+    RETRY_INTERVAL_S = 0.1  # Time between attempts to reopen the port.
+
+    def __init__(self, url: str, baudrate: int, timeout: float = 0):
+        self.url = url
+        self.serial_number = usb_serial_number(url)
+        self.timeout = timeout
+        self.reconnects = 0  # Number of successful reconnects.
+        self.downtime_s = 0  # Total time spent reconnecting.
+        self.on_reconnect = None
+        self.is_open = True
+        self._baudrate = baudrate
+        self._lock = threading.Lock()
+        self.ser = serial_for_url(url, baudrate, timeout=timeout)
+
+    @property
+    def baudrate(self):
+        return self._baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate: int):
+        self._baudrate = baudrate
+        self._call(lambda ser: setattr(ser, 'baudrate', baudrate))
+
+    @property
+    def in_waiting(self):
+        return self._call(lambda ser: ser.in_waiting)
+
+    def write(self, data: bytes):
+        return self._call(lambda ser: ser.write(data))
+
+    def flush(self):
+        return self._call(lambda ser: ser.flush())
+
+    def read(self, size: int = 1):
+        return self._call(lambda ser: ser.read(size))
+
+    def read_until(self, expected: bytes = b'\n', size: int = None):
+        return self._call(lambda ser: ser.read_until(expected, size))
+
+    def reset_input_buffer(self):
+        self._call(lambda ser: ser.reset_input_buffer())
+
+    def reset_output_buffer(self):
+        self._call(lambda ser: ser.reset_output_buffer())
+
+    def close(self):
+        self.is_open = False
+        self.ser.close()
+
+    def _call(self, func):
+        """Run `func(ser)`, reconnecting and retrying once if it fails."""
+        ser = self.ser
+        try:
+            return func(ser)
+        except (SerialException, OSError) as e:
+            if not self.is_open:
+                raise
+            self._reconnect(ser, e)
+        return func(self.ser)
+
+    def _open(self):
+        url = self.url
+        if self.serial_number is not None:
+            url = find_usb_port(self.serial_number)
+            if url is None:
+                raise SerialException(f"USB adapter {self.serial_number} is "
+                                      "not connected.")
+        return serial_for_url(url, self._baudrate, timeout=self.timeout)
+
+    def _reconnect(self, failed_ser, error: Exception):
+        with self._lock:
+            if self.ser is not failed_ser:
+                return  # Another thread already reconnected.
+            logger.warning(f"Lost connection to {self.url} ({error}). "
+                           "Reconnecting.")
+            try:
+                failed_ser.close()
+            except (SerialException, OSError):
+                pass
+            start_s = perf_counter()
+            while True:
+                try:
+                    self.ser = self._open()
+                    break
+                except (SerialException, OSError) as e:
+                    if perf_counter() - start_s >= self.RECONNECT_TIMEOUT_S:
+                        raise SerialException(
+                            f"Could not reconnect to {self.url} within "
+                            f"{self.RECONNECT_TIMEOUT_S}[s]: {e}") from error
+                sleep(self.RETRY_INTERVAL_S)
+            if self.serial_number is not None:
+                self.url = self.ser.port
+            elapsed_s = perf_counter() - start_s
+            self.reconnects += 1
+            self.downtime_s += elapsed_s
+            logger.warning(f"Reconnected to {self.url} after "
+                           f"{elapsed_s:.2f}[s].")
+        if self.on_reconnect is not None:
+            self.on_reconnect()
+
+
+class SharedConnection:
+    """One connection to an endpoint, shared by every device that opens it.
+
+    Devices on one bus hear each other's replies, so they share one
+    connection instead of opening one each (a serial server often accepts
+    only one client anyway). Received replies are split into frames and
+    routed by their address byte, so a device only ever reads its own
+    replies. TCP connections have Nagle's algorithm disabled, so small frames
+    are sent immediately instead of waiting for the previous frame's
+    acknowledgement.
+    """
+
+    READ_SIZE = 4096  # Bytes to ask for when routing received replies.
+
+    _connections = {}
+    _connections_lock = threading.Lock()
+
+    def __init__(self, url: str, baudrate: int):
+        self.url = url
+        scheme = url.split("://", 1)[0].lower() if "://" in url else None
+        if scheme in DIRECT_SCHEMES:
+            self.ser = serial_for_url(url, baudrate, timeout=0)
+        else:
+            self.ser = ReconnectingSerial(url, baudrate, timeout=0)
+            self.ser.on_reconnect = self._on_reconnect
+        self.send_lock = threading.Lock()
+        self.read_lock = threading.RLock()  # Reconnects route too.
+        self.ports = []  # Open SharedPorts.
+        self._rx = bytearray()  # Received bytes not yet routed.
+        self._inboxes = {}  # address -> bytearray of its reply frames.
+        sock = getattr(self.ser, '_socket', None)
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    @classmethod
+    def open(cls, url: str, baudrate: int):
+        """Return a new :class:`SharedPort` on the (possibly new) connection
+        to `url`."""
+        with cls._connections_lock:
+            connection = cls._connections.get(url)
+            if connection is None:
+                connection = cls(url, baudrate)
+                cls._connections[url] = connection
+                logger.debug(f"Connected to {url}.")
+            elif connection.ser.baudrate != baudrate:
+                # Changing it would cut off every device already on the bus.
+                raise ValueError(f"{url} is already open at "
+                                 f"{connection.ser.baudrate}[bps]. Cannot "
+                                 f"also open it at {baudrate}[bps].")
+            port = SharedPort(connection)
+            connection.ports.append(port)
+            return port
+
+    @classmethod
+    def open_baudrate(cls, url: str):
+        """Return the baud rate of the open connection to `url` or None if
+        there is none."""
+        with cls._connections_lock:
+            connection = cls._connections.get(url)
+            return None if connection is None else connection.ser.baudrate
+
+    @classmethod
+    def all(cls):
+        """Return a list of all open connections."""
+        with cls._connections_lock:
+            return list(cls._connections.values())
+
+    def release(self, port):
+        """Close the connection once its last port is closed."""
+        with SharedConnection._connections_lock:
+            self.ports.remove(port)
+            if self.ports:
+                return
+            del SharedConnection._connections[self.url]
+        self.ser.close()
+        logger.debug(f"Disconnected from {self.url}.")
+
+    def send(self, data: bytes):
+        with self.send_lock:
+            self.ser.write(data)
+            self.ser.flush()
+
+    def read(self, address: int, size: int):
+        """Read up to `size` bytes of the replies from `address` (from any
+        address if None). Never blocks."""
+        with self.read_lock:
+            self._route()
+            if address is None:
+                inbox = next((i for i in self._inboxes.values() if i), None)
+            else:
+                inbox = self._inboxes.get(address)
+            if not inbox:
+                return bytes()
+            data = bytes(inbox[:size])
+            del inbox[:size]
+            return data
+
+    def in_waiting(self, address: int):
+        with self.read_lock:
+            self._route()
+            if address is None:
+                return sum(len(i) for i in self._inboxes.values())
+            return len(self._inboxes.get(address, b''))
+
+    def discard(self, address: int):
+        """Drop the received replies from `address` (from any address if
+        None)."""
+        with self.read_lock:
+            self._route()
+            for inbox_address, inbox in self._inboxes.items():
+                if address is None or inbox_address == address:
+                    inbox.clear()
+
+    def _route(self):
+        """Move complete reply frames from the connection into the inbox of
+        the address they come from. Call with `read_lock` held."""
+        while True:
+            # Some ports (i.e: socket://) only tell whether anything is
+            # waiting, not how much. Reads don't block, so ask for plenty.
+            waiting = self.ser.in_waiting
+            if not waiting:
+                break
+            self._rx += self.ser.read(max(waiting, self.READ_SIZE))
+        rx = self._rx
+        frame_len = runze_protocol.REPLY_NUM_BYTES
+        while len(rx) >= frame_len:
+            if rx[0] != runze_protocol.PacketFields.STX \
+                    or rx[5] != runze_protocol.PacketFields.ETX:
+                del rx[0]  # Resynchronize on the next frame start.
+                continue
+            self._inboxes.setdefault(rx[1], bytearray()).extend(
+                rx[:frame_len])
+            del rx[:frame_len]
+
+    def _on_reconnect(self):
+        with self.read_lock:
+            self._rx.clear()  # May end in a partial frame.
+        for port in list(self.ports):
+            if port.on_reconnect is not None:
+                port.on_reconnect()
+
+
+class SharedPort:
+    """A device's handle on a :class:`SharedConnection`. Supports the subset
+    of the pyserial API that devices use.
+
+    Reads only return replies from `address` (set it once the device address
+    is known; while None, replies from any address are read).
+    Writes are coalesced: frames written back-to-back go out in one network
+    packet when the port is flushed (:meth:`Bus.write` always flushes).
+    `on_reconnect` (if set) is called once a dropped connection is back (see
+    :class:`ReconnectingSerial`).
+    """
+
+    def __init__(self, connection: SharedConnection):
+        self.connection = connection
+        self.address = None
+        self.on_reconnect = None
+        self.is_open = True
+        self._tx = bytearray()
+
+    @property
+    def baudrate(self):
+        return self.connection.ser.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate: int):
+        self.connection.ser.baudrate = baudrate
+
+    @property
+    def in_waiting(self):
+        return self.connection.in_waiting(self.address)
+
+    def write(self, data: bytes):
+        if not self.is_open:
+            raise SerialException("Port is closed.")
+        self._tx += data
+        return len(data)
+
+    def flush(self):
+        if self._tx:
+            data = bytes(self._tx)
+            self._tx.clear()
+            self.connection.send(data)
+
+    def read(self, size: int = 1):
+        if not self.is_open:
+            raise SerialException("Port is closed.")
+        return self.connection.read(self.address, size)
+
+    def read_until(self, expected: bytes = b'\n', size: int = None):
+        if not self.is_open:
+            raise SerialException("Port is closed.")
+        return self.connection.ser.read_until(expected, size)
+
+    def reset_input_buffer(self):
+        self.connection.discard(self.address)
+
+    def reset_output_buffer(self):
+        self._tx.clear()
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.connection.release(self)
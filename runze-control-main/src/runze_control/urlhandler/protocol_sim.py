@@ -0,0 +1,2 @@
+"""pyserial handler for ``sim://<name>`` urls (see runze_control.simulator)."""
+from runze_control.simulator import SimulatedSerial as Serial
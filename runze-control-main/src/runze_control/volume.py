@@ -0,0 +1,147 @@
+"""Volume <-> plunger step conversion with per-syringe calibration."""
+from bisect import bisect_right
+from numbers import Real
+from pathlib import Path
+from typing import Union
+import json
+
+
+def _interp(x: float, xp: tuple, fp: tuple):
+    """Piecewise-linear interpolation of a single value (as numpy.interp)."""
+    if x <= xp[0]:
+        return fp[0]
+    if x >= xp[-1]:
+        return fp[-1]
+    i = bisect_right(xp, x)
+    return fp[i-1] + (fp[i] - fp[i-1]) * (x - xp[i-1]) / (xp[i] - xp[i-1])
+
+
+class Calibration:
+    """Piecewise-linear map between absolute syringe volume [uL] and absolute
+    plunger position [steps], built from measured (volume, steps) points.
+
+    Conversions accept scalars (converted in plain Python) or sequences and
+    NumPy arrays (vectorized with NumPy, which is only imported for these).
+    """
+
+    def __init__(self, volumes_ul, steps):
+        try:
+            self.volumes_ul = tuple(float(v) for v in volumes_ul)
+            self.steps = tuple(float(s) for s in steps)
+        except TypeError:
+            raise ValueError("Calibration points must be two sequences of "
+                             "numbers.")
+        if len(self.volumes_ul) != len(self.steps) or len(self.steps) < 2:
+            raise ValueError("Calibration needs at least two (volume, steps) "
+                             "points of matching length.")
+        if any(b <= a for a, b in zip(self.volumes_ul, self.volumes_ul[1:])) \
+                or any(b <= a for a, b in zip(self.steps, self.steps[1:])):
+            raise ValueError("Calibration volumes and steps must both be "
+                             "strictly increasing.")
+
+    @classmethod
+    def linear(cls, syringe_volume_ul: float, max_position_steps: int):
+        """Nominal calibration: full stroke equals the syringe volume."""
+        return cls([0, syringe_volume_ul], [0, max_position_steps])
+
+    @property
+    def max_volume_ul(self):
+        return self.volumes_ul[-1]
+
+    def ul_to_steps(self, microliters):
+        """Convert absolute volume(s) to (fractional) absolute steps."""
+        low_ul, high_ul = self.volumes_ul[0], self.volumes_ul[-1]
+        if isinstance(microliters, Real):
+            out_of_range = not low_ul <= microliters <= high_ul
+        else:
+            import numpy as np
+            microliters = np.asarray(microliters, dtype=float)
+            out_of_range = np.any(microliters < low_ul) \
+                or np.any(microliters > high_ul)
+        if out_of_range:
+            raise ValueError(f"Volume is out of the calibrated range "
+                             f"[{low_ul} - {high_ul}] [uL].")
+        if isinstance(microliters, Real):
+            return _interp(float(microliters), self.volumes_ul, self.steps)
+        return np.interp(microliters, self.volumes_ul, self.steps)
+
+    def steps_to_ul(self, steps):
+        """Convert absolute step position(s) to absolute volume(s)."""
+        if isinstance(steps, Real):
+            return _interp(float(steps), self.steps, self.volumes_ul)
+        import numpy as np
+        return np.interp(np.asarray(steps, dtype=float), self.steps,
+                         self.volumes_ul)
+
+    def plan_steps(self, volume_deltas_ul, start_ul: float = 0):
+        """Convert a sequence of relative volume moves into relative step moves
+        (positive: aspirate, negative: dispense).
+
+        Moves are rounded on the cumulative target position, so the rounding
+        residual of each move is carried into the next one and the total never
+        drifts by more than half a step.
+
+        :return: (int64 array of relative steps, final fractional residual in
+            steps)
+        """
+        import numpy as np
+        targets_ul = start_ul + np.cumsum(volume_deltas_ul, dtype=float)
+        exact_steps = self.ul_to_steps(np.concatenate(([start_ul], targets_ul)))
+        rounded = np.rint(exact_steps).astype(np.int64)
+        return np.diff(rounded), float(exact_steps[-1] - rounded[-1])
+
+    def to_dict(self):
+        return {'volumes_ul': list(self.volumes_ul), 'steps': list(self.steps)}
+
+    def save(self, path: Union[str, Path]):
+        """Save as JSON, or as two-column (uL, steps) CSV if the path ends in
+        .csv."""
+        path = Path(path)
+        if path.suffix.lower() == ".csv":
+            import numpy as np
+            np.savetxt(path, np.column_stack((self.volumes_ul, self.steps)),
+                       delimiter=",", header="volume_ul,steps", comments="")
+        else:
+            path.write_text(json.dumps(self.to_dict(), indent=2))
+
+    @classmethod
+    def load(cls, path: Union[str, Path]):
+        """Load from a file written by :meth:`save` (JSON or CSV)."""
+        path = Path(path)
+        if path.suffix.lower() == ".csv":
+            import numpy as np
+            table = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+            return cls(table[:, 0], table[:, 1])
+        data = json.loads(path.read_text())
+        return cls(data['volumes_ul'], data['steps'])
+
+
+class VolumeConverter:
+    """Converts relative volume moves of one syringe into relative step moves,
+    tracking the exact (fractional) plunger position so rounding residuals
+    carry forward from one move to the next."""
+
+    def __init__(self, calibration: Calibration):
+        self.calibration = calibration
+        self.position_steps = 0.0  # Exact commanded position.
+
+    def sync(self, position_steps: int):
+        """Adopt the (integer) plunger position reported by the device unless
+        it matches the exact position we're already tracking."""
+        if round(self.position_steps) != position_steps:
+            self.position_steps = float(position_steps)
+
+    def relative_steps(self, microliters: float, position_steps: int):
+        """Return the integer steps for a relative move of `microliters`
+        (positive: aspirate, negative: dispense) from `position_steps`."""
+        self.sync(position_steps)
+        start_ul = self.calibration.steps_to_ul(self.position_steps)
+        target = float(self.calibration.ul_to_steps(start_ul + microliters))
+        steps = round(target) - position_steps
+        self.position_steps = target
+        return steps
+
+    @property
+    def residual_steps(self):
+        """Fractional steps commanded but not yet moved."""
+        return self.position_steps - round(self.position_steps)